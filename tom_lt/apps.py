@@ -0,0 +1,6 @@
+from django.apps import AppConfig
+
+
+class TomLtConfig(AppConfig):
+    name = 'tom_lt'
+    default_auto_field = 'django.db.models.AutoField'
@@ -0,0 +1,210 @@
+import asyncio
+import logging
+import time
+import weakref
+from xml.sax.saxutils import escape
+
+import httpx
+from asgiref.sync import sync_to_async
+from lxml import etree
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from tom_lt.breaker import DEFAULT_RETRY_BACKOFF, get_breaker, retry_delay
+from tom_lt.client import DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, node_agent_url
+from tom_lt.metrics import count, span
+from tom_lt.recording import get_recorder, get_replayer, transport_mode
+from tom_lt.response import parse_response
+
+logger = logging.getLogger(__name__)
+
+SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+SOAP_ENC_NS = 'http://schemas.xmlsoap.org/soap/encoding/'
+WSDL_NS = 'http://schemas.xmlsoap.org/wsdl/'
+WSDL_SOAP_NS = 'http://schemas.xmlsoap.org/wsdl/soap/'
+
+ENVELOPE = ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<SOAP-ENV:Envelope xmlns:SOAP-ENV="' + SOAP_ENV_NS + '"'
+            ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+            ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+            ' SOAP-ENV:encodingStyle="' + SOAP_ENC_NS + '">'
+            '<SOAP-ENV:Body><ns1:handle_rtml xmlns:ns1="{namespace}">'
+            '<document xsi:type="xsd:string">{document}</document>'
+            '</ns1:handle_rtml></SOAP-ENV:Body></SOAP-ENV:Envelope>')
+
+# the errors of a call that never connected to the node agent, so nothing was sent
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+_transports = {}
+
+
+class NodeAgentError(Exception):
+    """Raised when the node agent answers with an HTTP error or a SOAP fault."""
+
+
+class NodeAgentFault(NodeAgentError):
+    """Raised when the node agent answers with a SOAP fault."""
+
+
+class AsyncNodeAgentTransport:
+    """Send RTML documents to the node agent from asyncio code, without suds.
+
+    The ``handle_rtml`` SOAP envelope is built directly and posted with httpx, over HTTP or HTTPS, so a
+    single event loop can keep many inquiries and submissions in flight at once on a pool of kept-alive
+    connections (``CONNECTION_POOL_SIZE`` of them are kept between calls). The WSDL is only read once, to
+    find the service address, the operation namespace and the SOAP action.
+    """
+
+    def __init__(self, lt_settings):
+        self.wsdl_url = node_agent_url(lt_settings) + '?wsdl'
+        self.headers = {
+            'Username': lt_settings['username'],
+            'Password': lt_settings['password'],
+        }
+        self.timeout = lt_settings.get('TIMEOUT', DEFAULT_TIMEOUT)
+        self.backoff = lt_settings.get('RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF)
+        self.breaker = get_breaker(lt_settings)
+        self.lt_settings = lt_settings
+        self.transport = transport_mode(lt_settings)
+        self.pool_size = lt_settings.get('CONNECTION_POOL_SIZE', DEFAULT_POOL_SIZE)
+        self.service = None
+        # an httpx client and its connections belong to the event loop they were opened in
+        self._clients = weakref.WeakKeyDictionary()
+
+    def client(self):
+        """Return the ``httpx.AsyncClient`` of the running event loop, creating it on first use."""
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size)
+            client = self._clients[loop] = httpx.AsyncClient(headers=self.headers, timeout=None, limits=limits)
+        return client
+
+    async def aclose(self):
+        """Close the connections of the running event loop."""
+        client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+    async def handle_rtml(self, document, timeout=None, attempts=1):
+        """Send an RTML document (``str``) and return the ``RTMLResponse`` of the node agent.
+
+        ``timeout`` (seconds) bounds each exchange, defaulting to ``FACILITIES['LT']['TIMEOUT']``. A call
+        that could not connect to the node agent is made up to ``attempts`` times in all, after a jittered
+        backoff, unless the circuit breaker opens meanwhile. Any other failure is raised at once, as the node
+        agent may have accepted the document.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        for attempt in range(attempts):
+            try:
+                reply = await self._send(document, timeout)
+                break
+            except CONNECT_ERRORS as e:
+                if attempt == attempts - 1:
+                    raise
+                delay = retry_delay(attempt, self.backoff)
+                logger.warning('Retrying a call to the Liverpool Telescope in %.1f s after: %r', delay, e)
+                await asyncio.sleep(delay)
+        with span('parse_response'):
+            response = parse_response(reply)
+        count(response.mode)
+        return response
+
+    async def _send(self, document, timeout):
+        if self.transport == 'replay':
+            with span('handle_rtml'):
+                reply, delay = get_replayer(self.lt_settings).reply(document)
+                await asyncio.sleep(delay)
+            return reply
+        # the breaker state is in the Django cache, whose backend may block or be sync-only (the database cache)
+        try:
+            await sync_to_async(self.breaker.before_call)()
+            try:
+                started = time.perf_counter()
+                with span('handle_rtml'):
+                    reply = await asyncio.wait_for(self._handle_rtml(document), timeout)
+                if self.transport == 'record':
+                    get_recorder(self.lt_settings).record(document, reply, time.perf_counter() - started)
+            except NodeAgentFault:
+                # the node agent answered
+                await sync_to_async(self.breaker.success)()
+                raise
+            except Exception:
+                await sync_to_async(self.breaker.failure)()
+                raise
+        except Exception:
+            count('transport_error')
+            raise
+        await sync_to_async(self.breaker.success)()
+        return reply
+
+    async def _handle_rtml(self, document):
+        if self.service is None:
+            with span('wsdl_load'):
+                self.service = await self._load_service()
+        location, namespace, soap_action = self.service
+        body = ENVELOPE.format(namespace=namespace, document=escape(document)).encode('utf-8')
+        headers = {'SOAPAction': '"{0}"'.format(soap_action), 'Content-Type': 'text/xml; charset=utf-8'}
+        response = await self.client().post(location, content=body, headers=headers)
+        if response.status_code >= 400:
+            # a SOAP fault comes with a 500, anything else is not an answer from the node agent
+            fault = _fault(response.content)
+            if fault is not None:
+                raise fault
+            raise NodeAgentError('HTTP {0} from node agent'.format(response.status_code))
+        try:
+            envelope = etree.fromstring(response.content)
+        except etree.XMLSyntaxError as e:
+            raise NodeAgentError('Unreadable reply from node agent: {0}'.format(e)) from e
+        fault = _fault(envelope)
+        if fault is not None:
+            raise fault
+        document = envelope.find('{%s}Body/*/*' % SOAP_ENV_NS)
+        if document is None or not document.text:
+            raise NodeAgentError('No RTML document in the reply from node agent')
+        return document.text
+
+    async def _load_service(self):
+        response = await self.client().get(self.wsdl_url)
+        if response.status_code >= 400:
+            raise NodeAgentError('HTTP {0} fetching node agent WSDL'.format(response.status_code))
+        wsdl = etree.fromstring(response.content)
+        namespaces = {'wsdl': WSDL_NS, 'soap': WSDL_SOAP_NS}
+        location = wsdl.xpath('//wsdl:service/wsdl:port/soap:address/@location', namespaces=namespaces)[0]
+        operation = wsdl.xpath('//wsdl:binding/wsdl:operation[@name="handle_rtml"]', namespaces=namespaces)[0]
+        namespace = operation.xpath('wsdl:input/soap:body/@namespace', namespaces=namespaces)
+        soap_action = operation.xpath('soap:operation/@soapAction', namespaces=namespaces)
+        return (location, namespace[0] if namespace else wsdl.get('targetNamespace'),
+                soap_action[0] if soap_action else '')
+
+
+def _fault(reply):
+    """Return the ``NodeAgentFault`` of a SOAP envelope (an element, or bytes that may not be XML), or ``None``."""
+    if isinstance(reply, bytes):
+        try:
+            reply = etree.fromstring(reply)
+        except etree.XMLSyntaxError:
+            return None
+    fault = reply.find('.//{%s}Fault' % SOAP_ENV_NS)
+    if fault is None:
+        return None
+    return NodeAgentFault('Server raised fault: {0}'.format(fault.findtext('faultstring')))
+
+
+def get_async_transport(lt_settings):
+    """Return the (process-wide) asyncio transport for the node agent described by ``lt_settings``."""
+    key = (lt_settings['LT_HOST'], str(lt_settings['LT_PORT']),
+           lt_settings['username'], lt_settings['password'], lt_settings.get('TIMEOUT'),
+           lt_settings.get('RTML_TRANSPORT'), lt_settings.get('RECORDING_DIR'),
+           str(lt_settings.get('REPLAY_LATENCY')), lt_settings.get('CONNECTION_POOL_SIZE'))
+    transport = _transports.get(key)
+    if transport is None:
+        transport = _transports[key] = AsyncNodeAgentTransport(lt_settings)
+    return transport
+
+
+@receiver(setting_changed)
+def _facilities_changed(setting, **kwargs):
+    if setting == 'FACILITIES':
+        _transports.clear()
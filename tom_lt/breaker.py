@@ -0,0 +1,117 @@
+"""A circuit breaker around calls to the node agent, shared between processes through the Django cache.
+
+While the telescope site is down every call to the node agent waits for its timeout. After
+``BREAKER_FAILURE_THRESHOLD`` consecutive calls have failed to reach the node agent the breaker opens, and
+calls fail at once with ``NodeAgentUnavailable`` instead. Once the breaker has been open for
+``BREAKER_RESET_TIMEOUT`` seconds it is half-open: the next call, from whichever process or thread gets
+there first, is let through as a probe. If the probe reaches the node agent the breaker closes again;
+otherwise it stays open for another ``BREAKER_RESET_TIMEOUT``.
+
+A call that gets an answer from the node agent, even a SOAP fault, counts as reaching it. The state is kept
+in the ``BREAKER_CACHE`` cache (``'default'`` unless set), so all the processes of a TOM share it when that
+cache is shared, as with Memcached, Redis or the database cache.
+"""
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 60
+DEFAULT_BREAKER_CACHE = 'default'
+DEFAULT_SUBMISSION_ATTEMPTS = 3
+DEFAULT_RETRY_BACKOFF = 1.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class NodeAgentUnavailable(Exception):
+    """Raised instead of calling the node agent while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """The circuit breaker of the node agent called ``name``.
+
+    Call ``before_call`` before each call to the node agent, then ``success`` if it answered or ``failure``
+    if it could not be reached.
+    """
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT,
+                 cache_alias=DEFAULT_BREAKER_CACHE):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.cache_alias = cache_alias
+        key = 'tom_lt:breaker:' + name
+        self._failures_key = key + ':failures'
+        self._opened_key = key + ':opened'
+        self._probe_key = key + ':probe'
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.cache_alias]
+
+    def state(self):
+        """Return ``'closed'``, ``'open'`` or ``'half-open'``."""
+        opened = self.cache.get(self._opened_key)
+        if opened is None:
+            return CLOSED
+        return HALF_OPEN if time.time() - opened >= self.reset_timeout else OPEN
+
+    def before_call(self):
+        """Raise ``NodeAgentUnavailable`` unless the node agent may be called now."""
+        opened = self.cache.get(self._opened_key)
+        if opened is None:
+            return
+        wait = opened + self.reset_timeout - time.time()
+        # only one probe at a time; a probe that never reports back is given up on after reset_timeout
+        if wait > 0 or not self.cache.add(self._probe_key, True, timeout=self.reset_timeout):
+            raise NodeAgentUnavailable(
+                'The Liverpool Telescope has not been reachable for the last {0} calls; not trying again for '
+                '{1:.0f} s'.format(self.failure_threshold, max(wait, 0) or self.reset_timeout))
+        logger.info('Probing the Liverpool Telescope node agent %s', self.name)
+
+    def success(self):
+        self.cache.delete_many([self._failures_key, self._opened_key, self._probe_key])
+
+    def failure(self):
+        cache = self.cache
+        if cache.get(self._opened_key) is not None:
+            # the probe failed
+            cache.set(self._opened_key, time.time(), timeout=None)
+            cache.delete(self._probe_key)
+            return
+        cache.add(self._failures_key, 0, timeout=None)
+        try:
+            failures = cache.incr(self._failures_key)
+        except ValueError:
+            # evicted since it was added
+            cache.set(self._failures_key, 1, timeout=None)
+            failures = 1
+        if failures >= self.failure_threshold:
+            logger.warning('The Liverpool Telescope node agent %s could not be reached %s times in a row; '
+                           'failing calls for %s s', self.name, failures, self.reset_timeout)
+            cache.set(self._opened_key, time.time(), timeout=None)
+
+
+def get_breaker(lt_settings):
+    """Return the circuit breaker of the node agent described by ``lt_settings``."""
+    return CircuitBreaker(
+        '{0}:{1}'.format(lt_settings['LT_HOST'], lt_settings['LT_PORT']),
+        failure_threshold=lt_settings.get('BREAKER_FAILURE_THRESHOLD', DEFAULT_FAILURE_THRESHOLD),
+        reset_timeout=lt_settings.get('BREAKER_RESET_TIMEOUT', DEFAULT_RESET_TIMEOUT),
+        cache_alias=lt_settings.get('BREAKER_CACHE', DEFAULT_BREAKER_CACHE),
+    )
+
+
+def retry_delay(attempt, backoff=DEFAULT_RETRY_BACKOFF):
+    """Return a random delay, in seconds, before retrying a call that failed ``attempt + 1`` times.
+
+    The delay is drawn between 0 and ``backoff * 2 ** attempt`` ("full jitter"), so that processes that
+    failed together do not retry together.
+    """
+    return random.uniform(0, backoff * 2 ** attempt)
@@ -0,0 +1,96 @@
+"""The node agent's answers to validation inquiries, shared by every process of the TOM through the Django cache.
+
+Entries are keyed by the fingerprint of the payload, which ignores its uid and mode, and expire
+``VALIDATION_CACHE_TTL`` seconds after they were written. They live in the ``VALIDATION_CACHE`` cache
+(``'default'`` unless set), whose backend bounds them and evicts the least recently used first: the
+local-memory cache holds its ``MAX_ENTRIES``, Redis and Memcached as much as their memory allows.
+
+A submission or cancellation the node agent confirms changes what the proposal can still be given, so
+it bumps the proposal's generation. An entry written under an older generation is a miss, and the next
+validation of that payload sends an inquiry again.
+"""
+import hashlib
+
+from tom_lt.payload import RTMLPayload
+
+DEFAULT_VALIDATION_CACHE_TTL = 300
+DEFAULT_VALIDATION_CACHE = 'default'
+
+KEY_PREFIX = 'tom_lt:validation:'
+# the modes of the documents that change the state of a proposal once the node agent confirms them
+STATE_CHANGING_MODES = ('request', 'abort')
+
+
+def fingerprint(observation_payload):
+    """Return a hash of an RTML payload that ignores its ``uid`` and ``mode`` (see ``RTMLPayload.fingerprint``)."""
+    return RTMLPayload.of(observation_payload).fingerprint
+
+
+class ValidationCache:
+    """Remember the node agent's answer to an inquiry for ``ttl`` seconds.
+
+    Entries hold the response mode (``offer`` or ``reject``) and the validation errors reported for it.
+    ``hits`` and ``misses`` count the lookups of every process since the cache was last cleared.
+    """
+
+    def __init__(self, ttl=DEFAULT_VALIDATION_CACHE_TTL, cache_alias=DEFAULT_VALIDATION_CACHE):
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+
+    @property
+    def cache(self):
+        from django.core.cache import caches
+        return caches[self.cache_alias]
+
+    def get(self, observation_payload):
+        """Return the cached ``{'mode', 'errors'}`` outcome for a payload, or ``None``."""
+        observation_payload = RTMLPayload.of(observation_payload)
+        key = KEY_PREFIX + observation_payload.fingerprint
+        generation_key = self._generation_key(observation_payload.project)
+        found = self.cache.get_many([key, generation_key, KEY_PREFIX + 'epoch'])
+        entry = found.get(key)
+        if entry is None or entry[0] != (found.get(KEY_PREFIX + 'epoch', 0), found.get(generation_key, 0)):
+            self._increment(KEY_PREFIX + 'misses')
+            return None
+        self._increment(KEY_PREFIX + 'hits')
+        return entry[1]
+
+    def set(self, observation_payload, mode, errors):
+        observation_payload = RTMLPayload.of(observation_payload)
+        generation_key = self._generation_key(observation_payload.project)
+        found = self.cache.get_many([generation_key, KEY_PREFIX + 'epoch'])
+        generation = (found.get(KEY_PREFIX + 'epoch', 0), found.get(generation_key, 0))
+        self.cache.set(KEY_PREFIX + observation_payload.fingerprint, (generation, {'mode': mode, 'errors': errors}),
+                       timeout=self.ttl)
+
+    def invalidate(self, project):
+        """Stop reusing the answers to inquiries for ``project``, whose state has changed."""
+        self._increment(self._generation_key(project))
+
+    def confirmed(self, document):
+        """Invalidate the proposal of an RTML ``document`` the node agent has just confirmed, if it changes it."""
+        document = RTMLPayload.of(document)
+        if document.mode in STATE_CHANGING_MODES:
+            self.invalidate(document.project)
+
+    def stats(self):
+        """Return the ``{'hits', 'misses'}`` of every process since the cache was last cleared."""
+        found = self.cache.get_many([KEY_PREFIX + 'hits', KEY_PREFIX + 'misses'])
+        return {'hits': found.get(KEY_PREFIX + 'hits', 0), 'misses': found.get(KEY_PREFIX + 'misses', 0)}
+
+    def clear(self):
+        """Forget every entry and reset the counters."""
+        self._increment(KEY_PREFIX + 'epoch')
+        self.cache.delete_many([KEY_PREFIX + 'hits', KEY_PREFIX + 'misses'])
+
+    def _generation_key(self, project):
+        return KEY_PREFIX + 'generation:' + hashlib.sha1(project.encode('utf-8')).hexdigest()
+
+    def _increment(self, key):
+        cache = self.cache
+        cache.add(key, 0, timeout=None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # evicted since it was added
+            cache.set(key, 1, timeout=None)
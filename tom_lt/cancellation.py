@@ -0,0 +1,98 @@
+"""Cancelling submitted LT observations, many at a time.
+
+Observations are cancelled with an RTML ``abort`` document for one proposal whose ``Schedule`` elements
+only carry the ``uid`` of each request to cancel, like a status inquiry (see ``tom_lt.status``). The node
+agent confirms the document, or rejects it as a whole; a ``Schedule`` of its confirmation with a mode other
+than ``abort`` or ``confirmation`` is a request it could not cancel (one that has completed, for instance).
+A reply of any other mode (``fail``, ``offer``, none, ...) cancels nothing.
+
+The observations to cancel are grouped by proposal, in batches of ``CANCEL_BATCH_SIZE``, so a campaign
+of a few proposals is cancelled in a few exchanges, and the records cancelled are saved with one bulk
+update.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.utils import timezone
+
+from tom_lt.status import BULK_UPDATE_BATCH_SIZE, batches
+from tom_lt.uids import new_uid
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CANCEL_BATCH_SIZE = 100
+# the modes a Schedule of the confirmation of an abort document has when its request was cancelled
+CANCELLED_MODES = (None, 'abort', 'confirmation')
+
+
+def abort_document(project, username, observation_ids):
+    """Return the abort document cancelling some observations of a proposal."""
+    from tom_lt.rtml import DOCUMENT, OBSERVATION_REFERENCE, PROJECT
+    body = PROJECT.render(project=project, username=username)
+    body += ''.join(OBSERVATION_REFERENCE.render(observation_id=observation_id)
+                    for observation_id in observation_ids)
+    return DOCUMENT.render(mode='abort', uid=new_uid(), body=body)
+
+
+def parse_cancellations(response, observation_ids):
+    """Return ``{uid: error}`` from the reply to an abort document, with an ``error`` of ``None`` if cancelled."""
+    if response.mode == 'reject':
+        error = '\n'.join(response.errors) or 'Cancellation rejected by the Liverpool Telescope'
+        return {observation_id: error for observation_id in observation_ids}
+    if response.mode != 'confirmation':
+        error = f'The Liverpool Telescope did not confirm the cancellation ({response.mode})'
+        return {observation_id: error for observation_id in observation_ids}
+    modes = {schedule.uid: schedule.mode for schedule in response.schedules if schedule.uid is not None}
+    outcomes = {}
+    for observation_id in observation_ids:
+        mode = modes.get(observation_id)
+        if mode in CANCELLED_MODES:
+            outcomes[observation_id] = None
+        else:
+            outcomes[observation_id] = f'The Liverpool Telescope could not cancel the observation ({mode})'
+    return outcomes
+
+
+def cancel_observations(facility, lt_settings, records, max_workers=None):
+    """Cancel the observations of ``records`` and set those cancelled to ``CANCELED``.
+
+    Abort documents for different batches are sent concurrently, ``max_workers`` at a time, through
+    ``facility._handle_rtml``. Returns ``{observation_id: error}`` for every record, where ``error`` is
+    ``None`` if the observation was cancelled.
+    """
+    from tom_common.hooks import run_hook
+    from tom_observations.models import ObservationRecord
+
+    records = list(records)
+    outcomes = {record.observation_id: 'No proposal recorded for this observation'
+                for record in records if not record.parameters.get('project')}
+    records = [record for record in records if record.parameters.get('project')]
+    batch_size = lt_settings.get('CANCEL_BATCH_SIZE', DEFAULT_CANCEL_BATCH_SIZE)
+
+    def abort(batch):
+        project, batch_records = batch
+        observation_ids = sorted({record.observation_id for record in batch_records})
+        try:
+            response = facility._handle_rtml(abort_document(project, lt_settings['username'], observation_ids))
+        except Exception as e:
+            logger.warning('Error cancelling observations at the Liverpool Telescope: %s', e)
+            error = f'Error with connection to Liverpool Telescope: {e}'
+            return batch_records, {observation_id: error for observation_id in observation_ids}
+        return batch_records, parse_cancellations(response, observation_ids)
+
+    now = timezone.now()
+    cancelled = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_records, batch_outcomes in executor.map(abort, batches(records, batch_size)):
+            outcomes.update(batch_outcomes)
+            for record in batch_records:
+                if batch_outcomes[record.observation_id] is None and record.status != 'CANCELED':
+                    cancelled.append((record, record.status))
+                    record.status = 'CANCELED'
+                    record.modified = now
+
+    ObservationRecord.objects.bulk_update([record for record, _ in cancelled], ['status', 'modified'],
+                                          batch_size=BULK_UPDATE_BATCH_SIZE)
+    for record, previous_status in cancelled:
+        run_hook('observation_change_state', record, previous_status)
+    return outcomes
@@ -0,0 +1,179 @@
+import copy
+import io
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from suds.cache import ObjectCache
+from suds.client import Client, ServiceSelector
+from suds.properties import Unskin
+from suds.transport import Reply, Transport, TransportError
+
+from tom_lt.metrics import span
+
+logger = logging.getLogger(__name__)
+
+NODE_AGENT_PATH = 'node_agent2/node_agent'
+
+DEFAULT_WSDL_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'tom_lt_wsdl')
+DEFAULT_WSDL_CACHE_HOURS = 24
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 90
+
+# One fully loaded suds Client per (host, port, username, password). Each thread works on its own
+# copy of that client, because suds records the last message sent and received on the client, but
+# every copy shares the parsed WSDL, the options and the keep-alive connection pool of the transport.
+_clients = {}
+_clients_lock = threading.Lock()
+_generation = 0
+_local = threading.local()
+
+
+class ConnectionFailed(Exception):
+    """Raised when no connection could be made to the node agent, so nothing was sent to it.
+
+    Unlike a call that timed out waiting for its answer, which the node agent may have acted on, such a call
+    can safely be made again.
+    """
+
+
+class KeepAliveTransport(Transport):
+    """A suds transport that sends every request through one shared ``requests.Session``.
+
+    The stock suds transport opens a new connection for each call. Reusing a pooled session keeps the
+    TCP connection to the node agent alive between the WSDL download and successive ``handle_rtml`` calls.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, **kwargs):
+        Transport.__init__(self)
+        Unskin(self.options).update(kwargs)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def open(self, request):
+        response = self._request('GET', request)
+        return io.BytesIO(response.content)
+
+    def send(self, request):
+        response = self._request('POST', request)
+        return Reply(response.status_code, response.headers, response.content)
+
+    def _request(self, method, request):
+        headers = dict(self.options.headers)
+        headers.update(request.headers)
+        try:
+            response = self.session.request(method, request.url, data=request.message, headers=headers,
+                                            timeout=getattr(_local, 'timeout', None) or self.options.timeout)
+        except requests.RequestException as e:
+            if _not_connected(e):
+                raise ConnectionFailed(str(e)) from e
+            # as the stock suds transport does with a URLError; suds would read the reply of a TransportError
+            raise
+        if response.status_code >= 400:
+            raise TransportError(response.reason, response.status_code, io.BytesIO(response.content))
+        return response
+
+
+def _not_connected(e):
+    """Return whether a ``requests`` exception was raised before a connection to the node agent was made."""
+    if isinstance(e, requests.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], 'reason', None) if isinstance(e, requests.ConnectionError) and e.args else None
+    # NewConnectionError covers a refused connection and a name that does not resolve
+    return isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+def node_agent_url(lt_settings):
+    """Return the address of the node agent described by ``FACILITIES['LT']``."""
+    return 'http://{0}:{1}/{2}'.format(lt_settings['LT_HOST'], lt_settings['LT_PORT'], NODE_AGENT_PATH)
+
+
+@contextmanager
+def call_timeout(timeout):
+    """Make the calls of the current thread to the node agent time out after ``timeout`` seconds.
+
+    ``None`` keeps the ``TIMEOUT`` the client was created with.
+    """
+    previous = getattr(_local, 'timeout', None)
+    _local.timeout = timeout
+    try:
+        yield
+    finally:
+        _local.timeout = previous
+
+
+def _client_key(lt_settings):
+    return (lt_settings['LT_HOST'], str(lt_settings['LT_PORT']),
+            lt_settings['username'], lt_settings['password'], lt_settings.get('TIMEOUT'))
+
+
+def _build_client(lt_settings):
+    transport = KeepAliveTransport(
+        pool_size=lt_settings.get('CONNECTION_POOL_SIZE', DEFAULT_POOL_SIZE),
+        timeout=lt_settings.get('TIMEOUT', DEFAULT_TIMEOUT),
+        headers={
+            'Username': lt_settings['username'],
+            'Password': lt_settings['password'],
+        },
+    )
+    cache = ObjectCache(location=lt_settings.get('WSDL_CACHE_DIR', DEFAULT_WSDL_CACHE_DIR),
+                        hours=lt_settings.get('WSDL_CACHE_HOURS', DEFAULT_WSDL_CACHE_HOURS))
+    url = node_agent_url(lt_settings) + '?wsdl'
+    logger.debug('Loading node agent WSDL from %s', url)
+    with span('wsdl_load'):
+        return Client(url=url, transport=transport, cache=cache, cachingpolicy=1)
+
+
+def _thread_client(shared_client):
+    # suds' own Client.clone() deep-copies the option graph, which overflows the recursion limit.
+    client = copy.copy(shared_client)
+    client.messages = dict(tx=None, rx=None)
+    client.service = ServiceSelector(client, shared_client.wsdl.services)
+    return client
+
+
+def get_client(lt_settings):
+    """Return a suds client for the node agent described by ``lt_settings``.
+
+    The WSDL is fetched (or read from the on-disk cache) once per process for each host, port and set of
+    credentials; later calls return a per-thread copy of that client.
+    """
+    key = _client_key(lt_settings)
+    if getattr(_local, 'generation', None) != _generation:
+        _local.clients = {}
+        _local.generation = _generation
+    client = _local.clients.get(key)
+    if client is None:
+        with _clients_lock:
+            shared_client = _clients.get(key)
+            if shared_client is None:
+                shared_client = _clients[key] = _build_client(lt_settings)
+        client = _local.clients[key] = _thread_client(shared_client)
+    return client
+
+
+def clear_clients():
+    """Forget every cached client, so that the next call to ``get_client`` reloads the WSDL."""
+    global _generation
+    with _clients_lock:
+        for client in _clients.values():
+            client.options.transport.session.close()
+        _clients.clear()
+        _generation += 1
+
+
+@receiver(setting_changed)
+def _facilities_changed(setting, **kwargs):
+    if setting == 'FACILITIES':
+        clear_clients()
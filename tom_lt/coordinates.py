@@ -0,0 +1,59 @@
+"""Vectorized conversion of target coordinates to the sexagesimal fields of an RTML ``Coordinates`` element."""
+import numpy as np
+
+# astropy's degree -> hourangle conversion factor. It is one ulp above 1/15, and using it keeps the
+# output identical to that of SkyCoord(...).ra.hms.
+DEGREES_TO_HOURS = 0.06666666666666668
+
+
+def _sexagesimal(angle):
+    # the same arithmetic as astropy.coordinates.angles.formats._decimal_to_sexagesimal
+    sign = np.copysign(1.0, angle)
+    fraction, whole = np.modf(np.fabs(angle))
+    minute_fraction, minutes = np.modf(fraction * 60.0)
+    seconds = minute_fraction * 60.0
+    return np.floor(sign * whole), sign * np.floor(minutes), sign * seconds
+
+
+def format_coordinates(ra, dec, epoch):
+    """Return the RTML coordinate fields for sequences of RA and Dec (in degrees) and epochs.
+
+    The result is a list with one dictionary per target, keyed by the names of the RTML elements:
+    ``Hours``, ``Minutes``, ``Seconds``, ``Degrees`` (signed), ``Arcminutes``, ``Arcseconds`` and ``Equinox``.
+    The values are the strings written by the original ``SkyCoord`` based builder, including its
+    rounding, and a ``-`` sign for a declination of zero.
+    """
+    ra = np.array(ra, dtype=float, ndmin=1)
+    dec = np.asarray(dec, dtype=float).reshape(ra.shape)
+    if np.any(np.fabs(dec) > 90):
+        raise ValueError('Latitude angle(s) must be within -90 deg <= angle <= 90 deg')
+
+    # wrap RA into [0, 360) as astropy's Longitude does. Only the values outside the range are touched, so
+    # an RA of -0.0 keeps its sign (and its '-0.0' seconds) whatever else is in the batch.
+    out_of_range = (ra < 0) | (ra >= 360)
+    if out_of_range.any():
+        wrapped = ra[out_of_range]
+        wrapped -= (wrapped // 360.0) * 360.0
+        wrapped[wrapped >= 360] -= 360
+        wrapped[wrapped < 0] += 360
+        ra[out_of_range] = wrapped
+
+    hours, minutes, seconds = _sexagesimal(ra * DEGREES_TO_HOURS)
+    degrees, arcminutes, arcseconds = _sexagesimal(np.fabs(dec))
+    signs = np.where(dec > 0, '+', '-')
+
+    return [
+        {
+            'Hours': str(h),
+            'Minutes': str(m),
+            'Seconds': str(s),
+            'Degrees': sign + str(d),
+            'Arcminutes': str(am),
+            'Arcseconds': str(a_s),
+            'Equinox': str(e),
+        }
+        for h, m, s, sign, d, am, a_s, e in zip(
+            hours.astype(np.int64).tolist(), minutes.astype(np.int64).tolist(), seconds.tolist(),
+            signs.tolist(), degrees.astype(np.int64).tolist(), arcminutes.astype(np.int64).tolist(),
+            arcseconds.tolist(), epoch)
+    ]
@@ -0,0 +1,170 @@
+"""Streaming, resumable download of LT data products into tom_dataproducts.
+
+The data products of an observation are listed in the node agent's reply to a status inquiry (see
+``tom_lt.status``), as RTML ``ImageData`` elements whose text is the URL of a reduced frame, optionally
+with an ``md5`` attribute. Each file is streamed to a ``.part`` file in chunks, resumed with an HTTP
+range request if a previous download was cut short, and checked against its MD5 and, for FITS files,
+the CHECKSUM/DATASUM keywords of every HDU before it is registered as a ``DataProduct``.
+"""
+import hashlib
+import logging
+import os
+import posixpath
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), 'tom_lt_downloads')
+DEFAULT_MAX_CONCURRENT_DOWNLOADS = 3
+DEFAULT_DOWNLOAD_TIMEOUT = 90
+DOWNLOAD_ATTEMPTS = 3
+# Read and written at a time. A chunk cut short by a dropped connection is lost, and asked for again.
+CHUNK_SIZE = 64 * 1024
+
+FITS_EXTENSIONS = ('.fits', '.fit', '.fts', '.fits.gz', '.fit.gz', '.fts.gz')
+
+
+class ChecksumError(Exception):
+    """Raised when a downloaded file does not match its checksum."""
+
+
+def parse_products(response, observation_id):
+    """Return the data products the reply to a status inquiry lists for ``observation_id``."""
+    products = []
+    for schedule in response.schedules:
+        if schedule.uid != observation_id:
+            continue
+        for url, md5 in schedule.images:
+            filename = posixpath.basename(urlsplit(url).path)
+            products.append({'id': filename, 'filename': filename, 'url': url, 'md5': md5})
+    return products
+
+
+def verify(path, product):
+    """Raise ``ChecksumError`` unless the file at ``path`` matches the checksums known for ``product``."""
+    if product.get('md5'):
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != product['md5'].lower():
+            raise ChecksumError('MD5 mismatch for {0}'.format(product['filename']))
+    if product['filename'].lower().endswith(FITS_EXTENSIONS):
+        from astropy.io import fits
+        with fits.open(path) as hdul:
+            for index, hdu in enumerate(hdul):
+                # 0 is a mismatch; 2 means the HDU has no checksum keyword
+                if hdu.verify_checksum() == 0 or hdu.verify_datasum() == 0:
+                    raise ChecksumError('FITS checksum mismatch in HDU {0} of {1}'.format(index, product['filename']))
+
+
+def download(session, product, directory, timeout=DEFAULT_DOWNLOAD_TIMEOUT):
+    """Stream ``product`` into ``directory``, resuming a partial download, and return the verified file's path.
+
+    The file is written in chunks to ``<filename>.part``, which is kept if the transfer fails, so a later
+    call asks for the remaining bytes only. A file that fails verification is removed.
+    """
+    path = os.path.join(directory, product['filename'])
+    partial = path + '.part'
+    for attempt in range(DOWNLOAD_ATTEMPTS):
+        try:
+            _transfer(session, product['url'], partial, timeout)
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == DOWNLOAD_ATTEMPTS - 1:
+                raise
+            logger.info('Resuming download of %s after: %s', product['filename'], e)
+    try:
+        verify(partial, product)
+    except ChecksumError:
+        os.remove(partial)
+        raise
+    os.replace(partial, path)
+    return path
+
+
+def _transfer(session, url, partial, timeout):
+    offset = os.path.getsize(partial) if os.path.exists(partial) else 0
+    headers = {'Range': 'bytes={0}-'.format(offset)} if offset else {}
+    with session.get(url, headers=headers, stream=True, timeout=timeout) as response:
+        if offset and response.status_code == 416:
+            # the previous download got every byte, but was not verified
+            return
+        response.raise_for_status()
+        if response.status_code == 206:
+            if not response.headers.get('Content-Range', '').startswith('bytes {0}-'.format(offset)):
+                raise requests.ConnectionError('Unexpected Content-Range from {0}'.format(url))
+            mode = 'ab'
+        else:
+            mode = 'wb'
+        with open(partial, mode) as f:
+            for chunk in response.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+
+
+def fetch(products, directory, max_workers=DEFAULT_MAX_CONCURRENT_DOWNLOADS, timeout=DEFAULT_DOWNLOAD_TIMEOUT):
+    """Download ``products``, ``max_workers`` at a time, returning ``(product, path, error)`` for each in order."""
+    os.makedirs(directory, exist_ok=True)
+    with requests.Session() as session:
+        session.mount('http://', HTTPAdapter(pool_maxsize=max_workers))
+        session.mount('https://', HTTPAdapter(pool_maxsize=max_workers))
+
+        def fetch_one(product):
+            try:
+                return product, download(session, product, directory, timeout), None
+            except Exception as e:
+                logger.error('Error downloading %s from the Liverpool Telescope: %s', product['url'], e)
+                return product, None, e
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(fetch_one, products))
+
+
+def save_data_products(observation_record, products, lt_settings):
+    """Download the ``products`` of an observation not yet in the TOM and register them as ``DataProduct``s.
+
+    Returns the ``DataProduct`` of every product that is now stored, like
+    ``BaseObservationFacility.save_data_products``. Products that could not be downloaded are logged and
+    left out; their partial files are resumed by the next call.
+    """
+    from django.core.files import File
+    from tom_dataproducts.models import DataProduct
+    from tom_dataproducts.utils import create_image_dataproduct
+    from tom_observations.facility import AUTO_THUMBNAILS
+
+    stored = {dp.product_id: dp for dp in DataProduct.objects.filter(
+        product_id__in=[product['id'] for product in products]).exclude(data__isnull=True).exclude(data='')}
+    missing = [product for product in products if product['id'] not in stored]
+
+    directory = lt_settings.get('DOWNLOAD_DIR', DEFAULT_DOWNLOAD_DIR)
+    max_workers = lt_settings.get('MAX_CONCURRENT_DOWNLOADS', DEFAULT_MAX_CONCURRENT_DOWNLOADS)
+    timeout = lt_settings.get('TIMEOUT', DEFAULT_DOWNLOAD_TIMEOUT)
+    for product, path, error in fetch(missing, directory, max_workers, timeout) if missing else []:
+        if error is not None:
+            continue
+        dp, _ = DataProduct.objects.get_or_create(
+            product_id=product['id'],
+            target=observation_record.target,
+            observation_record=observation_record,
+        )
+        with open(path, 'rb') as f:
+            dp.data.save(product['filename'], File(f))
+        os.remove(path)
+        logger.info('Saved new dataproduct: {}'.format(dp.data))
+        stored[product['id']] = dp
+
+    final_products = []
+    for product in products:
+        dp = stored.get(product['id'])
+        if dp is None:
+            continue
+        if AUTO_THUMBNAILS:
+            create_image_dataproduct(dp)
+            dp.get_preview()
+        final_products.append(dp)
+    return final_products
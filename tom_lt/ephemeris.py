@@ -0,0 +1,192 @@
+"""Ephemerides of non-sidereal targets, from the orbital elements the TOM Toolkit stores for them.
+
+The heliocentric position of the target is found by solving Kepler's equation for its elements (elliptic,
+parabolic or hyperbolic orbits) at every sample of the requested window at once. That of the Earth comes
+from ERFA's ``epv00`` (installed with astropy). The result is the geocentric astrometric RA and Dec (ICRS,
+corrected for light time) of the target. Perturbations by the planets are ignored, as is the parallax of
+the site, which is significant only for targets very close to the Earth.
+
+The telescope is pointed at the position of the target in the middle of the window, which is computed
+directly. The window is also sampled every ``EPHEMERIS_STEP`` to find how far the target moves from that
+position during it, so a window too long for the target's motion can be turned down.
+
+Ephemerides are cached by target, a hash of its elements and window, so validating and then submitting an
+observation, or submitting it again, does not compute them again.
+"""
+from functools import lru_cache
+
+import numpy as np
+
+# the Gaussian gravitational constant, in radians per day
+GAUSSIAN_GRAVITATIONAL_CONSTANT = 0.01720209895
+SPEED_OF_LIGHT = 173.1446326846693  # AU per day
+J2000_OBLIQUITY = np.radians(84381.406 / 3600)
+MJD_ZERO = 2400000.5
+UNIX_EPOCH_MJD = 40587.0
+
+# the window of an observation is sampled this often, in seconds
+EPHEMERIS_STEP = 3600
+MAX_EPHEMERIS_SAMPLES = 2000
+EPHEMERIS_CACHE_SIZE = 256
+
+KEPLER_ITERATIONS = 50
+KEPLER_TOLERANCE = 1e-12
+# closer to 1 than this, an eccentricity is taken as parabolic: Kepler's equation loses its precision there,
+# and the difference is well under an arcsecond
+PARABOLIC_TOLERANCE = 1e-6
+
+# the Target fields each scheme needs, in the order of the elements tuple
+SCHEME_FIELDS = {
+    'MPC_MINOR_PLANET': ('epoch_of_elements', 'mean_anomaly', 'arg_of_perihelion', 'lng_asc_node',
+                         'inclination', 'eccentricity', 'semimajor_axis'),
+    'JPL_MAJOR_PLANET': ('epoch_of_elements', 'mean_anomaly', 'arg_of_perihelion', 'lng_asc_node',
+                         'inclination', 'eccentricity', 'semimajor_axis'),
+    'MPC_COMET': ('epoch_of_perihelion', 'arg_of_perihelion', 'lng_asc_node', 'inclination',
+                  'eccentricity', 'perihdist'),
+}
+
+
+def orbital_elements(target):
+    """Return the orbital elements of a non-sidereal ``target`` as a hashable tuple, starting with its scheme.
+
+    Raises ``ValueError`` if the target's scheme is not supported or an element it needs is missing.
+    """
+    fields = SCHEME_FIELDS.get(target.scheme)
+    if fields is None:
+        raise ValueError('Non-sidereal targets of scheme {0!r} are not supported'.format(target.scheme))
+    elements = tuple(getattr(target, field) for field in fields)
+    missing = [field for field, value in zip(fields, elements) if value is None]
+    if missing:
+        raise ValueError('{0} has no {1}'.format(target.name, ', '.join(missing)))
+    return (target.scheme,) + tuple(float(value) for value in elements)
+
+
+def _solve_elliptic(mean_anomaly, e):
+    eccentric_anomaly = np.where(e < 0.8, mean_anomaly, np.pi)
+    for _ in range(KEPLER_ITERATIONS):
+        step = ((eccentric_anomaly - e * np.sin(eccentric_anomaly) - mean_anomaly)
+                / (1 - e * np.cos(eccentric_anomaly)))
+        eccentric_anomaly = eccentric_anomaly - step
+        if np.all(np.abs(step) < KEPLER_TOLERANCE):
+            break
+    return eccentric_anomaly
+
+
+def _solve_hyperbolic(mean_anomaly, e):
+    anomaly = np.arcsinh(mean_anomaly / e)
+    for _ in range(KEPLER_ITERATIONS):
+        step = (e * np.sinh(anomaly) - anomaly - mean_anomaly) / (e * np.cosh(anomaly) - 1)
+        anomaly = anomaly - step
+        if np.all(np.abs(step) < KEPLER_TOLERANCE):
+            break
+    return anomaly
+
+
+def _orbital_plane(elements, mjd):
+    """Return the coordinates (AU) of the target in its orbital plane, perihelion along x, at ``mjd``."""
+    scheme = elements[0]
+    k = GAUSSIAN_GRAVITATIONAL_CONSTANT
+    if scheme == 'MPC_COMET':
+        perihelion_time, _, _, _, e, q = elements[1:]
+        days = mjd - perihelion_time
+        if e < 1 - PARABOLIC_TOLERANCE:
+            a = q / (1 - e)
+            mean_anomaly = k / a ** 1.5 * days
+        elif e > 1 + PARABOLIC_TOLERANCE:
+            a = q / (e - 1)
+            anomaly = _solve_hyperbolic(k / a ** 1.5 * days, e)
+            return a * (e - np.cosh(anomaly)), a * np.sqrt(e * e - 1) * np.sinh(anomaly)
+        else:
+            # Barker's equation
+            w = 1.5 * k / np.sqrt(2 * q ** 3) * days
+            y = np.cbrt(w + np.sqrt(w * w + 1))
+            s = y - 1 / y
+            r = q * (1 + s * s)
+            true_anomaly = 2 * np.arctan(s)
+            return r * np.cos(true_anomaly), r * np.sin(true_anomaly)
+    else:
+        epoch, mean_anomaly_at_epoch, _, _, _, e, a = elements[1:]
+        mean_anomaly = np.radians(mean_anomaly_at_epoch) + k / a ** 1.5 * (mjd - epoch)
+    eccentric_anomaly = _solve_elliptic(np.remainder(mean_anomaly, 2 * np.pi), e)
+    return a * (np.cos(eccentric_anomaly) - e), a * np.sqrt(1 - e * e) * np.sin(eccentric_anomaly)
+
+
+def heliocentric_position(elements, mjd):
+    """Return the heliocentric ICRS position (AU) of the target at ``mjd``, as an array of shape (..., 3)."""
+    x, y = _orbital_plane(elements, np.asarray(mjd, dtype=float))
+    if elements[0] == 'MPC_COMET':
+        perihelion, node, inclination = elements[2:5]
+    else:
+        perihelion, node, inclination = elements[3:6]
+    perihelion, node, inclination = np.radians([perihelion, node, inclination])
+    # rotate from the orbital plane to the ecliptic of J2000, then to the equator
+    cos_w, sin_w = np.cos(perihelion), np.sin(perihelion)
+    cos_n, sin_n = np.cos(node), np.sin(node)
+    cos_i, sin_i = np.cos(inclination), np.sin(inclination)
+    ecliptic = np.stack([
+        (cos_n * cos_w - sin_n * sin_w * cos_i) * x + (-cos_n * sin_w - sin_n * cos_w * cos_i) * y,
+        (sin_n * cos_w + cos_n * sin_w * cos_i) * x + (-sin_n * sin_w + cos_n * cos_w * cos_i) * y,
+        (sin_w * sin_i) * x + (cos_w * sin_i) * y,
+    ], axis=-1)
+    cos_e, sin_e = np.cos(J2000_OBLIQUITY), np.sin(J2000_OBLIQUITY)
+    return np.stack([
+        ecliptic[..., 0],
+        cos_e * ecliptic[..., 1] - sin_e * ecliptic[..., 2],
+        sin_e * ecliptic[..., 1] + cos_e * ecliptic[..., 2],
+    ], axis=-1)
+
+
+def geocentric_coordinates(elements, mjd):
+    """Return the astrometric RA and Dec (degrees) and distance (AU) of the target seen from the Earth."""
+    import erfa
+    mjd = np.asarray(mjd, dtype=float)
+    earth = erfa.epv00(MJD_ZERO, mjd)[0]['p']
+    vector = heliocentric_position(elements, mjd) - earth
+    # the target is seen where it was when the light left it
+    light_time = np.linalg.norm(vector, axis=-1) / SPEED_OF_LIGHT
+    vector = heliocentric_position(elements, mjd - light_time) - earth
+    distance = np.linalg.norm(vector, axis=-1)
+    ra = np.degrees(np.arctan2(vector[..., 1], vector[..., 0])) % 360
+    dec = np.degrees(np.arcsin(vector[..., 2] / distance))
+    return ra, dec, distance
+
+
+def separation(ra1, dec1, ra2, dec2):
+    """Return the angle (degrees) between two positions given by their RA and Dec (degrees)."""
+    ra1, dec1, ra2, dec2 = (np.radians(value) for value in (ra1, dec1, ra2, dec2))
+    return np.degrees(np.arccos(np.clip(
+        np.sin(dec1) * np.sin(dec2) + np.cos(dec1) * np.cos(dec2) * np.cos(ra1 - ra2), -1, 1)))
+
+
+@lru_cache(maxsize=EPHEMERIS_CACHE_SIZE)
+def ephemeris(target_id, elements, start, end):
+    """Return ``(ra, dec, motion)`` for the window from ``start`` to ``end`` (seconds since the Unix epoch).
+
+    ``ra`` and ``dec`` are the position (degrees) of the target in the middle of the window, and ``motion``
+    the largest angle (degrees) between it and the target at any sample of the window, every
+    ``EPHEMERIS_STEP``. ``target_id`` and ``elements`` (see ``orbital_elements``) make up the cache key
+    together with the window.
+    """
+    samples = int(min(max(np.ceil((end - start) / EPHEMERIS_STEP) + 1, 2), MAX_EPHEMERIS_SAMPLES))
+    # the middle of the window, then the samples
+    times = np.append((start + end) / 2, np.linspace(start, end, samples))
+    ra, dec, _ = geocentric_coordinates(elements, times / 86400 + UNIX_EPOCH_MJD)
+    return float(ra[0]), float(dec[0]), float(separation(ra[0], dec[0], ra[1:], dec[1:]).max())
+
+
+def position(target, start, end):
+    """Return the RA and Dec (degrees) of a non-sidereal ``target`` in the middle of its window.
+
+    ``start`` and ``end`` are seconds since the Unix epoch. The telescope is pointed at this position.
+    """
+    ra, dec, _ = ephemeris(getattr(target, 'pk', None), orbital_elements(target), float(start), float(end))
+    return ra, dec
+
+
+def motion(target, start, end):
+    """Return how far (degrees) a non-sidereal ``target`` is at most from its ``position`` during its window."""
+    return ephemeris(getattr(target, 'pk', None), orbital_elements(target), float(start), float(end))[2]
+
+
+def clear_ephemerides():
+    ephemeris.cache_clear()
@@ -1,14 +1,11 @@
 import logging
 import time
-
-from lxml import etree
-from suds import Client
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 
 from django import forms
 from django.conf import settings
-
-from astropy.coordinates import SkyCoord
-from astropy import units as u
+from django.core.exceptions import ImproperlyConfigured
 
 from crispy_forms.layout import Layout, Div, HTML
 from crispy_forms.bootstrap import PrependedAppendedText, PrependedText
@@ -17,9 +14,17 @@ from tom_observations.facility import BaseRoboticObservationForm, BaseRoboticObs
 from tom_targets.models import Target
 
 from tom_lt import __version__
+from tom_lt.breaker import DEFAULT_RETRY_BACKOFF, DEFAULT_SUBMISSION_ATTEMPTS
+from tom_lt.cache import DEFAULT_VALIDATION_CACHE, DEFAULT_VALIDATION_CACHE_TTL, ValidationCache
+from tom_lt.metrics import count, span
+from tom_lt.payload import RTMLPayload
+from tom_lt.status import TERMINAL_STATES, parse_statuses, status_inquiry, update_statuses
+from tom_lt.uids import new_uid
+
+# This module is imported whenever TOM_FACILITY_CLASSES is resolved, so lxml, suds and NumPy (through
+# tom_lt.rtml, tom_lt.client and tom_lt.async_client) are only imported once a payload is built or sent.
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 try:
     LT_SETTINGS = settings.FACILITIES['LT']
@@ -34,9 +39,48 @@ except (AttributeError, KeyError):
     }
 
 
-LT_XML_NS = 'http://www.rtml.org/v3.1a'
-LT_XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
-LT_SCHEMA_LOCATION = 'http://www.rtml.org/v3.1a http://telescope.livjm.ac.uk/rtml/RTML-nightly.xsd'
+DEFAULT_MAX_CONCURRENT_SUBMISSIONS = 4
+# seconds to wait for the answer to a validation inquiry, which holds up the web request of the form
+DEFAULT_VALIDATION_TIMEOUT = 30
+
+# remote: send an inquiry for every validation; cached: reuse a recent inquiry for an unchanged payload;
+# local: never send an inquiry, leaving the node agent to accept or reject the payload on submission
+VALIDATION_MODES = ('remote', 'cached', 'local')
+
+# reject: turn down a payload with a Schedule that cannot be observed without asking the node agent;
+# warn: only log it; off: leave it all to the node agent
+VISIBILITY_CHECKS = ('reject', 'warn', 'off')
+
+# reject: turn down a payload that breaks the bundled RTML subset schema without asking the node agent;
+# warn: only log it (the default, as the schema is not the published one); off: do not check payloads
+SCHEMA_CHECKS = ('reject', 'warn', 'off')
+
+# the form field each element of a payload comes from, unless the form says otherwise for a Schedule
+SCHEMA_FIELDS = {
+    'Project': 'project',
+    'AirmassConstraint': 'max_airmass',
+    'SeeingConstraint': 'max_seeing',
+    'Flux': 'max_skybri',
+    'Clouds': 'photometric',
+    'DateTimeStart': 'startdate',
+    'DateTimeEnd': 'enddate',
+    'X': 'binning',
+    'Y': 'binning',
+    'Grating': 'grating',
+}
+
+# how far (arcseconds) a non-sidereal target may move during the window from where the telescope is pointed
+DEFAULT_MAX_TARGET_MOTION = 60
+
+# direct: send a submitted payload to the node agent in the request; outbox: save it for the runltoutbox workers
+SUBMISSION_MODES = ('direct', 'outbox')
+
+# the formats of the date and time fields of the window
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%H:%M'
+
+validation_cache = ValidationCache(LT_SETTINGS.get('VALIDATION_CACHE_TTL', DEFAULT_VALIDATION_CACHE_TTL),
+                                   LT_SETTINGS.get('VALIDATION_CACHE', DEFAULT_VALIDATION_CACHE))
 
 
 class LTObservationForm(BaseRoboticObservationForm):
@@ -66,6 +110,8 @@ class LTObservationForm(BaseRoboticObservationForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._targets = {}
+        self._payload = None
         self.helper.layout = Layout(
             self.common_layout,
             self.layout(),
@@ -75,12 +121,38 @@ class LTObservationForm(BaseRoboticObservationForm):
         )
 
     def is_valid(self):
-        super().is_valid()
-        errors = LTFacility.validate_observation(self, self.observation_payload())
+        if not super().is_valid():
+            return False
+        facility = LTFacility()
+        try:
+            observation_payload = self.observation_payload()
+        except forms.ValidationError as e:
+            # the ephemeris of a non-sidereal target cannot be computed, or the window is too long for its motion
+            self.add_error('enddate' if e.code == 'target_motion' else None, e)
+            return False
+        schema_errors = facility._schema_errors(observation_payload)
+        for error in schema_errors:
+            self.add_error(self._schema_field(error), error.message)
+        if schema_errors:
+            return False
+        errors = facility._validate_observation(observation_payload, schema_checked=True)
         if errors:
             self.add_error(None, errors)
         return not errors
 
+    def _schema_field(self, error):
+        """Return the field a ``tom_lt.schema.SchemaError`` in the payload comes from, or ``None``."""
+        if error.schedule is not None:
+            schedule_fields = self._schedule_fields()
+            if error.schedule < len(schedule_fields) and error.element in schedule_fields[error.schedule]:
+                return schedule_fields[error.schedule][error.element]
+        field = SCHEMA_FIELDS.get(error.element)
+        return field if field in self.fields else None
+
+    def _schedule_fields(self):
+        """Return, for each Schedule of the payload, the fields its elements come from, by element name."""
+        return []
+
     def layout(self):
         return Div(
             Div(
@@ -121,71 +193,145 @@ class LTObservationForm(BaseRoboticObservationForm):
     def extra_layout(self):
         return Div()
 
-    def _build_prolog(self):
-        namespaces = {
-            'xsi': LT_XSI_NS,
-        }
-        schemaLocation = etree.QName(LT_XSI_NS, 'schemaLocation')
-        uid = format(str(int(time.time())))
-        return etree.Element('RTML', {schemaLocation: LT_SCHEMA_LOCATION}, xmlns=LT_XML_NS,
-                             mode='request', uid=uid, version='3.1a', nsmap=namespaces)
-
-    def _build_project(self, payload):
-        project = etree.Element('Project', ProjectID=self.cleaned_data['project'])
-        contact = etree.SubElement(project, 'Contact')
-        etree.SubElement(contact, 'Username').text = LT_SETTINGS['username']
-        etree.SubElement(contact, 'Name').text = ''
-        payload.append(project)
+    def _build_project(self):
+        from tom_lt.rtml import PROJECT
+        return PROJECT.render(project=self.cleaned_data['project'], username=LT_SETTINGS['username'])
 
     def _build_constraints(self):
-        airmass_const = etree.Element('AirmassConstraint', maximum=str(self.cleaned_data['max_airmass']))
+        # every Schedule of a payload has the same constraints, so they are rendered once per document
+        from tom_lt.rtml import CONSTRAINTS
+        return CONSTRAINTS.render(
+            max_airmass=self.cleaned_data['max_airmass'],
+            max_skybri=self.cleaned_data['max_skybri'],
+            max_seeing=self.cleaned_data['max_seeing'],
+            photometric=self.cleaned_data['photometric'],
+            start=self._start(),
+            end=self._end(),
+        )
 
-        sky_const = etree.Element('SkyConstraint')
-        etree.SubElement(sky_const, 'Flux').text = str(self.cleaned_data['max_skybri'])
-        etree.SubElement(sky_const, 'Units').text = 'magnitudes/square-arcsecond'
+    # The window of a payload is written from the date and time fields as they are, so they are checked
+    # (and zero-padded) here, before anything is worked out from the window.
+    def clean_startdate(self):
+        return self._clean_moment('startdate', DATE_FORMAT, 'Enter a valid date, as YYYY-MM-DD.')
 
-        seeing_const = etree.Element('SeeingConstraint',
-                                     maximum=(str(self.cleaned_data['max_seeing'])),
-                                     units='arcseconds')
+    def clean_starttime(self):
+        return self._clean_moment('starttime', TIME_FORMAT, 'Enter a valid time, as HH:MM.')
 
-        photom_const = etree.Element('ExtinctionConstraint')
-        etree.SubElement(photom_const, 'Clouds').text = self.cleaned_data['photometric']
+    def clean_enddate(self):
+        return self._clean_moment('enddate', DATE_FORMAT, 'Enter a valid date, as YYYY-MM-DD.')
 
-        date_const = etree.Element('DateTimeConstraint', type='include')
-        start = self.cleaned_data['startdate'] + 'T' + self.cleaned_data['starttime'] + ':00+00:00'
-        end = self.cleaned_data['enddate'] + 'T' + self.cleaned_data['endtime'] + ':00+00:00'
-        etree.SubElement(date_const, 'DateTimeStart', system='UT', value=start)
-        etree.SubElement(date_const, 'DateTimeEnd', system='UT', value=end)
+    def clean_endtime(self):
+        return self._clean_moment('endtime', TIME_FORMAT, 'Enter a valid time, as HH:MM.')
 
-        return [airmass_const, sky_const, seeing_const, photom_const, date_const]
+    def _clean_moment(self, field, format, message):
+        try:
+            return datetime.strptime(self.cleaned_data[field], format).strftime(format)
+        except ValueError:
+            raise forms.ValidationError(message, code='invalid')
 
-    def _build_target(self):
-        target_to_observe = Target.objects.get(pk=self.cleaned_data['target_id'])
-
-        target = etree.Element('Target', name=target_to_observe.name)
-        c = SkyCoord(ra=target_to_observe.ra*u.degree, dec=target_to_observe.dec*u.degree)
-        coordinates = etree.SubElement(target, 'Coordinates')
-        ra = etree.SubElement(coordinates, 'RightAscension')
-        etree.SubElement(ra, 'Hours').text = str(int(c.ra.hms.h))
-        etree.SubElement(ra, 'Minutes').text = str(int(c.ra.hms.m))
-        etree.SubElement(ra, 'Seconds').text = str(c.ra.hms.s)
-
-        dec = etree.SubElement(coordinates, 'Declination')
-        sign = '+' if c.dec.signed_dms.sign == 1.0 else '-'
-        etree.SubElement(dec, 'Degrees').text = sign + str(int(c.dec.signed_dms.d))
-        etree.SubElement(dec, 'Arcminutes').text = str(int(c.dec.signed_dms.m))
-        etree.SubElement(dec, 'Arcseconds').text = str(c.dec.signed_dms.s)
-        etree.SubElement(coordinates, 'Equinox').text = str(target_to_observe.epoch)
-        return target
+    def _start(self):
+        return self.cleaned_data['startdate'] + 'T' + self.cleaned_data['starttime'] + ':00+00:00'
 
-    def observation_payload(self):
-        payload = self._build_prolog()
-        self._build_project(payload)
-        self._build_inst_schedule(payload)
-        return etree.tostring(payload, encoding="unicode")
+    def _end(self):
+        return self.cleaned_data['enddate'] + 'T' + self.cleaned_data['endtime'] + ':00+00:00'
 
+    def _build_target(self):
+        # Every Schedule of a payload observes the same target: look it up and convert its coordinates
+        # once per form.
+        target_id = self.cleaned_data['target_id']
+        if target_id not in self._targets:
+            from tom_lt.rtml import render_targets
+            with span('target_lookup'):
+                target = Target.objects.get(pk=target_id)
+            with span('coordinates'):
+                window = ()
+                if getattr(target, 'type', None) == Target.NON_SIDEREAL:
+                    # where it is depends on when it is observed
+                    window = self._window()
+                    self._check_elements(target)
+                    self._check_motion(target, *window)
+                self._targets[target_id] = render_targets([target], *window)[0]
+        return self._targets[target_id]
+
+    def _window(self):
+        """Return the start and end of the window, in seconds since the Unix epoch."""
+        try:
+            return (datetime.fromisoformat(self._start()).timestamp(),
+                    datetime.fromisoformat(self._end()).timestamp())
+        except ValueError as e:
+            raise forms.ValidationError('The window cannot be read: %(error)s', code='window',
+                                        params={'error': e})
+
+    def _check_elements(self, target):
+        """Raise ``ValidationError`` if the ephemeris of a non-sidereal target cannot be computed."""
+        from tom_lt.ephemeris import orbital_elements
+        try:
+            orbital_elements(target)
+        except ValueError as e:
+            raise forms.ValidationError('%(error)s', code='orbital_elements', params={'error': e})
+
+    def _check_motion(self, target, start, end):
+        """Raise ``ValidationError`` if a non-sidereal target moves too far from where it is pointed at."""
+        max_motion = LT_SETTINGS.get('MAX_TARGET_MOTION', DEFAULT_MAX_TARGET_MOTION)
+        if max_motion is None:
+            return
+        from tom_lt.ephemeris import motion
+        arcseconds = motion(target, start, end) * 3600
+        if arcseconds > max_motion:
+            # the motion is about proportional to the length of the window
+            hours = (end - start) / 3600 * max_motion / arcseconds
+            raise forms.ValidationError(
+                '%(name)s moves up to %(motion).0f" from its position in the middle of the window, more than '
+                '%(max_motion)s"; make the window shorter than about %(hours).1f hours',
+                code='target_motion',
+                params={'name': target.name, 'motion': arcseconds, 'max_motion': max_motion, 'hours': hours})
 
-class LT_IOO_ObservationForm(LTObservationForm):
+    def observation_payload(self):
+        # The view asks for the payload again to submit the form it has validated: it is built once, so the
+        # payload submitted is the one validated, with the same uid, and is not parsed again.
+        if self._payload is None:
+            from tom_lt.rtml import DOCUMENT
+            with span('observation_payload'):
+                body = self._build_project() + ''.join(self._build_inst_schedule(self._build_constraints()))
+                self._payload = RTMLPayload(DOCUMENT.render(mode='request', uid=new_uid(), body=body))
+        return self._payload
+
+
+# The IO:O filters, in the order their Schedules are written to a payload. Each entry is the RTML filter
+# name, the prefix of its exposure time on the form, the form section it is shown in and its approximate
+# central wavelength in nm, which orders the filters within a section.
+IOO_FILTERS = (
+    ('U', 'u\'', 'Sloan', 350),
+    ('R', 'r\'', 'Sloan', 620),
+    ('G', 'g\'', 'Sloan', 480),
+    ('I', 'i\'', 'Sloan', 770),
+    ('Z', 'z\'', 'Sloan', 915),
+    ('B', 'B', 'Bessell', 445),
+    ('V', 'V', 'Bessell', 551),
+    ('Halpha6566', '6566', 'H-alpha', 656.6),
+    ('Halpha6634', '6634', 'H-alpha', 663.4),
+    ('Halpha6705', '6705', 'H-alpha', 670.5),
+    ('Halpha6755', '6755', 'H-alpha', 675.5),
+    ('Halpha6822', '6822', 'H-alpha', 682.2),
+)
+
+
+def _ioo_filter_fields():
+    fields = {}
+    for i, (filter, _, _, _) in enumerate(IOO_FILTERS):
+        fields['exp_time_' + filter] = forms.FloatField(min_value=0, initial=120,
+                                                        label='' if i else 'Integration Time')
+        fields['exp_count_' + filter] = forms.IntegerField(min_value=0, initial=0,
+                                                           label='' if i else 'No. of integrations')
+    return fields
+
+
+# The exposure time and count fields of every IO:O filter, declared once when the module is loaded so that
+# each form instance only copies them, as it does its other fields
+IOOFilterFields = type('IOOFilterFields', (forms.Form,), _ioo_filter_fields())
+
+
+class LT_IOO_ObservationForm(IOOFilterFields, LTObservationForm):
     binning = forms.ChoiceField(
         choices=[('1x1', '1x1'), ('2x2', '2x2')],
         initial=('2x2', '2x2'),
@@ -193,118 +339,49 @@ class LT_IOO_ObservationForm(LTObservationForm):
                    faster readout and lower readout noise. 1x1 binning should \
                    only be selected if specifically required.')
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.filters = ('U',
-                        'R',
-                        'G',
-                        'I',
-                        'Z',
-                        'B',
-                        'V',
-                        'Halpha6566',
-                        'Halpha6634',
-                        'Halpha6705',
-                        'Halpha6755',
-                        'Halpha6822')
-
-        for filter in self.filters:
-            if filter == self.filters[0]:
-                self.fields['exp_time_' + filter] = forms.FloatField(min_value=0,
-                                                                     initial=120,
-                                                                     label='Integration Time')
-                self.fields['exp_count_' + filter] = forms.IntegerField(min_value=0,
-                                                                        initial=0,
-                                                                        label='No. of integrations')
-            else:
-                self.fields['exp_time_' + filter] = forms.FloatField(min_value=0,
-                                                                     initial=120,
-                                                                     label='')
-                self.fields['exp_count_' + filter] = forms.IntegerField(min_value=0,
-                                                                        initial=0,
-                                                                        label='')
+    filters = tuple(filter for filter, _, _, _ in IOO_FILTERS)
 
     def extra_layout(self):
+        sections = {}
+        for filter, prefix, section, wavelength in IOO_FILTERS:
+            sections.setdefault(section, []).append((wavelength, filter, prefix))
+        layout = []
+        for section, filters in sections.items():
+            filters.sort()
+            layout.append(Div(HTML('<br><h5>{0}</h5>'.format(section)), css_class='row'))
+            layout.append(Div(
+                Div(*[PrependedAppendedText('exp_time_' + filter, prefix, 's') for _, filter, prefix in filters],
+                    css_class='col-md-6'),
+                Div(*['exp_count_' + filter for _, filter, _ in filters], css_class='col-md-4'),
+                css_class='row'
+            ))
         return Div(
-            Div(
-                Div(HTML('<br><h5>Sloan</h5>'), css_class='row'),
-                Div(
-                    Div(PrependedAppendedText('exp_time_U', 'u\'', 's'),
-                        PrependedAppendedText('exp_time_G', 'g\'', 's'),
-                        PrependedAppendedText('exp_time_R', 'r\'', 's'),
-                        PrependedAppendedText('exp_time_I', 'i\'', 's'),
-                        PrependedAppendedText('exp_time_Z', 'z\'', 's'),
-                        css_class='col-md-6', ),
-
-                    Div('exp_count_U',
-                        'exp_count_G',
-                        'exp_count_R',
-                        'exp_count_I',
-                        'exp_count_Z',
-                        css_class='col-md-4'),
-                    css_class='row'
-                ),
-                Div(HTML('<br><h5>Bessell</h5>'), css_class='row'),
-                Div(
-                    Div(PrependedAppendedText('exp_time_B', 'B', 's'),
-                        PrependedAppendedText('exp_time_V', 'V', 's'),
-                        css_class='col-md-6', ),
-
-                    Div('exp_count_B',
-                        'exp_count_V',
-                        css_class='col-md-4'),
-                    css_class='row'
-                ),
-                Div(HTML('<br><h5>H-alpha</h5>'), css_class='row'),
-
-                Div(
-                    Div(PrependedAppendedText('exp_time_Halpha6566', '6566', 's'),
-                        PrependedAppendedText('exp_time_Halpha6634', '6634', 's'),
-                        PrependedAppendedText('exp_time_Halpha6705', '6705', 's'),
-                        PrependedAppendedText('exp_time_Halpha6755', '6755', 's'),
-                        PrependedAppendedText('exp_time_Halpha6822', '6822', 's'),
-                        css_class='col-md-6', ),
-
-                    Div('exp_count_Halpha6566',
-                        'exp_count_Halpha6634',
-                        'exp_count_Halpha6705',
-                        'exp_count_Halpha6755',
-                        'exp_count_Halpha6822',
-                        css_class='col-md-4'),
-                    css_class='row'
-                    ),
-                css_class='col-md-10'
-            ),
+            Div(*layout, css_class='col-md-10'),
             Div(css_class='col-md-1'),
             Div('binning', css_class='col-md-6'),
             css_class='row'
         )
 
-    def _build_inst_schedule(self, payload):
-
-        for filter in self.filters:
-            if self.cleaned_data['exp_count_' + filter] != 0:
-                payload.append(self._build_schedule(filter))
-
-    def _build_schedule(self, filter):
-        exp_time = self.cleaned_data['exp_time_' + filter]
-        exp_count = self.cleaned_data['exp_count_' + filter]
-
-        schedule = etree.Element('Schedule')
-        device = etree.SubElement(schedule, 'Device', name="IO:O", type="camera")
-        etree.SubElement(device, 'SpectralRegion').text = 'optical'
-        setup = etree.SubElement(device, 'Setup')
-        etree.SubElement(setup, 'Filter', type=filter)
-        detector = etree.SubElement(setup, 'Detector')
-        binning = etree.SubElement(detector, 'Binning')
-        etree.SubElement(binning, 'X', units='pixels').text = self.cleaned_data['binning'].split('x')[0]
-        etree.SubElement(binning, 'Y', units='pixels').text = self.cleaned_data['binning'].split('x')[1]
-        exposure = etree.SubElement(schedule, 'Exposure', count=str(exp_count))
-        etree.SubElement(exposure, 'Value', units='seconds').text = str(exp_time)
-        schedule.append(self._build_target())
-        for const in self._build_constraints():
-            schedule.append(const)
-        return schedule
+    def _build_inst_schedule(self, constraints):
+        return [self._build_schedule(filter, constraints)
+                for filter in self.filters if self.cleaned_data['exp_count_' + filter] != 0]
+
+    def _schedule_fields(self):
+        return [{'Exposure': 'exp_count_' + filter, 'Value': 'exp_time_' + filter}
+                for filter in self.filters if self.cleaned_data['exp_count_' + filter] != 0]
+
+    def _build_schedule(self, filter, constraints):
+        from tom_lt.rtml import SCHEDULES
+        binning_x, binning_y = self.cleaned_data['binning'].split('x')
+        return SCHEDULES['IO:O'].render(
+            filter=filter,
+            binning_x=binning_x,
+            binning_y=binning_y,
+            exp_count=self.cleaned_data['exp_count_' + filter],
+            exp_time=self.cleaned_data['exp_time_' + filter],
+            target=self._build_target(),
+            constraints=constraints,
+        )
 
 
 class LT_IOI_ObservationForm(LTObservationForm):
@@ -329,25 +406,17 @@ class LT_IOI_ObservationForm(LTObservationForm):
             css_class='row'
         )
 
-    def _build_inst_schedule(self, payload):
-        exp_time = self.cleaned_data['exp_time']
-        exp_count = self.cleaned_data['exp_count']
-
-        schedule = etree.Element('Schedule')
-        device = etree.SubElement(schedule, 'Device', name="IO:I", type="camera")
-        etree.SubElement(device, 'SpectralRegion').text = 'infrared'
-        setup = etree.SubElement(device, 'Setup')
-        etree.SubElement(setup, 'Filter', type='H')
-        detector = etree.SubElement(setup, 'Detector')
-        binning = etree.SubElement(detector, 'Binning')
-        etree.SubElement(binning, 'X', units='pixels').text = '1'
-        etree.SubElement(binning, 'Y', units='pixels').text = '1'
-        exposure = etree.SubElement(schedule, 'Exposure', count=str(exp_count))
-        etree.SubElement(exposure, 'Value', units='seconds').text = str(exp_time)
-        schedule.append(self._build_target())
-        for const in self._build_constraints():
-            schedule.append(const)
-        payload.append(schedule)
+    def _build_inst_schedule(self, constraints):
+        from tom_lt.rtml import SCHEDULES
+        return [SCHEDULES['IO:I'].render(
+            exp_count=self.cleaned_data['exp_count'],
+            exp_time=self.cleaned_data['exp_time'],
+            target=self._build_target(),
+            constraints=constraints,
+        )]
+
+    def _schedule_fields(self):
+        return [{'Exposure': 'exp_count', 'Value': 'exp_time'}]
 
 
 class LT_SPRAT_ObservationForm(LTObservationForm):
@@ -371,26 +440,18 @@ class LT_SPRAT_ObservationForm(LTObservationForm):
                     css_class='row'
                 )
 
-    def _build_inst_schedule(self, payload):
-        exp_time = self.cleaned_data['exp_time']
-        exp_count = self.cleaned_data['exp_count']
-        grating = self.cleaned_data['grating']
-
-        schedule = etree.Element('Schedule')
-        device = etree.SubElement(schedule, 'Device', name="Sprat", type="spectrograph")
-        etree.SubElement(device, 'SpectralRegion').text = 'optical'
-        setup = etree.SubElement(device, 'Setup')
-        etree.SubElement(setup, 'Grating', name=grating)
-        detector = etree.SubElement(setup, 'Detector')
-        binning = etree.SubElement(detector, 'Binning')
-        etree.SubElement(binning, 'X', units='pixels').text = '1'
-        etree.SubElement(binning, 'Y', units='pixels').text = '1'
-        exposure = etree.SubElement(schedule, 'Exposure', count=str(exp_count))
-        etree.SubElement(exposure, 'Value', units='seconds').text = str(exp_time)
-        schedule.append(self._build_target())
-        for const in self._build_constraints():
-            schedule.append(const)
-        payload.append(schedule)
+    def _build_inst_schedule(self, constraints):
+        from tom_lt.rtml import SCHEDULES
+        return [SCHEDULES['Sprat'].render(
+            grating=self.cleaned_data['grating'],
+            exp_count=self.cleaned_data['exp_count'],
+            exp_time=self.cleaned_data['exp_time'],
+            target=self._build_target(),
+            constraints=constraints,
+        )]
+
+    def _schedule_fields(self):
+        return [{'Exposure': 'exp_count', 'Value': 'exp_time'}]
 
 
 class LT_FRODO_ObservationForm(LTObservationForm):
@@ -414,28 +475,31 @@ class LT_FRODO_ObservationForm(LTObservationForm):
                     css_class='row'
         )
 
-    def _build_inst_schedule(self, payload):
-        payload.append(self._build_schedule('FrodoSpec-Blue',
-                                            str(self.cleaned_data['res_blue']),
-                                            str(self.cleaned_data['exp_count_blue']),
-                                            str(self.cleaned_data['exp_time_blue'])))
-        payload.append(self._build_schedule('FrodoSpec-Red',
-                                            str(self.cleaned_data['res_red']),
-                                            str(self.cleaned_data['exp_count_red']),
-                                            str(self.cleaned_data['exp_time_red'])))
-
-    def _build_schedule(self, device, grating, exp_count, exp_time):
-        schedule = etree.Element('Schedule')
-        device = etree.SubElement(schedule, 'Device', name=device, type="spectrograph")
-        etree.SubElement(device, 'SpectralRegion').text = 'optical'
-        setup = etree.SubElement(device, 'Setup')
-        etree.SubElement(setup, 'Grating', name=grating)
-        exposure = etree.SubElement(schedule, 'Exposure', count=exp_count)
-        etree.SubElement(exposure, 'Value', units='seconds').text = exp_time
-        schedule.append(self._build_target())
-        for const in self._build_constraints():
-            schedule.append(const)
-        return schedule
+    def _build_inst_schedule(self, constraints):
+        return [self._build_schedule('FrodoSpec-Blue',
+                                     self.cleaned_data['res_blue'],
+                                     self.cleaned_data['exp_count_blue'],
+                                     self.cleaned_data['exp_time_blue'],
+                                     constraints),
+                self._build_schedule('FrodoSpec-Red',
+                                     self.cleaned_data['res_red'],
+                                     self.cleaned_data['exp_count_red'],
+                                     self.cleaned_data['exp_time_red'],
+                                     constraints)]
+
+    def _schedule_fields(self):
+        return [{'Exposure': 'exp_count_' + arm, 'Value': 'exp_time_' + arm, 'Grating': 'res_' + arm}
+                for arm in ('blue', 'red')]
+
+    def _build_schedule(self, device, grating, exp_count, exp_time, constraints):
+        from tom_lt.rtml import SCHEDULES
+        return SCHEDULES[device].render(
+            grating=grating,
+            exp_count=exp_count,
+            exp_time=exp_time,
+            target=self._build_target(),
+            constraints=constraints,
+        )
 
 
 class LTFacility(BaseRoboticObservationFacility):
@@ -498,80 +562,391 @@ class LTFacility(BaseRoboticObservationFacility):
         facility_context_data.update(new_context_data)
         return facility_context_data
 
+    def group_observation_payloads(self, observation_payloads):
+        """Return one RTML payload holding the Schedules of all of ``observation_payloads``, in order.
+
+        The payloads, built by the forms of any of the instruments for any targets, must be for the same
+        proposal. The group is validated and submitted like any other payload, in one exchange with the node
+        agent each, and the observation id of the whole group is its uid.
+        """
+        from tom_lt.rtml import group_documents
+        with span('observation_payload'):
+            return group_documents(list(observation_payloads), new_uid())
+
     def submit_observation(self, observation_payload):
+        observation_payload = RTMLPayload.of(observation_payload)
         if (LT_SETTINGS['DEBUG']):
-            payload = etree.fromstring(observation_payload)
+            from lxml import etree
             f = open("created.rtml", "w")
-            f.write(etree.tostring(payload, encoding="unicode", pretty_print=True))
+            f.write(etree.tostring(observation_payload.tree, encoding="unicode", pretty_print=True))
             f.close()
             return [0]
+        elif self._outbox():
+            from tom_lt.outbox import enqueue
+            return [enqueue(observation_payload)]
         else:
-            headers = {
-                'Username': LT_SETTINGS['username'],
-                'Password': LT_SETTINGS['password']
-            }
-            url = '{0}://{1}:{2}/node_agent2/node_agent?wsdl'.format('http', LT_SETTINGS['LT_HOST'],
-                                                                     LT_SETTINGS['LT_PORT'])
-            client = Client(url=url, headers=headers)
-            # Send payload, and receive response string, removing the encoding tag which causes issue with lxml parsing
-            response = client.service.handle_rtml(observation_payload).replace('encoding="ISO-8859-1"', '')
-            response_rtml = etree.fromstring(response)
-            mode = response_rtml.get('mode')
+            with span('submit_observation'):
+                response_rtml = self._handle_rtml(observation_payload, attempts=self._submission_attempts())
+            mode = response_rtml.mode
             if mode == 'reject':
                 self.dump_request_response(observation_payload, response_rtml)
-            obs_id = response_rtml.get('uid')
+            obs_id = response_rtml.uid
             return [obs_id]
 
+    async def asubmit_observation(self, observation_payload):
+        """Asynchronous version of ``submit_observation``, for async views and background tasks."""
+        from asgiref.sync import sync_to_async
+        observation_payload = RTMLPayload.of(observation_payload)
+        if (LT_SETTINGS['DEBUG']):
+            return self.submit_observation(observation_payload)
+        if self._outbox():
+            from tom_lt.outbox import enqueue
+            return [await sync_to_async(enqueue)(observation_payload)]
+        from tom_lt.async_client import get_async_transport
+        with span('submit_observation'):
+            response_rtml = await get_async_transport(LT_SETTINGS).handle_rtml(
+                observation_payload, attempts=self._submission_attempts())
+        if response_rtml.mode == 'reject':
+            self.dump_request_response(observation_payload, response_rtml)
+        elif response_rtml.mode == 'confirmation':
+            await sync_to_async(validation_cache.confirmed)(observation_payload)
+        return [response_rtml.uid]
+
+    def submit_observations(self, observation_payloads, max_workers=None):
+        """Submit several RTML payloads to the node agent concurrently.
+
+        At most ``max_workers`` payloads (by default ``FACILITIES['LT']['MAX_CONCURRENT_SUBMISSIONS']``)
+        are in flight at once. Returns one dictionary per payload, in input order, holding the
+        ``observation_id`` returned by the node agent, the response ``mode`` and an ``error`` message,
+        which is ``None`` unless that payload was rejected or could not be sent. Payloads that cannot be
+        observed, or read, are rejected without being sent (see ``_visibility_errors``). A failed payload does
+        not stop the rest of the batch. In the ``outbox`` submission mode the payloads are only queued, and their
+        ``mode`` is ``None``.
+        """
+        if LT_SETTINGS['DEBUG'] or self._outbox():
+            return [{'observation_id': self.submit_observation(observation_payload)[0], 'mode': None, 'error': None}
+                    for observation_payload in observation_payloads]
+        if max_workers is None:
+            max_workers = LT_SETTINGS.get('MAX_CONCURRENT_SUBMISSIONS', DEFAULT_MAX_CONCURRENT_SUBMISSIONS)
+        observation_payloads = [RTMLPayload.of(observation_payload) for observation_payload in observation_payloads]
+        results = [{'observation_id': None, 'mode': None, 'error': '\n'.join(errors)} if errors else None
+                   for errors in self._visibility_errors(observation_payloads)]
+        observable = [payload for payload, result in zip(observation_payloads, results) if result is None]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            submitted = iter(executor.map(self._submit_one, observable))
+        return [result or next(submitted) for result in results]
+
+    def _submit_one(self, observation_payload):
+        try:
+            with span('submit_observation'):
+                response_rtml = self._handle_rtml(observation_payload, attempts=self._submission_attempts())
+        except Exception as e:
+            logger.warning('Error submitting RTML to the Liverpool Telescope: %s', e)
+            return {'observation_id': None, 'mode': None, 'error': f'Error with connection to Liverpool Telescope: {e}'}
+        mode = response_rtml.mode
+        error = 'Observation rejected by the Liverpool Telescope' if mode == 'reject' else None
+        return {'observation_id': response_rtml.uid, 'mode': mode, 'error': error}
+
+    def dump_request_response(self, observation_payload, response_rtml):
+        logger.error('RTML rejected by the Liverpool Telescope\nRequest:\n%s\nResponse:\n%s',
+                     observation_payload, response_rtml)
+
+    def _handle_rtml(self, rtml, timeout=None, attempts=1):
+        """Send an RTML document to the node agent and return its ``RTMLResponse``.
+
+        A call that could not connect to the node agent is made up to ``attempts`` times in all, after a
+        jittered backoff, unless the circuit breaker opens meanwhile. Any other failure, such as a timeout
+        waiting for the answer, is raised at once: the node agent may have accepted the document, and sending
+        it again could submit it twice. ``timeout`` overrides ``TIMEOUT`` for the call.
+        """
+        from tom_lt.breaker import retry_delay
+        from tom_lt.client import ConnectionFailed
+        from tom_lt.response import parse_response
+        rtml = RTMLPayload.of(rtml)
+        for attempt in range(attempts):
+            try:
+                reply = self._send_rtml(rtml, timeout)
+                break
+            except ConnectionFailed as e:
+                if attempt == attempts - 1:
+                    raise
+                delay = retry_delay(attempt, LT_SETTINGS.get('RETRY_BACKOFF', DEFAULT_RETRY_BACKOFF))
+                logger.warning('Retrying a call to the Liverpool Telescope in %.1f s after: %s', delay, e)
+                time.sleep(delay)
+        with span('parse_response'):
+            response = parse_response(reply)
+        count(response.mode)
+        if response.mode == 'confirmation':
+            # inquiries for the proposal may be answered differently now
+            validation_cache.confirmed(rtml)
+        return response
+
+    def _send_rtml(self, rtml, timeout):
+        from suds import WebFault
+        from tom_lt.breaker import get_breaker
+        from tom_lt.client import call_timeout, get_client
+        from tom_lt.recording import get_recorder, get_replayer, transport_mode
+        transport = transport_mode(LT_SETTINGS)
+        if transport == 'replay':
+            with span('handle_rtml'):
+                return get_replayer(LT_SETTINGS).handle_rtml(rtml)
+        breaker = get_breaker(LT_SETTINGS)
+        try:
+            breaker.before_call()
+            try:
+                client = get_client(LT_SETTINGS)
+                started = time.perf_counter()
+                with span('handle_rtml'), call_timeout(timeout):
+                    reply = client.service.handle_rtml(rtml)
+                if transport == 'record':
+                    get_recorder(LT_SETTINGS).record(rtml, str(reply), time.perf_counter() - started)
+            except WebFault:
+                # the node agent answered
+                breaker.success()
+                raise
+            except Exception:
+                breaker.failure()
+                raise
+        except Exception:
+            count('transport_error')
+            raise
+        breaker.success()
+        return reply
+
     def cancel_observation(self, observation_id):
-        form = self.get_form()()
-        payload = form._build_prolog()
-        payload.append(form._build_project())
+        """Cancel a submitted observation; return whether the Liverpool Telescope cancelled it."""
+        return self.cancel_observations([observation_id])[observation_id] is None
+
+    def cancel_observations(self, observation_ids, max_workers=None):
+        """Cancel several submitted observations, with one abort document per proposal.
+
+        Returns ``{observation_id: error}`` in the order given, where ``error`` is ``None`` if the observation
+        was cancelled and otherwise says why not. Cancelled observations are set to ``CANCELED``; see
+        ``tom_lt.cancellation``.
+        """
+        from tom_observations.models import ObservationRecord
+        from tom_lt.cancellation import cancel_observations
+        observation_ids = list(dict.fromkeys(observation_ids))
+        if (LT_SETTINGS['DEBUG']):
+            return {observation_id: None for observation_id in observation_ids}
+        records = ObservationRecord.objects.filter(facility=self.name, observation_id__in=observation_ids)
+        if max_workers is None:
+            max_workers = LT_SETTINGS.get('MAX_CONCURRENT_SUBMISSIONS', DEFAULT_MAX_CONCURRENT_SUBMISSIONS)
+        outcomes = cancel_observations(self, LT_SETTINGS, records, max_workers=max_workers)
+        return {observation_id: outcomes.get(observation_id, 'No observation recorded with that id')
+                for observation_id in observation_ids}
 
     def validate_observation(self, observation_payload):
+        return self._validate_observation(observation_payload)
+
+    def _validate_observation(self, observation_payload, schema_checked=False):
         if (LT_SETTINGS['DEBUG']):
             return []
         else:
-            headers = {
-                'Username': LT_SETTINGS['username'],
-                'Password': LT_SETTINGS['password']
-            }
-            url = '{0}://{1}:{2}/node_agent2/node_agent?wsdl'.format('http',
-                                                                     LT_SETTINGS['LT_HOST'],
-                                                                     LT_SETTINGS['LT_PORT'])
-            client = Client(url=url, headers=headers)
-            validate_payload = etree.fromstring(observation_payload)
-            # Change the payload to an inquiry mode document to test connectivity.
-            validate_payload.set('mode', 'inquiry')
-            # Send payload, and receive response string, removing the encoding tag which causes issue with lxml parsing
+            observation_payload = RTMLPayload.of(observation_payload)
+            outcome = self._local_validation(observation_payload, schema_checked)
+            if outcome is not None:
+                return outcome['errors']
             try:
-                response = client.service.handle_rtml(validate_payload).replace('encoding="ISO-8859-1"', '')
+                with span('validate_observation'):
+                    response_rtml = self._handle_rtml(self._inquiry(observation_payload),
+                                                      timeout=self._validation_timeout())
             except Exception as e:
-                return [f'Error with connection to Liverpool Telescope: {e}',
-                        'This could be due to incorrect credentials, or IP / Port settings',
-                        'Occassionally, this could be due to the rebooting of systems at the Telescope Site',
-                        'Please retry at another time.',
-                        'If the problem persists please contact ltsupport_astronomer@ljmu.ac.uk']
-
-            response_rtml = etree.fromstring(response)
-            if response_rtml.get('mode') == 'offer':
-                return []
-            elif response_rtml.get('mode') == 'reject':
-                return ['Error with RTML submission to Liverpool Telescope',
-                        'This can occassionally happen due to systems rebooting at the Telescope Site',
-                        'Please retry at another time.',
-                        'If the problem persists please contact ltsupport_astronomer@ljmu.ac.uk']
+                return self._connection_errors(e)
+            return self._validation_errors(observation_payload, response_rtml)
+
+    async def avalidate_observation(self, observation_payload):
+        """Asynchronous version of ``validate_observation``, for async views and background tasks."""
+        if (LT_SETTINGS['DEBUG']):
+            return []
+        from asgiref.sync import sync_to_async
+        observation_payload = RTMLPayload.of(observation_payload)
+        # the validation cache is the Django cache, which may block or be sync-only (the database cache)
+        outcome = await sync_to_async(self._local_validation)(observation_payload)
+        if outcome is not None:
+            return outcome['errors']
+        from tom_lt.async_client import get_async_transport
+        try:
+            with span('validate_observation'):
+                response_rtml = await get_async_transport(LT_SETTINGS).handle_rtml(
+                    self._inquiry(observation_payload), timeout=self._validation_timeout())
+        except Exception as e:
+            return self._connection_errors(e)
+        return await sync_to_async(self._validation_errors)(observation_payload, response_rtml)
+
+    def _outbox(self):
+        submission_mode = LT_SETTINGS.get('SUBMISSION_MODE', 'direct')
+        if submission_mode not in SUBMISSION_MODES:
+            raise ImproperlyConfigured(f"FACILITIES['LT']['SUBMISSION_MODE'] must be one of {SUBMISSION_MODES}")
+        return submission_mode == 'outbox'
+
+    def _submission_attempts(self):
+        return LT_SETTINGS.get('SUBMISSION_ATTEMPTS', DEFAULT_SUBMISSION_ATTEMPTS)
+
+    def _validation_timeout(self):
+        return LT_SETTINGS.get('VALIDATION_TIMEOUT', DEFAULT_VALIDATION_TIMEOUT)
+
+    def _local_validation(self, observation_payload, schema_checked=False):
+        """Return the validation outcome if it can be decided without an inquiry, otherwise ``None``.
+
+        A payload that breaks the RTML schema (unless ``schema_checked`` says it has been checked already, see
+        ``_schema_errors``) or cannot be observed at all (see ``_visibility_errors``) is turned down first. In
+        ``local`` mode the inquiry is skipped altogether and the node agent only sees the payload when it
+        is submitted; in ``cached`` mode a recent inquiry for the same payload (ignoring its uid) is reused.
+        """
+        if not schema_checked:
+            errors = [error.message for error in self._schema_errors(observation_payload)]
+            if errors:
+                return {'mode': 'reject', 'errors': errors}
+        errors = self._visibility_errors([observation_payload])[0]
+        if errors:
+            return {'mode': 'reject', 'errors': errors}
+        validation_mode = LT_SETTINGS.get('VALIDATION_MODE', 'remote')
+        if validation_mode not in VALIDATION_MODES:
+            raise ImproperlyConfigured(f"FACILITIES['LT']['VALIDATION_MODE'] must be one of {VALIDATION_MODES}")
+        if validation_mode == 'local':
+            return {'mode': None, 'errors': []}
+        if validation_mode == 'cached':
+            return validation_cache.get(observation_payload)
+        return None
+
+    def _schema_errors(self, observation_payload):
+        """Return the ``tom_lt.schema.SchemaError`` of each way the payload breaks the bundled RTML schema.
+
+        With the ``SCHEMA_CHECK`` of ``warn`` the errors are logged and none returned instead.
+        """
+        schema_check = LT_SETTINGS.get('SCHEMA_CHECK', 'warn')
+        if schema_check not in SCHEMA_CHECKS:
+            raise ImproperlyConfigured(f"FACILITIES['LT']['SCHEMA_CHECK'] must be one of {SCHEMA_CHECKS}")
+        if schema_check == 'off':
+            return []
+        from tom_lt.schema import schema_errors
+        with span('schema'):
+            errors = schema_errors(observation_payload)
+        if schema_check == 'warn':
+            for error in errors:
+                logger.warning('RTML payload breaks the schema: %s', error.message)
+            return []
+        return errors
+
+    def _visibility_errors(self, observation_payloads):
+        """Return, for each payload, why it cannot be observed from La Palma, checking all of them in one pass.
+
+        With the ``VISIBILITY_CHECK`` of ``warn`` the reasons are logged and empty lists returned instead.
+        """
+        visibility_check = LT_SETTINGS.get('VISIBILITY_CHECK', 'reject')
+        if visibility_check not in VISIBILITY_CHECKS:
+            raise ImproperlyConfigured(f"FACILITIES['LT']['VISIBILITY_CHECK'] must be one of {VISIBILITY_CHECKS}")
+        if visibility_check == 'off':
+            return [[] for _ in observation_payloads]
+        from tom_lt.visibility import DEFAULT_SUN_ALTITUDE, visibility_errors
+        with span('visibility'):
+            errors = visibility_errors(observation_payloads, self.SITES['La Palma'],
+                                       LT_SETTINGS.get('VISIBILITY_SUN_ALTITUDE', DEFAULT_SUN_ALTITUDE))
+        if visibility_check == 'warn':
+            for payload_errors in errors:
+                for error in payload_errors:
+                    logger.warning(error)
+            return [[] for _ in observation_payloads]
+        return errors
+
+    def _inquiry(self, observation_payload):
+        # Change the payload to an inquiry mode document to test connectivity.
+        return RTMLPayload.of(observation_payload).with_mode('inquiry')
+
+    def _connection_errors(self, e):
+        return [f'Error with connection to Liverpool Telescope: {e}',
+                'This could be due to incorrect credentials, or IP / Port settings',
+                'Occassionally, this could be due to the rebooting of systems at the Telescope Site',
+                'Please retry at another time.',
+                'If the problem persists please contact ltsupport_astronomer@ljmu.ac.uk']
+
+    def _validation_errors(self, observation_payload, response_rtml):
+        mode = response_rtml.mode
+        if mode == 'offer':
+            errors = []
+        elif mode == 'reject':
+            errors = ['Error with RTML submission to Liverpool Telescope',
+                      'This can occassionally happen due to systems rebooting at the Telescope Site',
+                      'Please retry at another time.',
+                      'If the problem persists please contact ltsupport_astronomer@ljmu.ac.uk']
+            errors.extend(response_rtml.errors)
+        else:
+            return None
+        validation_cache.set(observation_payload, mode, errors)
+        return errors
 
     def get_observation_url(self, observation_id):
         return ''
 
     def get_terminal_observing_states(self):
-        return ['IN_PROGRESS', 'COMPLETED']
+        return TERMINAL_STATES
 
     def get_observing_sites(self):
         return self.SITES
 
     def get_observation_status(self, observation_id):
-        return
+        if (LT_SETTINGS['DEBUG']):
+            return self._recorded_status(observation_id)
+        status = parse_statuses(self._status_reply(observation_id)).get(observation_id)
+        if status is None:
+            raise Exception('Observation unknown to the Liverpool Telescope')
+        return status
+
+    def _recorded_status(self, observation_id):
+        """Return the status the TOM already has for an observation, as a stand-in for asking the node agent."""
+        from tom_observations.models import ObservationRecord
+        record = ObservationRecord.objects.filter(facility=self.name, observation_id=observation_id).first()
+        if record is None:
+            return {'state': 'PENDING', 'scheduled_start': None, 'scheduled_end': None}
+        return {'state': record.status or 'PENDING', 'scheduled_start': record.scheduled_start,
+                'scheduled_end': record.scheduled_end}
+
+    def _status_reply(self, observation_id):
+        from tom_observations.models import ObservationRecord
+        parameters = ObservationRecord.objects.filter(
+            facility=self.name, observation_id=observation_id).values_list('parameters', flat=True).first()
+        if not parameters or not parameters.get('project'):
+            raise Exception('No proposal recorded for that observation id')
+        return self._handle_rtml(status_inquiry(parameters['project'], LT_SETTINGS['username'], [observation_id]))
+
+    def update_all_observation_statuses(self, target=None):
+        """Update the status of every open LT observation (of ``target``, if given) in batched inquiries.
+
+        Without a ``target`` (as when run periodically by the ``updatestatus`` management command),
+        observations are only asked about when their poll interval, which grows with their age, has
+        passed. Asking for a single target's observations always polls all of them.
+        """
+        from tom_observations.models import ObservationRecord
+        if (LT_SETTINGS['DEBUG']):
+            return []
+        records = ObservationRecord.objects.filter(facility=self.name).exclude(
+            status__in=self.get_terminal_observing_states())
+        if self._outbox():
+            from tom_lt.outbox import apply_outcomes, undelivered_uids
+            apply_outcomes(self)
+            # the node agent does not know about these yet
+            records = records.exclude(observation_id__in=undelivered_uids())
+        if target:
+            records = records.filter(target=target)
+        max_workers = LT_SETTINGS.get('MAX_CONCURRENT_SUBMISSIONS', DEFAULT_MAX_CONCURRENT_SUBMISSIONS)
+        return update_statuses(self, LT_SETTINGS, records, force=bool(target), max_workers=max_workers)
 
     def data_products(self, observation_id, product_id=None):
-        return []
+        from tom_lt.dataproducts import parse_products
+        if (LT_SETTINGS['DEBUG']):
+            return []
+        products = parse_products(self._status_reply(observation_id), observation_id)
+        if product_id is not None:
+            products = [product for product in products if product['id'] == product_id]
+        return products
+
+    def save_data_products(self, observation_record, product_id=None):
+        """Download the observation's data products not yet in the TOM, several at a time, and save them.
+
+        Files are streamed to ``FACILITIES['LT']['DOWNLOAD_DIR']`` and verified before they are stored;
+        see ``tom_lt.dataproducts``.
+        """
+        from tom_lt.dataproducts import save_data_products
+        products = self.data_products(observation_record.observation_id, product_id)
+        return save_data_products(observation_record, products, LT_SETTINGS)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from tom_lt import outbox
+from tom_lt.lt import LT_SETTINGS, LTFacility
+
+
+class Command(BaseCommand):
+    """
+    Sends the observations queued in the LT submission outbox to the Liverpool Telescope. Runs until
+    interrupted, unless --once is given; start as many as needed, in any number of processes.
+    """
+
+    help = 'Sends the observations queued in the LT submission outbox to the Liverpool Telescope'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Number of submissions sent at once by this process (default: OUTBOX_WORKERS)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Number of submissions claimed at a time (default: OUTBOX_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Stop once no submission is due instead of waiting for more'
+        )
+
+    def handle(self, *args, **options):
+        outbox.run(LTFacility(), LT_SETTINGS, max_workers=options['workers'], batch_size=options['batch_size'],
+                   once=options['once'])
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tom_lt.lt import LT_SETTINGS
+from tom_lt.recording import DEFAULT_RECORDING_DIR, Replayer
+from tom_lt.standin import NodeAgentStandIn
+
+
+class Command(BaseCommand):
+    """
+    Serves a stand-in for the Liverpool Telescope node agent, answering every RTML document from the corpus
+    recorded with 'RTML_TRANSPORT': 'record'. Point LT_HOST and LT_PORT at it to load test a TOM offline.
+    """
+
+    help = 'Serves a stand-in LT node agent that replays recorded replies'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--address',
+            default='127.0.0.1',
+            help='Address to listen on (default: 127.0.0.1)'
+        )
+        parser.add_argument(
+            '--port',
+            type=int,
+            default=8080,
+            help='Port to listen on (default: 8080)'
+        )
+        parser.add_argument(
+            '--recording-dir',
+            help='Directory of the recorded corpus (default: RECORDING_DIR)'
+        )
+        parser.add_argument(
+            '--latency',
+            help="Seconds to wait before each reply, or 'recorded' (default: REPLAY_LATENCY)"
+        )
+
+    def handle(self, *args, **options):
+        directory = options['recording_dir'] or LT_SETTINGS.get('RECORDING_DIR', DEFAULT_RECORDING_DIR)
+        latency = options['latency'] or LT_SETTINGS.get('REPLAY_LATENCY', 0)
+        if latency != 'recorded' and not isinstance(latency, (tuple, list)):
+            try:
+                latency = float(latency)
+            except ValueError:
+                raise CommandError("--latency must be a number of seconds or 'recorded'")
+        replayer = Replayer(directory, latency)
+        if not replayer.replies:
+            raise CommandError('No recorded replies in {0}'.format(directory))
+
+        with NodeAgentStandIn(replayer.handle_rtml, (options['address'], options['port']),
+                              keep_documents=False) as stand_in:
+            self.stdout.write('Replaying {0} recorded replies on {1}:{2}'.format(
+                len(replayer.replies), *stand_in.server_address))
+            try:
+                stand_in.thread.join()
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,58 @@
+"""Timing spans and counters for the work done by the LT facility, sent as Django signals.
+
+Connect a receiver to ``span_finished`` to be told how long each phase of building, validating and
+submitting an observation took. It is sent with ``phase``, ``duration`` (seconds, from
+``time.perf_counter``) and ``failed``, which is true if the phase raised an exception. The phases are:
+
+- ``observation_payload``: building the RTML payload of a form, of which
+  ``target_lookup`` is fetching the ``Target`` and ``coordinates`` is rendering its coordinates
+- ``schema``: checking a payload against the bundled RTML schema, before it is validated or submitted
+- ``visibility``: checking that the targets of one or more payloads can be observed, likewise
+- ``validate_observation`` and ``submit_observation``, synchronous or asynchronous, each of which includes
+- ``wsdl_load``: loading the node agent's WSDL, the first time a client is needed
+- ``handle_rtml``: the round trip to the node agent
+- ``parse_response``: parsing its reply
+
+A receiver of ``event_counted`` is sent the ``event`` of every reply from the node agent, which is the
+reply's RTML mode (``offer``, ``reject``, ``confirmation``, ...), or ``transport_error`` when no reply
+was received. Both signals are sent with ``'LT'`` as the sender::
+
+    from django.dispatch import receiver
+    from tom_lt.metrics import span_finished
+
+    @receiver(span_finished)
+    def record_span(sender, phase, duration, failed, **kwargs):
+        statsd.timing('lt.' + phase, duration * 1000)
+
+Nothing is timed while no receiver is connected.
+"""
+import time
+from contextlib import contextmanager
+
+from django.dispatch import Signal
+
+SENDER = 'LT'
+
+span_finished = Signal()
+event_counted = Signal()
+
+
+@contextmanager
+def span(phase):
+    """Time the enclosed block and send ``span_finished`` for it, if anything is listening."""
+    if not span_finished.has_listeners(SENDER):
+        yield
+        return
+    failed = True
+    start = time.perf_counter()
+    try:
+        yield
+        failed = False
+    finally:
+        span_finished.send(sender=SENDER, phase=phase, duration=time.perf_counter() - start, failed=failed)
+
+
+def count(event):
+    """Send ``event_counted`` for ``event``, if anything is listening."""
+    if event_counted.has_listeners(SENDER):
+        event_counted.send(sender=SENDER, event=event)
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tom_lt', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxsubmission',
+            name='observation_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='outboxsubmission',
+            name='record_status',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+    ]
@@ -0,0 +1,68 @@
+from django.db import models
+from django.utils import timezone
+
+
+class OutboxSubmission(models.Model):
+    """
+    An RTML request waiting to be sent to, or already sent to, the Liverpool Telescope node agent.
+
+    With ``FACILITIES['LT']['SUBMISSION_MODE'] = 'outbox'`` a submitted payload is saved as an
+    ``OutboxSubmission`` and sent by the ``runltoutbox`` management command (see ``tom_lt.outbox``).
+
+    :param uid: The uid of the RTML document, which is the observation id the TOM records for it.
+    :type uid: str
+
+    :param project: The proposal the payload is submitted under.
+    :type project: str
+
+    :param payload: The RTML document.
+    :type payload: str
+
+    :param state: ``queued`` until it is sent, ``sending`` while a worker holds it, then ``sent``,
+        ``rejected`` or ``failed``.
+    :type state: str
+
+    :param attempts: The number of times a worker has claimed it to send it, counting the claim in progress.
+    :type attempts: int
+
+    :param next_attempt: When it is due to be sent (again).
+    :type next_attempt: datetime
+
+    :param lease_expires: When a worker that claimed it, but did not report back, is assumed to have died.
+    :type lease_expires: datetime
+
+    :param error: The reason it was rejected, or the last error sending it.
+    :type error: str
+
+    :param record_status: The status its outcome gives its ``ObservationRecord``, kept until the record exists.
+    :type record_status: str
+
+    :param observation_id: The observation id the node agent gave it, if not its uid, kept with ``record_status``.
+    :type observation_id: str
+    """
+    QUEUED = 'queued'
+    SENDING = 'sending'
+    SENT = 'sent'
+    REJECTED = 'rejected'
+    FAILED = 'failed'
+    STATES = ((QUEUED, 'Queued'), (SENDING, 'Sending'), (SENT, 'Sent'), (REJECTED, 'Rejected'), (FAILED, 'Failed'))
+
+    uid = models.CharField(max_length=64, unique=True)
+    project = models.CharField(max_length=255)
+    payload = models.TextField()
+    state = models.CharField(max_length=10, choices=STATES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    lease_expires = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    record_status = models.CharField(max_length=20, blank=True)
+    observation_id = models.CharField(max_length=64, blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ('next_attempt',)
+        indexes = [models.Index(fields=['state', 'next_attempt'])]
+
+    def __str__(self):
+        return '{0} ({1})'.format(self.uid, self.state)
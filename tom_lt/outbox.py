@@ -0,0 +1,196 @@
+"""A durable outbox for submissions to the Liverpool Telescope.
+
+With ``FACILITIES['LT']['SUBMISSION_MODE'] = 'outbox'``, ``LTFacility.submit_observation`` saves the payload
+as an ``OutboxSubmission`` and returns its uid at once; the TOM records that uid as the observation id.
+Workers started with the ``runltoutbox`` management command send the queued payloads to the node agent and
+write the outcome back to the ``ObservationRecord``: ``PENDING`` once the request is confirmed, ``FAILED``
+if it is rejected or cannot be sent in ``OUTBOX_MAX_ATTEMPTS`` attempts.
+
+Any number of workers, in any number of processes, can drain the outbox. A worker claims a submission with
+a conditional update of its state, so only one worker sends it, and holds it for ``OUTBOX_LEASE`` seconds;
+a submission held by a worker that died is claimed again once its lease has expired. A failed attempt is
+retried after a jittered backoff. Before a payload is sent again, the node agent is asked whether it already
+knows its uid, so that a request whose reply was lost is not submitted again; a request it received without
+recording it yet can still be.
+
+A worker may send a payload before the TOM has saved its ``ObservationRecord``. The outcome is then kept on the
+``OutboxSubmission`` and written to the record by the next drain or status poll that finds it.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import F, Q
+from django.utils import timezone
+
+from tom_lt.breaker import retry_delay
+from tom_lt.payload import RTMLPayload
+from tom_lt.status import parse_statuses, status_inquiry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTBOX_WORKERS = 4
+DEFAULT_OUTBOX_BATCH_SIZE = 20
+DEFAULT_OUTBOX_MAX_ATTEMPTS = 10
+DEFAULT_OUTBOX_RETRY_INTERVAL = 60
+MAX_OUTBOX_RETRY_INTERVAL = 3600
+DEFAULT_OUTBOX_LEASE = 600
+DEFAULT_OUTBOX_POLL_INTERVAL = 5
+
+
+def _model():
+    if not apps.is_installed('tom_lt'):
+        raise ImproperlyConfigured("Add 'tom_lt' to INSTALLED_APPS to use the LT submission outbox")
+    from tom_lt.models import OutboxSubmission
+    return OutboxSubmission
+
+
+def enqueue(observation_payload):
+    """Save an RTML payload to the outbox, unless its uid is there already, and return its uid."""
+    OutboxSubmission = _model()
+    observation_payload = RTMLPayload.of(observation_payload)
+    uid = observation_payload.tree.get('uid')
+    OutboxSubmission.objects.get_or_create(uid=uid, defaults={
+        'project': observation_payload.project,
+        'payload': observation_payload,
+    })
+    return uid
+
+
+def undelivered_uids():
+    """Return a queryset of the uids of queued submissions the node agent does not know about yet."""
+    OutboxSubmission = _model()
+    return OutboxSubmission.objects.filter(
+        state__in=[OutboxSubmission.QUEUED, OutboxSubmission.SENDING]).values('uid')
+
+
+def claim(batch_size, lease, now):
+    """Claim up to ``batch_size`` submissions that are due for this worker, for ``lease`` seconds."""
+    OutboxSubmission = _model()
+    due = (Q(state=OutboxSubmission.QUEUED, next_attempt__lte=now)
+           | Q(state=OutboxSubmission.SENDING, lease_expires__lte=now))
+    claimed = []
+    for pk in OutboxSubmission.objects.filter(due).values_list('pk', flat=True)[:batch_size]:
+        # another worker may have claimed it since it was read
+        if OutboxSubmission.objects.filter(due, pk=pk).update(
+                state=OutboxSubmission.SENDING, lease_expires=now + timedelta(seconds=lease),
+                attempts=F('attempts') + 1):
+            claimed.append(pk)
+    return list(OutboxSubmission.objects.filter(pk__in=claimed))
+
+
+def send(facility, lt_settings, submission):
+    """Send one claimed submission; return ``(response, status, error)``, of which only one is set.
+
+    ``status`` is the state the node agent reports for a uid it already knew about.
+    """
+    try:
+        if submission.attempts > 1:
+            statuses = parse_statuses(facility._handle_rtml(
+                status_inquiry(submission.project, lt_settings['username'], [submission.uid])))
+            if submission.uid in statuses:
+                return None, statuses[submission.uid], None
+        return facility._handle_rtml(submission.payload), None, None
+    except Exception as e:
+        logger.warning('Error sending %s to the Liverpool Telescope: %s', submission.uid, e)
+        return None, None, e
+
+
+def record_outcome(facility, lt_settings, submission, response, status, error, now):
+    """Save the outcome of sending ``submission`` to it and to its ``ObservationRecord``."""
+    from tom_observations.models import ObservationRecord
+    OutboxSubmission = _model()
+    record = ObservationRecord.objects.filter(facility=facility.name, observation_id=submission.uid).first()
+    record_status = None
+    if response is not None and response.mode == 'reject':
+        facility.dump_request_response(submission.payload, response)
+        submission.state = OutboxSubmission.REJECTED
+        submission.error = '\n'.join(response.errors) or 'Observation rejected by the Liverpool Telescope'
+        record_status = 'FAILED'
+    elif response is not None or status is not None:
+        submission.state = OutboxSubmission.SENT
+        submission.error = ''
+        record_status = status['state'] if status is not None else 'PENDING'
+        if response is not None and response.uid and response.uid != submission.uid and record is not None:
+            record.observation_id = response.uid
+    elif submission.attempts >= lt_settings.get('OUTBOX_MAX_ATTEMPTS', DEFAULT_OUTBOX_MAX_ATTEMPTS):
+        submission.state = OutboxSubmission.FAILED
+        submission.error = str(error)
+        record_status = 'FAILED'
+    else:
+        submission.state = OutboxSubmission.QUEUED
+        submission.error = str(error)
+        interval = lt_settings.get('OUTBOX_RETRY_INTERVAL', DEFAULT_OUTBOX_RETRY_INTERVAL)
+        delay = min(retry_delay(submission.attempts - 1, interval), MAX_OUTBOX_RETRY_INTERVAL)
+        submission.next_attempt = now + timedelta(seconds=max(delay, 1))
+    submission.lease_expires = None
+    if record is None and record_status is not None:
+        logger.info('No observation record for %s yet, its status will be set to %s once there is one',
+                    submission.uid, record_status)
+        submission.record_status = record_status
+        if response is not None and response.uid and response.uid != submission.uid:
+            submission.observation_id = response.uid
+    submission.save(update_fields=['state', 'error', 'next_attempt', 'lease_expires', 'record_status',
+                                   'observation_id', 'modified'])
+    if record is not None and record_status is not None:
+        record.status = record_status
+        record.save()
+
+
+def apply_outcomes(facility):
+    """Write the outcomes kept for want of an ``ObservationRecord`` to the records saved since.
+
+    Returns the number of records updated.
+    """
+    from tom_observations.models import ObservationRecord
+    OutboxSubmission = _model()
+    applied = 0
+    for submission in OutboxSubmission.objects.exclude(record_status=''):
+        record = ObservationRecord.objects.filter(facility=facility.name, observation_id=submission.uid).first()
+        if record is None:
+            continue
+        record.status = submission.record_status
+        if submission.observation_id:
+            record.observation_id = submission.observation_id
+        record.save()
+        submission.record_status = submission.observation_id = ''
+        submission.save(update_fields=['record_status', 'observation_id', 'modified'])
+        applied += 1
+    return applied
+
+
+def drain(facility, lt_settings, max_workers=None, batch_size=None):
+    """Claim one batch of due submissions, send them concurrently and save the outcomes.
+
+    Returns the number of submissions sent.
+    """
+    max_workers = max_workers or lt_settings.get('OUTBOX_WORKERS', DEFAULT_OUTBOX_WORKERS)
+    batch_size = batch_size or lt_settings.get('OUTBOX_BATCH_SIZE', DEFAULT_OUTBOX_BATCH_SIZE)
+    apply_outcomes(facility)
+    now = timezone.now()
+    submissions = claim(batch_size, lt_settings.get('OUTBOX_LEASE', DEFAULT_OUTBOX_LEASE), now)
+    if not submissions:
+        return 0
+
+    def send_one(submission):
+        return send(facility, lt_settings, submission)
+
+    # the database is only written to from this thread
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for submission, outcome in zip(submissions, executor.map(send_one, submissions)):
+            record_outcome(facility, lt_settings, submission, *outcome, now=timezone.now())
+    return len(submissions)
+
+
+def run(facility, lt_settings, max_workers=None, batch_size=None, once=False):
+    """Drain the outbox until interrupted, or until it has nothing due if ``once`` is set."""
+    poll_interval = lt_settings.get('OUTBOX_POLL_INTERVAL', DEFAULT_OUTBOX_POLL_INTERVAL)
+    while True:
+        sent = drain(facility, lt_settings, max_workers, batch_size)
+        if once and not sent:
+            return
+        if not sent:
+            time.sleep(poll_interval)
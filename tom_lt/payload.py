@@ -0,0 +1,92 @@
+"""RTML payloads that keep what has been worked out about them on their way to the node agent.
+
+A payload is built as text (see ``tom_lt.rtml``), and most of what happens to it before it is sent needs
+its tree: the schema and visibility checks, the validation cache and the outbox. An ``RTMLPayload`` is the
+text of a payload, a ``str`` it can be stored, logged and sent as, which parses its UTF-8 bytes the first
+time its tree is needed and keeps the tree, the bytes, its fingerprint and its proposal from then on. The
+tree is shared by everything that looks at the payload, so it must not be changed.
+
+The inquiry sent to validate a payload only differs from it in the ``mode`` of the root, so it is made by
+rewriting that attribute in the text, and shares the fingerprint and proposal of the payload.
+"""
+import hashlib
+import re
+from functools import cached_property
+
+# the attributes of the first element of a document are those of the RTML root
+ROOT_MODE = re.compile(r'(<RTML\b[^>]*?\smode=")([^"]*)(")')
+# the attributes of the root the fingerprint of a payload ignores
+VOLATILE_ATTRIBUTES = ('uid', 'mode')
+
+
+class RTMLPayload(str):
+    """The text of an RTML document, with its parsed ``tree`` and ``encoded`` bytes kept once worked out."""
+
+    def __new__(cls, text, tree=None):
+        payload = super().__new__(cls, text)
+        if tree is not None:
+            payload.__dict__['tree'] = tree
+        return payload
+
+    @classmethod
+    def of(cls, observation_payload):
+        """Return ``observation_payload`` as an ``RTMLPayload``, without copying it if it is one already."""
+        if isinstance(observation_payload, cls):
+            return observation_payload
+        return cls(observation_payload)
+
+    @cached_property
+    def encoded(self):
+        return self.encode('utf-8')
+
+    @cached_property
+    def tree(self):
+        """The root element of the payload; raises ``lxml.etree.XMLSyntaxError`` if it is not well-formed."""
+        from lxml import etree
+        return etree.fromstring(self.encoded)
+
+    @cached_property
+    def mode(self):
+        match = ROOT_MODE.search(self)
+        return match.group(2) if match else self.tree.get('mode')
+
+    @cached_property
+    def project(self):
+        project = self.tree.find('{*}Project')
+        return project.get('ProjectID', '') if project is not None else ''
+
+    @cached_property
+    def fingerprint(self):
+        """A hash of the canonical form of the payload that ignores the ``uid`` and ``mode`` of its root.
+
+        Two payloads built from the same form data a few seconds apart only differ in their uid, so they
+        share a fingerprint.
+        """
+        from lxml import etree
+        rtml = self.tree
+        digest = hashlib.sha256(rtml.tag.encode('utf-8'))
+        for name, value in sorted(rtml.attrib.items()):
+            if name not in VOLATILE_ATTRIBUTES:
+                digest.update('\0{0}={1}'.format(name, value).encode('utf-8'))
+        # comments and processing instructions make no difference to the node agent
+        for child in rtml.iterchildren(etree.Element):
+            digest.update(etree.tostring(child, method='c14n', with_tail=False))
+        return digest.hexdigest()
+
+    def with_mode(self, mode):
+        """Return the payload in ``mode``, rewriting only the ``mode`` attribute of its root."""
+        if self.mode == mode:
+            return self
+        text, replaced = ROOT_MODE.subn(lambda match: match.group(1) + mode + match.group(3), self, count=1)
+        if not replaced:
+            # the root is not written the way lxml writes it
+            from copy import deepcopy
+            from lxml import etree
+            rtml = deepcopy(self.tree)
+            rtml.set('mode', mode)
+            text = etree.tostring(rtml, encoding='unicode')
+        payload = RTMLPayload(text)
+        for name in ('fingerprint', 'project'):
+            if name in self.__dict__:
+                payload.__dict__[name] = self.__dict__[name]
+        return payload
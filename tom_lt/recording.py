@@ -0,0 +1,231 @@
+"""Recording the exchanges with the node agent, and replaying them without it.
+
+``FACILITIES['LT']['RTML_TRANSPORT']`` chooses how RTML documents are sent:
+
+- ``'node_agent'`` (the default) sends them to the node agent at ``LT_HOST``:``LT_PORT``.
+- ``'record'`` sends them to the node agent too, and appends each document, the reply and the time the
+  reply took to a corpus in ``RECORDING_DIR``. A background thread writes the corpus, so recording adds
+  no disk I/O to the call.
+- ``'replay'`` never connects to anything: each document is answered from the corpus after
+  ``REPLAY_LATENCY``.
+
+The ``runltstandin`` management command serves a corpus over SOAP instead, for TOMs (or load generators)
+that should talk to a node agent over the network.
+
+A corpus is a directory of gzipped JSON Lines files, one per recording process. A document is answered
+with the reply recorded for the same document, ignoring its uid (which is new for every document), or
+failing that with one of the replies recorded for a document of the same mode (an inquiry, a request,
+...), in turn; the uid of the reply is set to the uid of the document.
+"""
+import atexit
+import gzip
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from hashlib import sha1
+
+from django.core.exceptions import ImproperlyConfigured
+
+logger = logging.getLogger(__name__)
+
+RTML_TRANSPORTS = ('node_agent', 'record', 'replay')
+DEFAULT_RECORDING_DIR = os.path.join(tempfile.gettempdir(), 'tom_lt_recordings')
+DEFAULT_REPLAY_LATENCY = 0
+
+# the attributes of the first element of a document are those of the RTML root
+ROOT_UID = re.compile(r'(<RTML\b[^>]*?\suid=")([^"]*)(")')
+ROOT_MODE = re.compile(r'<RTML\b[^>]*?\smode="([^"]*)"')
+
+_recorders = {}
+_replayers = {}
+_lock = threading.Lock()
+
+
+class NotRecorded(LookupError):
+    """Raised when a corpus holds no reply for a document."""
+
+
+def transport_mode(lt_settings):
+    """Return the ``RTML_TRANSPORT`` of ``lt_settings``."""
+    mode = lt_settings.get('RTML_TRANSPORT', 'node_agent')
+    if mode not in RTML_TRANSPORTS:
+        raise ImproperlyConfigured(f"FACILITIES['LT']['RTML_TRANSPORT'] must be one of {RTML_TRANSPORTS}")
+    return mode
+
+
+def document_key(document):
+    """Return the key under which the reply to ``document`` is recorded: a hash of it without its uid."""
+    return sha1(ROOT_UID.sub(r'\1\3', document, count=1).encode('utf-8')).hexdigest()
+
+
+def _root_uid(document):
+    match = ROOT_UID.search(document)
+    return match.group(2) if match else None
+
+
+def _root_mode(document):
+    match = ROOT_MODE.search(document)
+    return match.group(1) if match else None
+
+
+class Recorder:
+    """Append exchanges with the node agent to a corpus file in ``directory``, from a background thread."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, 'rtml-{0}-{1}.jsonl.gz'.format(os.getpid(), uuid.uuid4().hex[:8]))
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, name='tom_lt recorder', daemon=True)
+        self._thread.start()
+
+    def record(self, document, reply, elapsed):
+        """Queue an exchange to be written; ``elapsed`` is the time the reply took, in seconds."""
+        self._queue.put({'document': document, 'reply': reply, 'elapsed': round(elapsed, 6)})
+
+    def close(self):
+        """Write the exchanges still queued and stop the writer thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write(self):
+        os.makedirs(self.directory, exist_ok=True)
+        stopping = False
+        while not stopping:
+            exchanges = [self._queue.get()]
+            # write whatever else has been queued meanwhile as one gzip member
+            while True:
+                try:
+                    exchanges.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in exchanges:
+                stopping = True
+                exchanges = [exchange for exchange in exchanges if exchange is not None]
+            if not exchanges:
+                continue
+            try:
+                with gzip.open(self.path, 'at', encoding='utf-8') as corpus:
+                    for exchange in exchanges:
+                        corpus.write(json.dumps(exchange, separators=(',', ':')) + '\n')
+            except OSError as e:
+                logger.warning('Could not record %s exchanges with the node agent to %s: %s',
+                               len(exchanges), self.path, e)
+
+
+class Replayer:
+    """Answer RTML documents from the corpus in ``directory``.
+
+    ``latency`` is the delay before each answer: a number of seconds, a ``(low, high)`` range the delay is
+    drawn from, or ``'recorded'`` for the time the recorded reply took.
+    """
+
+    def __init__(self, directory, latency=DEFAULT_REPLAY_LATENCY):
+        self.latency = latency
+        self.replies = {}
+        by_mode = {}
+        for exchange in load_corpus(directory):
+            entry = (exchange['reply'], _root_uid(exchange['document']), exchange['elapsed'])
+            self.replies[document_key(exchange['document'])] = entry
+            by_mode.setdefault(_root_mode(exchange['document']), []).append(entry)
+        # itertools.cycle is safe to share between threads under the GIL
+        self._by_mode = {mode: itertools.cycle(entries) for mode, entries in by_mode.items()}
+        logger.info('Replaying %s recorded replies from %s', len(self.replies), directory)
+
+    def reply(self, document):
+        """Return ``(reply, delay)``: the recorded reply to ``document`` and how long to wait before it."""
+        entry = self.replies.get(document_key(document))
+        if entry is None:
+            entries = self._by_mode.get(_root_mode(document))
+            if entries is None:
+                raise NotRecorded('No reply to a document like this one has been recorded')
+            entry = next(entries)
+        reply, recorded_uid, elapsed = entry
+        uid = _root_uid(document)
+        if uid is not None and recorded_uid is not None and recorded_uid != uid:
+            reply = reply.replace('uid="{0}"'.format(recorded_uid), 'uid="{0}"'.format(uid), 1)
+        return reply, self._delay(elapsed)
+
+    def handle_rtml(self, document):
+        """Answer ``document`` like the node agent would: after the latency."""
+        reply, delay = self.reply(document)
+        if delay:
+            time.sleep(delay)
+        return reply
+
+    def _delay(self, elapsed):
+        if self.latency == 'recorded':
+            return elapsed
+        if isinstance(self.latency, (tuple, list)):
+            return random.uniform(*self.latency)
+        return self.latency
+
+
+def load_corpus(directory):
+    """Yield the exchanges recorded in ``directory``, oldest file first."""
+    if not os.path.isdir(directory):
+        return
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.jsonl.gz')]
+    for path in sorted(paths, key=os.path.getmtime):
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as corpus:
+                for line in corpus:
+                    yield json.loads(line)
+        except (EOFError, OSError, ValueError) as e:
+            # the recording process may have been killed in the middle of a write
+            logger.warning('Stopped reading the truncated recording %s: %s', path, e)
+
+
+def get_recorder(lt_settings):
+    """Return this process's recorder for the ``RECORDING_DIR`` of ``lt_settings``."""
+    directory = lt_settings.get('RECORDING_DIR', DEFAULT_RECORDING_DIR)
+    recorder = _recorders.get(directory)
+    if recorder is None:
+        with _lock:
+            recorder = _recorders.get(directory)
+            if recorder is None:
+                recorder = _recorders[directory] = Recorder(directory)
+    return recorder
+
+
+def get_replayer(lt_settings):
+    """Return the replayer of the ``RECORDING_DIR`` of ``lt_settings``, loading its corpus the first time."""
+    directory = lt_settings.get('RECORDING_DIR', DEFAULT_RECORDING_DIR)
+    latency = lt_settings.get('REPLAY_LATENCY', DEFAULT_REPLAY_LATENCY)
+    key = (directory, tuple(latency) if isinstance(latency, list) else latency)
+    replayer = _replayers.get(key)
+    if replayer is None:
+        with _lock:
+            replayer = _replayers.get(key)
+            if replayer is None:
+                replayer = _replayers[key] = Replayer(directory, latency)
+    return replayer
+
+
+def close_recorders():
+    """Write out and forget every recorder, and forget every loaded corpus."""
+    with _lock:
+        for recorder in _recorders.values():
+            recorder.close()
+        _recorders.clear()
+        _replayers.clear()
+
+
+def _reset_after_fork():
+    # the writer threads do not survive a fork; the child starts recorders (and files) of its own
+    global _lock
+    _lock = threading.Lock()
+    _recorders.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+atexit.register(close_recorders)
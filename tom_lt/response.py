@@ -0,0 +1,107 @@
+"""Parsing of the RTML documents returned by the node agent.
+
+The node agent replies with an ISO-8859-1 RTML document. Most callers only need the ``mode`` and ``uid``
+attributes of its root element, so the reply is fed to lxml a few kilobytes at a time and parsing stops
+as soon as the root element has been read. The whole document is only parsed the first time its errors,
+schedules or tree are asked for. A ``str`` reply is fed to lxml as it is and a
+``bytes`` reply is decoded by lxml according to its XML declaration, so the document is never copied or
+rewritten as a whole.
+"""
+from datetime import datetime
+from functools import cached_property
+from typing import NamedTuple, Optional, Tuple
+
+from lxml import etree
+
+# Fed to the parser at a time. Small chunks keep the copies of a str reply small and are parsed as fast as
+# the whole document at once.
+CHUNK_SIZE = 4096
+
+
+class Schedule(NamedTuple):
+    """A ``Schedule`` of a reply, as reported by the node agent for a submitted request."""
+    uid: Optional[str]
+    mode: Optional[str]
+    start: Optional[datetime]
+    end: Optional[datetime]
+    # (url, md5) of each ImageData element; md5 is None if the node agent did not give one
+    images: Tuple[Tuple[str, Optional[str]], ...]
+
+
+class RTMLResponse:
+    """An RTML reply of the node agent.
+
+    ``mode`` and ``uid`` are read from the root element when the response is created. ``errors``,
+    ``schedules`` and ``root`` (the lxml element of the whole document) parse the rest of it on first use.
+    ``document`` is the reply as it was received.
+    """
+
+    def __init__(self, document):
+        self.document = document
+        parser = etree.XMLPullParser(events=('start',), tag='{*}RTML')
+        root = None
+        for offset in range(0, len(document), CHUNK_SIZE):
+            parser.feed(document[offset:offset + CHUNK_SIZE])
+            for _, root in parser.read_events():
+                break
+            if root is not None:
+                break
+        else:
+            # raises the syntax error of a document without a root element
+            parser.close()
+        if root is None:
+            # a well-formed reply that is not RTML, such as an HTML error page; the arguments are the message,
+            # the libxml2 error code, the line and the column
+            raise etree.XMLSyntaxError('The reply of the node agent has no RTML element', None, 1, 1)
+        self.mode = root.get('mode')
+        self.uid = root.get('uid')
+
+    def __repr__(self):
+        return '<RTMLResponse mode={0!r} uid={1!r}>'.format(self.mode, self.uid)
+
+    def __str__(self):
+        if isinstance(self.document, str):
+            return self.document
+        return etree.tostring(self.root, encoding='unicode')
+
+    @cached_property
+    def root(self):
+        # a parser without events is faster than resuming the pull parser, even from the start
+        parser = etree.XMLParser()
+        for offset in range(0, len(self.document), CHUNK_SIZE):
+            parser.feed(self.document[offset:offset + CHUNK_SIZE])
+        return parser.close()
+
+    @cached_property
+    def errors(self):
+        """The text of every ``Error`` element of the reply, in document order."""
+        return [' '.join(error.itertext()).strip() for error in self.root.iter('{*}Error')]
+
+    @cached_property
+    def schedules(self):
+        """The ``Schedule`` elements of the reply, in document order."""
+        return [_schedule(schedule) for schedule in self.root.iter('{*}Schedule')]
+
+
+def _datetime(element):
+    return None if element is None else datetime.fromisoformat(element.get('value'))
+
+
+def _schedule(schedule):
+    images = []
+    for image_data in schedule.iter('{*}ImageData'):
+        url = (image_data.text or '').strip()
+        if url:
+            images.append((url, image_data.get('md5')))
+    return Schedule(
+        uid=schedule.get('uid'),
+        mode=schedule.get('mode'),
+        start=_datetime(schedule.find('{*}DateTimeStart')),
+        end=_datetime(schedule.find('{*}DateTimeEnd')),
+        images=tuple(images),
+    )
+
+
+def parse_response(document):
+    """Return the ``RTMLResponse`` for the ``str`` or ``bytes`` returned by ``handle_rtml``."""
+    return RTMLResponse(document)
@@ -0,0 +1,217 @@
+"""Precompiled RTML skeletons for the observation payloads.
+
+Each fragment of a payload (the document, the project, one schedule per instrument device, the target and
+the constraints) is built once with lxml when the module is imported, with ``{slot}`` placeholders in
+place of its variable text and attributes, and serialized to a template. A payload is assembled by filling
+the slots with escaped values, which gives exactly the text lxml would serialize for the equivalent tree.
+"""
+import re
+from copy import deepcopy
+
+from lxml import etree
+
+from tom_lt.coordinates import format_coordinates
+from tom_lt.payload import RTMLPayload
+
+LT_XML_NS = 'http://www.rtml.org/v3.1a'
+LT_XSI_NS = 'http://www.w3.org/2001/XMLSchema-instance'
+LT_SCHEMA_LOCATION = 'http://www.rtml.org/v3.1a http://telescope.livjm.ac.uk/rtml/RTML-nightly.xsd'
+
+SLOT = re.compile(r'\{(\w+)\}')
+INVALID_XML_CHARACTERS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+# lxml escapes attribute values more than text
+TEXT_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '\r': '&#13;'})
+ATTRIBUTE_ESCAPES = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;',
+                                   '\n': '&#10;', '\r': '&#13;', '\t': '&#9;'})
+
+
+def _check(value):
+    value = str(value)
+    if INVALID_XML_CHARACTERS.search(value):
+        raise ValueError('All strings must be XML compatible: Unicode or ASCII, no NULL bytes or control characters')
+    return value
+
+
+class Skeleton:
+    """An RTML fragment serialized once, to be filled in per request.
+
+    ``element`` is an lxml tree whose variable text and attribute values are ``{slot}`` placeholders; the
+    placeholders in ``fragments`` stand for RTML rendered by other skeletons and are inserted unescaped.
+    With ``children``, the fragment is the sequence of the element's children rather than the element itself.
+    """
+
+    def __init__(self, element, fragments=(), children=False):
+        if children:
+            self.template = ''.join(etree.tostring(child, encoding='unicode') for child in element)
+        else:
+            self.template = etree.tostring(element, encoding='unicode')
+        self.fragments = frozenset(fragments)
+        escapes = {}
+        for node in element.iter():
+            for value in node.attrib.values():
+                escapes.update(dict.fromkeys(SLOT.findall(value), ATTRIBUTE_ESCAPES))
+            for value in (node.text, node.tail):
+                escapes.update(dict.fromkeys(SLOT.findall(value or ''), TEXT_ESCAPES))
+        self.escapes = {slot: table for slot, table in escapes.items() if slot not in self.fragments}
+
+    def render(self, **values):
+        for slot, table in self.escapes.items():
+            values[slot] = _check(values[slot]).translate(table)
+        return self.template.format(**values)
+
+
+def _document():
+    schemaLocation = etree.QName(LT_XSI_NS, 'schemaLocation')
+    rtml = etree.Element('RTML', {schemaLocation: LT_SCHEMA_LOCATION}, xmlns=LT_XML_NS,
+                         mode='{mode}', uid='{uid}', version='3.1a', nsmap={'xsi': LT_XSI_NS})
+    rtml.text = '{body}'
+    return Skeleton(rtml, fragments=['body'])
+
+
+def _project():
+    project = etree.Element('Project', ProjectID='{project}')
+    contact = etree.SubElement(project, 'Contact')
+    etree.SubElement(contact, 'Username').text = '{username}'
+    etree.SubElement(contact, 'Name').text = ''
+    return Skeleton(project)
+
+
+def _constraints():
+    airmass_const = etree.Element('AirmassConstraint', maximum='{max_airmass}')
+
+    sky_const = etree.Element('SkyConstraint')
+    etree.SubElement(sky_const, 'Flux').text = '{max_skybri}'
+    etree.SubElement(sky_const, 'Units').text = 'magnitudes/square-arcsecond'
+
+    seeing_const = etree.Element('SeeingConstraint', maximum='{max_seeing}', units='arcseconds')
+
+    photom_const = etree.Element('ExtinctionConstraint')
+    etree.SubElement(photom_const, 'Clouds').text = '{photometric}'
+
+    date_const = etree.Element('DateTimeConstraint', type='include')
+    etree.SubElement(date_const, 'DateTimeStart', system='UT', value='{start}')
+    etree.SubElement(date_const, 'DateTimeEnd', system='UT', value='{end}')
+
+    # the constraints are consecutive children of a Schedule
+    schedule = etree.Element('Schedule')
+    schedule.extend([airmass_const, sky_const, seeing_const, photom_const, date_const])
+    return Skeleton(schedule, children=True)
+
+
+def _target():
+    target = etree.Element('Target', name='{name}')
+    coordinates = etree.SubElement(target, 'Coordinates')
+    ra = etree.SubElement(coordinates, 'RightAscension')
+    etree.SubElement(ra, 'Hours').text = '{Hours}'
+    etree.SubElement(ra, 'Minutes').text = '{Minutes}'
+    etree.SubElement(ra, 'Seconds').text = '{Seconds}'
+
+    dec = etree.SubElement(coordinates, 'Declination')
+    etree.SubElement(dec, 'Degrees').text = '{Degrees}'
+    etree.SubElement(dec, 'Arcminutes').text = '{Arcminutes}'
+    etree.SubElement(dec, 'Arcseconds').text = '{Arcseconds}'
+    etree.SubElement(coordinates, 'Equinox').text = '{Equinox}'
+    return Skeleton(target)
+
+
+def _schedule(name, device_type, spectral_region, setup):
+    """A Schedule for one device; ``setup`` adds the device's Setup children to the given element."""
+    schedule = etree.Element('Schedule')
+    device = etree.SubElement(schedule, 'Device', name=name, type=device_type)
+    etree.SubElement(device, 'SpectralRegion').text = spectral_region
+    setup(etree.SubElement(device, 'Setup'))
+    exposure = etree.SubElement(schedule, 'Exposure', count='{exp_count}')
+    etree.SubElement(exposure, 'Value', units='seconds').text = '{exp_time}'
+    exposure.tail = '{target}{constraints}'
+    return Skeleton(schedule, fragments=['target', 'constraints'])
+
+
+def _binning(setup, x, y):
+    detector = etree.SubElement(setup, 'Detector')
+    binning = etree.SubElement(detector, 'Binning')
+    etree.SubElement(binning, 'X', units='pixels').text = x
+    etree.SubElement(binning, 'Y', units='pixels').text = y
+
+
+def _filter_setup(filter, x, y):
+    def setup(element):
+        etree.SubElement(element, 'Filter', type=filter)
+        _binning(element, x, y)
+    return setup
+
+
+def _grating_setup(x=None, y=None):
+    def setup(element):
+        etree.SubElement(element, 'Grating', name='{grating}')
+        if x is not None:
+            _binning(element, x, y)
+    return setup
+
+
+def _observation_reference():
+    return Skeleton(etree.Element('Schedule', uid='{observation_id}'))
+
+
+DOCUMENT = _document()
+PROJECT = _project()
+CONSTRAINTS = _constraints()
+TARGET = _target()
+# refers to a submitted request, by its uid, in a status inquiry
+OBSERVATION_REFERENCE = _observation_reference()
+
+# Schedule skeletons, keyed by the RTML device name
+SCHEDULES = {
+    'IO:O': _schedule('IO:O', 'camera', 'optical', _filter_setup('{filter}', '{binning_x}', '{binning_y}')),
+    'IO:I': _schedule('IO:I', 'camera', 'infrared', _filter_setup('H', '1', '1')),
+    'Sprat': _schedule('Sprat', 'spectrograph', 'optical', _grating_setup('1', '1')),
+    'FrodoSpec-Blue': _schedule('FrodoSpec-Blue', 'spectrograph', 'optical', _grating_setup()),
+    'FrodoSpec-Red': _schedule('FrodoSpec-Red', 'spectrograph', 'optical', _grating_setup()),
+}
+
+
+def _position(target, start, end):
+    # Target.NON_SIDEREAL, without importing the models
+    if getattr(target, 'type', None) != 'NON_SIDEREAL':
+        return target.ra, target.dec, target.epoch
+    if start is None or end is None:
+        raise ValueError('The coordinates of a non-sidereal target depend on the time window')
+    from tom_lt.ephemeris import position
+    ra, dec = position(target, start, end)
+    return ra, dec, 2000.0
+
+
+def render_targets(targets, start=None, end=None):
+    """Render the RTML ``Target`` element of each of ``targets``, converting all their coordinates at once.
+
+    Non-sidereal targets are given their J2000 coordinates in the middle of the window from ``start`` to
+    ``end`` (seconds since the Unix epoch), which is then required.
+    """
+    positions = [_position(target, start, end) for target in targets]
+    fields = format_coordinates([ra for ra, _, _ in positions], [dec for _, dec, _ in positions],
+                                [epoch for _, _, epoch in positions])
+    return [TARGET.render(name=target.name, **coordinate_fields)
+            for target, coordinate_fields in zip(targets, fields)]
+
+
+def group_documents(documents, uid):
+    """Merge RTML documents into an ``RTMLPayload`` with the given ``uid``, holding all their Schedules in order.
+
+    The documents, which may be for different instruments and targets, must share their mode and Project.
+    """
+    if not documents:
+        raise ValueError('No RTML documents to group')
+    documents = [RTMLPayload.of(document) for document in documents]
+    # the trees of the documents are shared, so the group is made of copies of their elements
+    group = deepcopy(documents[0].tree)
+    project = etree.tostring(group.find('{*}Project'))
+    for document in documents[1:]:
+        rtml = document.tree
+        if rtml.get('mode') != group.get('mode'):
+            raise ValueError('Only RTML documents of the same mode can be grouped')
+        if etree.tostring(rtml.find('{*}Project')) != project:
+            raise ValueError('Only RTML documents for the same proposal can be grouped')
+        group.extend(deepcopy(schedule) for schedule in rtml.iterfind('{*}Schedule'))
+    group.set('uid', uid)
+    # the tree of the group is complete, so it need not be parsed again
+    return RTMLPayload(etree.tostring(group, encoding='unicode'), group)
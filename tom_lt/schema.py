@@ -0,0 +1,82 @@
+"""Validation of RTML payloads against the schema bundled in ``tom_lt/schemas``, without the node agent.
+
+The schema is a local subset of RTML 3.1a covering the documents tom_lt writes, not the published RTML
+schema, so a payload it turns down is only rejected by default when ``SCHEMA_CHECK`` says so.
+
+The schema is compiled into an ``lxml.etree.XMLSchema`` the first time a thread validates a payload and
+reused for every payload after that: an ``XMLSchema`` keeps the errors of its last validation, so threads do
+not share one. Validating a payload takes a fraction of a millisecond, so a malformed payload (an exposure
+of no time, a window that is not a date, ...) is turned down before any inquiry is sent.
+"""
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+from lxml import etree
+
+from tom_lt.payload import RTMLPayload
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schemas', 'rtml-3.1a-subset.xsd')
+
+NAMESPACE = re.compile(r'\{[^}]*\}')
+ATTRIBUTE = re.compile(r"attribute '(\w+)'")
+
+_local = threading.local()
+
+
+class SchemaError(NamedTuple):
+    """An error found validating a payload against the schema."""
+    # the name of the element in error, or None if the error is not about one
+    element: Optional[str]
+    # the name of the attribute in error, if it is about one
+    attribute: Optional[str]
+    # the index of the Schedule the element is in, if it is in one
+    schedule: Optional[int]
+    message: str
+
+    def __str__(self):
+        return self.message
+
+
+def get_schema():
+    """Return this thread's compiled RTML schema."""
+    schema = getattr(_local, 'schema', None)
+    if schema is None:
+        schema = _local.schema = etree.XMLSchema(etree.parse(SCHEMA_PATH))
+    return schema
+
+
+def schema_errors(observation_payload):
+    """Return the ``SchemaError`` of each way an RTML payload (text or element) breaks the schema."""
+    try:
+        if isinstance(observation_payload, str):
+            rtml = RTMLPayload.of(observation_payload).tree
+        elif isinstance(observation_payload, bytes):
+            rtml = etree.fromstring(observation_payload)
+        else:
+            rtml = observation_payload
+    except etree.XMLSyntaxError as e:
+        return [SchemaError(None, None, None, 'The RTML payload is not well-formed XML: {0}'.format(e))]
+    schema = get_schema()
+    if schema.validate(rtml):
+        return []
+    tree = rtml.getroottree()
+    schedules = rtml.findall('{*}Schedule')
+    errors = []
+    for entry in schema.error_log:
+        element = tree.xpath(entry.path)[0] if entry.path else None
+        schedule = None
+        if element is not None:
+            for ancestor in element.iterancestors('{*}Schedule'):
+                schedule = schedules.index(ancestor)
+            if element in schedules:
+                schedule = schedules.index(element)
+        attribute = ATTRIBUTE.search(entry.message)
+        errors.append(SchemaError(
+            element=etree.QName(element).localname if element is not None else None,
+            attribute=attribute.group(1) if attribute else None,
+            schedule=schedule,
+            message=NAMESPACE.sub('', entry.message),
+        ))
+    return errors
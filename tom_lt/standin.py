@@ -0,0 +1,179 @@
+"""A local stand-in for the Liverpool Telescope RTML node agent.
+
+The stand-in serves a WSDL describing the ``handle_rtml`` operation and answers SOAP calls to it
+through a pluggable ``respond`` callable, which receives the RTML document as text and returns the
+RTML reply. By default inquiries are answered with an offer, and requests and aborts with a confirmation;
+an exception raised by ``respond`` is returned to the client as a SOAP fault.
+
+The tests run it in a background thread; the ``runltstandin`` management command serves it on a port of its
+own, answering from a corpus recorded with ``'RTML_TRANSPORT': 'record'`` (see ``tom_lt.recording``), so
+that a TOM can be load tested without the telescope.
+"""
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from xml.sax.saxutils import escape
+
+from lxml import etree
+
+SOAP_ENV_NS = 'http://schemas.xmlsoap.org/soap/envelope/'
+NODE_AGENT_NS = 'urn:node_agent'
+
+WSDL = '''<?xml version="1.0" encoding="UTF-8"?>
+<wsdl:definitions targetNamespace="{ns}"
+                  xmlns:wsdl="http://schemas.xmlsoap.org/wsdl/"
+                  xmlns:wsdlsoap="http://schemas.xmlsoap.org/wsdl/soap/"
+                  xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+                  xmlns:impl="{ns}">
+  <wsdl:message name="handle_rtmlRequest">
+    <wsdl:part name="document" type="xsd:string"/>
+  </wsdl:message>
+  <wsdl:message name="handle_rtmlResponse">
+    <wsdl:part name="handle_rtmlReturn" type="xsd:string"/>
+  </wsdl:message>
+  <wsdl:portType name="NodeAgent">
+    <wsdl:operation name="handle_rtml" parameterOrder="document">
+      <wsdl:input message="impl:handle_rtmlRequest" name="handle_rtmlRequest"/>
+      <wsdl:output message="impl:handle_rtmlResponse" name="handle_rtmlResponse"/>
+    </wsdl:operation>
+  </wsdl:portType>
+  <wsdl:binding name="node_agentSoapBinding" type="impl:NodeAgent">
+    <wsdlsoap:binding style="rpc" transport="http://schemas.xmlsoap.org/soap/http"/>
+    <wsdl:operation name="handle_rtml">
+      <wsdlsoap:operation soapAction=""/>
+      <wsdl:input name="handle_rtmlRequest">
+        <wsdlsoap:body encodingStyle="http://schemas.xmlsoap.org/soap/encoding/" namespace="{ns}" use="encoded"/>
+      </wsdl:input>
+      <wsdl:output name="handle_rtmlResponse">
+        <wsdlsoap:body encodingStyle="http://schemas.xmlsoap.org/soap/encoding/" namespace="{ns}" use="encoded"/>
+      </wsdl:output>
+    </wsdl:operation>
+  </wsdl:binding>
+  <wsdl:service name="NodeAgentService">
+    <wsdl:port binding="impl:node_agentSoapBinding" name="node_agent">
+      <wsdlsoap:address location="{location}"/>
+    </wsdl:port>
+  </wsdl:service>
+</wsdl:definitions>
+'''
+
+SOAP_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="{env}" xmlns:xsd="http://www.w3.org/2001/XMLSchema"
+                  xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">
+  <soapenv:Body>
+    <ns1:handle_rtmlResponse soapenv:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/" xmlns:ns1="{ns}">
+      <handle_rtmlReturn xsi:type="xsd:string">{document}</handle_rtmlReturn>
+    </ns1:handle_rtmlResponse>
+  </soapenv:Body>
+</soapenv:Envelope>
+'''
+
+SOAP_FAULT = '''<?xml version="1.0" encoding="UTF-8"?>
+<soapenv:Envelope xmlns:soapenv="{env}">
+  <soapenv:Body>
+    <soapenv:Fault>
+      <faultcode>soapenv:Server</faultcode>
+      <faultstring>{message}</faultstring>
+    </soapenv:Fault>
+  </soapenv:Body>
+</soapenv:Envelope>
+'''
+
+REPLY_MODES = {
+    'inquiry': 'offer',
+    'request': 'confirmation',
+    'abort': 'confirmation',
+}
+
+
+def default_respond(document):
+    """Answer an inquiry with an offer and a request or abort with a confirmation, keeping the uid."""
+    rtml = etree.fromstring(document.encode('utf-8'))
+    rtml.set('mode', REPLY_MODES.get(rtml.get('mode'), 'reject'))
+    return ('<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+            + etree.tostring(rtml, encoding='unicode'))
+
+
+class NodeAgentHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_GET(self):
+        location = 'http://{0}:{1}{2}'.format(*self.server.server_address, self.path.split('?')[0])
+        self._reply(WSDL.format(ns=NODE_AGENT_NS, location=location))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        envelope = etree.fromstring(body)
+        document = envelope.find('.//document').text
+        if self.server.keep_documents:
+            with self.server.lock:
+                self.server.documents.append(document)
+                self.server.headers.append(dict(self.headers))
+        try:
+            reply = self.server.respond(document)
+        except Exception as e:
+            self._reply(SOAP_FAULT.format(env=SOAP_ENV_NS, message=escape(str(e))), status=500)
+        else:
+            self._reply(SOAP_RESPONSE.format(env=SOAP_ENV_NS, ns=NODE_AGENT_NS, document=escape(reply)))
+
+    def _reply(self, text, status=200):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class NodeAgentStandIn(ThreadingHTTPServer):
+    """Serve the stand-in node agent on ``address`` (by default an ephemeral local port).
+
+    Use as a context manager to serve it in a background thread; ``settings`` holds a ``FACILITIES['LT']``
+    dictionary pointing at it. The documents received and their HTTP headers are kept in ``documents`` and
+    ``headers`` unless ``keep_documents`` is false.
+    """
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self, respond=default_respond, address=('127.0.0.1', 0), keep_documents=True):
+        super().__init__(address, NodeAgentHandler)
+        self.respond = respond
+        self.keep_documents = keep_documents
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.documents = []
+        self.headers = []
+
+    @property
+    def settings(self):
+        return {
+            'proposalIDs': (('proposal ID1', ''),),
+            'username': 'tom',
+            'password': 'secret',
+            'LT_HOST': self.server_address[0],
+            'LT_PORT': self.server_address[1],
+            'DEBUG': False,
+        }
+
+    def handle_error(self, request, client_address):
+        # clients that time out close their connection before the reply is written
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
@@ -0,0 +1,149 @@
+"""Batched status polling of submitted LT observations.
+
+The node agent is asked for the state of many observations at once with a status inquiry: an RTML
+``inquiry`` document for one proposal whose ``Schedule`` elements only carry the ``uid`` of a submitted
+request. Its reply holds a ``Schedule`` per known uid, whose ``mode`` is the RTML mode of the latest
+document for that request (``confirmation``, ``update``, ``complete``, ...) and which may give the
+scheduled window as ``DateTimeStart``/``DateTimeEnd`` elements.
+
+Open observations are polled less often as they age, and all the records answered by a round of
+inquiries are written back with one bulk update.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.utils import timezone
+
+from tom_lt.uids import new_uid
+
+logger = logging.getLogger(__name__)
+
+# the TOM observation state for each mode a status inquiry can report for a request
+STATES = {
+    'confirmation': 'PENDING',
+    'update': 'IN_PROGRESS',
+    'complete': 'COMPLETED',
+    'incomplete': 'INCOMPLETE',
+    'fail': 'FAILED',
+    'reject': 'FAILED',
+    'abort': 'CANCELED',
+}
+TERMINAL_STATES = ['COMPLETED', 'INCOMPLETE', 'FAILED', 'CANCELED']
+
+# Seconds between status inquiries for an observation in its first day, by state. The interval doubles
+# with each further day since the observation was submitted, up to MAX_POLL_INTERVAL.
+POLL_INTERVALS = {
+    'IN_PROGRESS': 300,
+    'PENDING': 900,
+}
+DEFAULT_POLL_INTERVAL = 900
+MAX_POLL_INTERVAL = 6 * 3600
+
+DEFAULT_STATUS_BATCH_SIZE = 100
+BULK_UPDATE_BATCH_SIZE = 500
+
+
+def poll_interval(record, now):
+    """Return how long after its last update ``record`` is due for another status inquiry."""
+    age_in_days = max((now - record.created).days, 0)
+    interval = POLL_INTERVALS.get(record.status, DEFAULT_POLL_INTERVAL) * 2 ** min(age_in_days, 32)
+    return timedelta(seconds=min(interval, MAX_POLL_INTERVAL))
+
+
+def due(records, now):
+    """Return the records whose status should be asked for at ``now``, given their age and state."""
+    return [record for record in records if record.modified + poll_interval(record, now) <= now]
+
+
+def status_inquiry(project, username, observation_ids):
+    """Return the status inquiry document for some observations of a proposal."""
+    from tom_lt.rtml import DOCUMENT, OBSERVATION_REFERENCE, PROJECT
+    body = PROJECT.render(project=project, username=username)
+    body += ''.join(OBSERVATION_REFERENCE.render(observation_id=observation_id)
+                    for observation_id in observation_ids)
+    return DOCUMENT.render(mode='inquiry', uid=new_uid(), body=body)
+
+
+def parse_statuses(response):
+    """Return ``{uid: {'state', 'scheduled_start', 'scheduled_end'}}`` from the reply to a status inquiry."""
+    return {
+        schedule.uid: {
+            'state': STATES.get(schedule.mode, 'UNKNOWN'),
+            'scheduled_start': schedule.start,
+            'scheduled_end': schedule.end,
+        }
+        for schedule in response.schedules if schedule.uid is not None
+    }
+
+
+def batches(records, batch_size):
+    """Group records by the proposal they were submitted under, in batches of at most ``batch_size``."""
+    by_project = {}
+    for record in records:
+        by_project.setdefault(record.parameters.get('project'), []).append(record)
+    for project, project_records in by_project.items():
+        for i in range(0, len(project_records), batch_size):
+            yield project, project_records[i:i + batch_size]
+
+
+def update_statuses(facility, lt_settings, records, force=False, max_workers=None):
+    """Ask the node agent for the status of ``records`` and save the answers.
+
+    Unless ``force`` is set, only the records that are due (see ``poll_interval``) are asked for. Status
+    inquiries for different batches are sent concurrently, ``max_workers`` at a time, through
+    ``facility._handle_rtml``. Returns ``(observation_id, error)`` for every record whose status could
+    not be found, like ``BaseObservationFacility.update_all_observation_statuses``.
+    """
+    from tom_common.hooks import run_hook
+    from tom_observations.models import ObservationRecord
+
+    now = timezone.now()
+    records = list(records)
+    if not force:
+        records = due(records, now)
+    if not records:
+        return []
+
+    failed_records = [(record.observation_id, 'No proposal recorded for this observation')
+                      for record in records if not record.parameters.get('project')]
+    records = [record for record in records if record.parameters.get('project')]
+
+    batch_size = lt_settings.get('STATUS_BATCH_SIZE', DEFAULT_STATUS_BATCH_SIZE)
+
+    def inquire(batch):
+        project, batch_records = batch
+        document = status_inquiry(project, lt_settings['username'],
+                                  sorted({record.observation_id for record in batch_records}))
+        try:
+            return batch_records, parse_statuses(facility._handle_rtml(document)), None
+        except Exception as e:
+            logger.warning('Error asking the Liverpool Telescope for observation statuses: %s', e)
+            return batch_records, {}, f'Error with connection to Liverpool Telescope: {e}'
+
+    updated = []
+    changed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for batch_records, statuses, error in executor.map(inquire, batches(records, batch_size)):
+            for record in batch_records:
+                if error is not None:
+                    failed_records.append((record.observation_id, error))
+                    continue
+                # answered batches back off even when a record is unknown to the node agent
+                record.modified = now
+                updated.append(record)
+                status = statuses.get(record.observation_id)
+                if status is None:
+                    failed_records.append((record.observation_id, 'Observation unknown to the Liverpool Telescope'))
+                    continue
+                if status['state'] != record.status:
+                    changed.append((record, record.status))
+                record.status = status['state']
+                record.scheduled_start = status['scheduled_start'] or record.scheduled_start
+                record.scheduled_end = status['scheduled_end'] or record.scheduled_end
+
+    ObservationRecord.objects.bulk_update(updated, ['status', 'scheduled_start', 'scheduled_end', 'modified'],
+                                          batch_size=BULK_UPDATE_BATCH_SIZE)
+    for record, previous_status in changed:
+        run_hook('observation_change_state', record, previous_status)
+    return failed_records
@@ -0,0 +1,88 @@
+"""A local stand-in for the server the LT data products are downloaded from.
+
+It serves a dictionary of files over HTTP with support for single ``bytes=N-`` range requests, and can
+drop the connection part way through a file to interrupt a download.
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        name = self.path.lstrip('/')
+        server = self.server
+        with server.lock:
+            server.requests.append((name, self.headers.get('Range')))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            cut_after = server.cut_after.pop(name, None)
+        try:
+            if name not in server.files:
+                self.send_error(404)
+                return
+            data = server.files[name]
+            offset = 0
+            range_header = self.headers.get('Range')
+            if range_header:
+                offset = int(range_header[len('bytes='):].rstrip('-'))
+                if offset >= len(data):
+                    self.send_response(416)
+                    self.send_header('Content-Range', 'bytes */{0}'.format(len(data)))
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(offset, len(data) - 1, len(data)))
+            else:
+                self.send_response(200)
+            self.send_header('Content-Type', 'application/fits')
+            self.send_header('Content-Length', str(len(data) - offset))
+            self.end_headers()
+            time.sleep(server.delay)
+            if cut_after is not None:
+                self.wfile.write(data[offset:offset + cut_after])
+                self.wfile.flush()
+                self.close_connection = True
+                return
+            self.wfile.write(data[offset:])
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ArchiveStandIn(ThreadingHTTPServer):
+    """Serve ``files`` (a ``{name: bytes}`` dictionary) on an ephemeral local port, in a background thread.
+
+    ``cut_after`` maps a file name to the number of bytes sent before the connection is dropped, the
+    first time that file is requested. ``url(name)`` gives the address of a file.
+    """
+    daemon_threads = True
+
+    def __init__(self, files, cut_after=None, delay=0):
+        super().__init__(('127.0.0.1', 0), ArchiveHandler)
+        self.files = files
+        self.cut_after = dict(cut_after or {})
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def url(self, name):
+        return 'http://{0}:{1}/{2}'.format(*self.server_address, name)
+
+    def __enter__(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
@@ -1,5 +1,7 @@
 import factory
+from django.utils import timezone
 
+from tom_observations.models import ObservationRecord
 from tom_targets.models import Target
 
 
@@ -33,3 +35,18 @@ class NonSiderealTargetFactory(factory.django.DjangoModelFactory):
     ephemeris_period_err = factory.Faker('pyfloat')
     ephemeris_epoch = factory.Faker('pyfloat')
     ephemeris_epoch_err = factory.Faker('pyfloat')
+
+
+def create_records(target, count, project='proposal ID1', status='PENDING', start=0, since_update=None):
+    """Create ``count`` LT records of ``target`` in ``project``, with observation ids from ``start`` on.
+
+    If ``since_update`` is given, the records are made to have been last modified that long ago.
+    """
+    records = ObservationRecord.objects.bulk_create([
+        ObservationRecord(target=target, facility='LT', observation_id=str(start + i), status=status,
+                          parameters={'project': project})
+        for i in range(count)])
+    if since_update is not None:
+        ObservationRecord.objects.filter(pk__in=[r.pk for r in records]).update(
+            modified=timezone.now() - since_update)
+    return records
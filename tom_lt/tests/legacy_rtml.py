@@ -0,0 +1,106 @@
+"""The RTML builders as they were before the payload templates in ``tom_lt.rtml``.
+
+They build each payload as an lxml tree, deep-copying one target element into every schedule and
+rebuilding the constraints for each, and serve as the reference the templates must reproduce byte for
+byte and as the baseline of the payload benchmark.
+"""
+import copy
+
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from lxml import etree
+
+from tom_lt.rtml import LT_SCHEMA_LOCATION, LT_XML_NS, LT_XSI_NS
+
+
+def legacy_payload(form, target, uid, username=''):
+    """Return the RTML the original builders produced for a validated ``form`` observing ``target``."""
+    data = form.cleaned_data
+    schemaLocation = etree.QName(LT_XSI_NS, 'schemaLocation')
+    payload = etree.Element('RTML', {schemaLocation: LT_SCHEMA_LOCATION}, xmlns=LT_XML_NS,
+                            mode='request', uid=str(uid), version='3.1a', nsmap={'xsi': LT_XSI_NS})
+    project = etree.SubElement(payload, 'Project', ProjectID=data['project'])
+    contact = etree.SubElement(project, 'Contact')
+    etree.SubElement(contact, 'Username').text = username
+    etree.SubElement(contact, 'Name').text = ''
+
+    target = _target(target)
+    observation_type = type(form).__name__.split('_')[1]
+    if observation_type == 'IOO':
+        for filter in form.filters:
+            if data['exp_count_' + filter] != 0:
+                x, y = data['binning'].split('x')
+                payload.append(_schedule(data, target, 'IO:O', 'camera', 'optical', ('Filter', 'type', filter),
+                                         (x, y), data['exp_count_' + filter], data['exp_time_' + filter]))
+    elif observation_type == 'IOI':
+        payload.append(_schedule(data, target, 'IO:I', 'camera', 'infrared', ('Filter', 'type', 'H'),
+                                 ('1', '1'), data['exp_count'], data['exp_time']))
+    elif observation_type == 'SPRAT':
+        payload.append(_schedule(data, target, 'Sprat', 'spectrograph', 'optical',
+                                 ('Grating', 'name', data['grating']), ('1', '1'), data['exp_count'],
+                                 data['exp_time']))
+    else:
+        for arm in ('blue', 'red'):
+            payload.append(_schedule(data, target, 'FrodoSpec-' + arm.capitalize(), 'spectrograph', 'optical',
+                                     ('Grating', 'name', data['res_' + arm]), None, data['exp_count_' + arm],
+                                     data['exp_time_' + arm]))
+    return etree.tostring(payload, encoding='unicode')
+
+
+def _schedule(data, target, name, device_type, spectral_region, setup_element, binning, exp_count, exp_time):
+    schedule = etree.Element('Schedule')
+    device = etree.SubElement(schedule, 'Device', name=name, type=device_type)
+    etree.SubElement(device, 'SpectralRegion').text = spectral_region
+    setup = etree.SubElement(device, 'Setup')
+    tag, attribute, value = setup_element
+    etree.SubElement(setup, tag, {attribute: value})
+    if binning is not None:
+        detector = etree.SubElement(setup, 'Detector')
+        binning_element = etree.SubElement(detector, 'Binning')
+        etree.SubElement(binning_element, 'X', units='pixels').text = binning[0]
+        etree.SubElement(binning_element, 'Y', units='pixels').text = binning[1]
+    exposure = etree.SubElement(schedule, 'Exposure', count=str(exp_count))
+    etree.SubElement(exposure, 'Value', units='seconds').text = str(exp_time)
+    schedule.append(copy.deepcopy(target))
+    for const in _constraints(data):
+        schedule.append(const)
+    return schedule
+
+
+def _target(target_to_observe):
+    target = etree.Element('Target', name=target_to_observe.name)
+    c = SkyCoord(ra=target_to_observe.ra*u.degree, dec=target_to_observe.dec*u.degree)
+    coordinates = etree.SubElement(target, 'Coordinates')
+    ra = etree.SubElement(coordinates, 'RightAscension')
+    etree.SubElement(ra, 'Hours').text = str(int(c.ra.hms.h))
+    etree.SubElement(ra, 'Minutes').text = str(int(c.ra.hms.m))
+    etree.SubElement(ra, 'Seconds').text = str(c.ra.hms.s)
+
+    dec = etree.SubElement(coordinates, 'Declination')
+    sign = '+' if c.dec.signed_dms.sign == 1.0 else '-'
+    etree.SubElement(dec, 'Degrees').text = sign + str(int(c.dec.signed_dms.d))
+    etree.SubElement(dec, 'Arcminutes').text = str(int(c.dec.signed_dms.m))
+    etree.SubElement(dec, 'Arcseconds').text = str(c.dec.signed_dms.s)
+    etree.SubElement(coordinates, 'Equinox').text = str(target_to_observe.epoch)
+    return target
+
+
+def _constraints(data):
+    airmass_const = etree.Element('AirmassConstraint', maximum=str(data['max_airmass']))
+
+    sky_const = etree.Element('SkyConstraint')
+    etree.SubElement(sky_const, 'Flux').text = str(data['max_skybri'])
+    etree.SubElement(sky_const, 'Units').text = 'magnitudes/square-arcsecond'
+
+    seeing_const = etree.Element('SeeingConstraint', maximum=(str(data['max_seeing'])), units='arcseconds')
+
+    photom_const = etree.Element('ExtinctionConstraint')
+    etree.SubElement(photom_const, 'Clouds').text = data['photometric']
+
+    date_const = etree.Element('DateTimeConstraint', type='include')
+    start = data['startdate'] + 'T' + data['starttime'] + ':00+00:00'
+    end = data['enddate'] + 'T' + data['endtime'] + ':00+00:00'
+    etree.SubElement(date_const, 'DateTimeStart', system='UT', value=start)
+    etree.SubElement(date_const, 'DateTimeEnd', system='UT', value=end)
+
+    return [airmass_const, sky_const, seeing_const, photom_const, date_const]
@@ -0,0 +1,30 @@
+"""Answers of the stand-in node agent (``tom_lt.standin``) to the status inquiries of the tests."""
+from lxml import etree
+
+from tom_lt.standin import default_respond
+
+
+def status_respond(states, products=None):
+    """Return a ``respond`` answering status inquiries with the mode ``states`` gives each known uid.
+
+    ``products`` optionally maps a uid to the ``(url, md5)`` of its data products, listed as ``ImageData``.
+    Other documents are answered by ``default_respond``.
+    """
+    def respond(document):
+        rtml = etree.fromstring(document.encode('utf-8'))
+        schedules = rtml.findall('{*}Schedule')
+        if rtml.get('mode') != 'inquiry' or not schedules or any(len(schedule) for schedule in schedules):
+            return default_respond(document)
+        for schedule in schedules:
+            if schedule.get('uid') in states:
+                schedule.set('mode', states[schedule.get('uid')])
+                for url, md5 in (products or {}).get(schedule.get('uid'), []):
+                    image_data = etree.SubElement(schedule, 'ImageData', type='FITS16', delivery='url', reduced='true')
+                    image_data.text = url
+                    if md5 is not None:
+                        image_data.set('md5', md5)
+            else:
+                rtml.remove(schedule)
+        rtml.set('mode', 'update')
+        return etree.tostring(rtml, encoding='unicode')
+    return respond
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+# django_shell.py
+
+import argparse
+import os
+
+from django.core.management import call_command
+from boot_django import boot_django, APP_NAME  # noqa
+
+parser = argparse.ArgumentParser(description=f'Run the benchmarks of {APP_NAME}.')
+parser.add_argument('--update-baseline', action='store_true',
+                    help='store the results of the pipeline benchmarks as the baseline they are compared with')
+parser.add_argument('labels', nargs='*', default=[APP_NAME], help='test labels to run (default: all benchmarks)')
+args = parser.parse_args()
+if args.update_baseline:
+    os.environ['TOM_LT_UPDATE_BENCHMARKS'] = '1'
+
+boot_django()
+print(f'running benchmarks for {APP_NAME}')
+call_command('test', *args.labels, '--tag=benchmark', verbosity=2)
@@ -0,0 +1,132 @@
+import asyncio
+import time
+from unittest import mock
+
+import httpx
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from lxml import etree
+
+from tom_lt.async_client import get_async_transport, NodeAgentError
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility, validation_cache
+from tom_lt.standin import NodeAgentStandIn, default_respond
+from tom_lt.tests.utils import rtml
+
+
+@override_settings(FACILITIES={})
+class TestAsyncNodeAgentTransport(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+
+    def test_response_matches_suds_transport(self):
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                expected = LTFacility()._handle_rtml(rtml(7))
+                response = asyncio.run(get_async_transport(LT_SETTINGS).handle_rtml(rtml(7)))
+        self.assertEqual((response.mode, response.uid), (expected.mode, expected.uid))
+        self.assertEqual(etree.tostring(response.root), etree.tostring(expected.root))
+        self.assertEqual(node_agent.documents[0], node_agent.documents[1])
+        self.assertEqual(node_agent.headers[1]['Username'], 'tom')
+
+    def test_many_requests_in_flight(self):
+        def respond(document):
+            time.sleep(0.2)
+            return default_respond(document)
+
+        async def submit_all(facility):
+            return await asyncio.gather(*(facility.asubmit_observation(rtml(uid)) for uid in range(10)))
+
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                start = time.monotonic()
+                results = asyncio.run(submit_all(LTFacility()))
+                elapsed = time.monotonic() - start
+        self.assertEqual(results, [[str(uid)] for uid in range(10)])
+        self.assertLess(elapsed, 1.0)
+
+    def test_timeout(self):
+        def respond(document):
+            time.sleep(0.5)
+            return default_respond(document)
+
+        with NodeAgentStandIn(respond) as node_agent:
+            transport = get_async_transport(node_agent.settings)
+            with self.assertRaises(asyncio.TimeoutError):
+                asyncio.run(transport.handle_rtml(rtml(1), timeout=0.1))
+
+    def test_fault_is_raised(self):
+        def respond(document):
+            raise RuntimeError('node agent exploded')
+
+        with NodeAgentStandIn(respond) as node_agent:
+            with self.assertRaisesRegex(NodeAgentError, 'node agent exploded'):
+                asyncio.run(get_async_transport(node_agent.settings).handle_rtml(rtml(1)))
+
+    def test_connections_are_kept_alive(self):
+        async def send_all(transport):
+            for uid in range(5):
+                await transport.handle_rtml(rtml(uid))
+            await transport.aclose()
+
+        with NodeAgentStandIn() as node_agent:
+            asyncio.run(send_all(get_async_transport(node_agent.settings)))
+        # the WSDL and the five documents
+        self.assertEqual(node_agent.connections, 1)
+
+    def test_replies_that_are_not_answers(self):
+        def send(status, content):
+            async def handle_rtml():
+                transport = get_async_transport(dict(LT_SETTINGS, LT_HOST='node-agent.invalid', LT_PORT=443))
+                transport.service = ('https://node-agent.invalid/node_agent', 'urn:node_agent', '')
+                mock_transport = httpx.MockTransport(lambda request: httpx.Response(status, content=content))
+                transport._clients[asyncio.get_running_loop()] = httpx.AsyncClient(transport=mock_transport)
+                return await transport._handle_rtml(rtml(1))
+            return asyncio.run(handle_rtml())
+
+        with self.assertRaisesRegex(NodeAgentError, 'HTTP 503'):
+            send(503, b'<html><body>Service Unavailable</body></html')
+        with self.assertRaisesRegex(NodeAgentError, 'Unreadable reply'):
+            send(200, b'Service Unavailable')
+        empty = ('<SOAP-ENV:Envelope xmlns:SOAP-ENV="http://schemas.xmlsoap.org/soap/envelope/"><SOAP-ENV:Body>'
+                 '<ns1:handle_rtmlResponse xmlns:ns1="urn:node_agent">{0}</ns1:handle_rtmlResponse>'
+                 '</SOAP-ENV:Body></SOAP-ENV:Envelope>')
+        for reply in (empty.format(''), empty.format('<handle_rtmlReturn/>')):
+            with self.assertRaisesRegex(NodeAgentError, 'No RTML document'):
+                send(200, reply.encode())
+
+    def test_avalidate_observation(self):
+        def respond(document):
+            if etree.fromstring(document.encode()).get('uid') == '2':
+                return document.replace('mode="inquiry"', 'mode="reject"')
+            return default_respond(document)
+
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                self.assertEqual(asyncio.run(LTFacility().avalidate_observation(rtml(1))), [])
+                errors = asyncio.run(LTFacility().avalidate_observation(rtml(2)))
+        self.assertEqual(errors[0], 'Error with RTML submission to Liverpool Telescope')
+        self.assertEqual(etree.fromstring(node_agent.documents[0].encode()).get('mode'), 'inquiry')
+
+
+@override_settings(FACILITIES={}, CACHES={'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+                                                      'LOCATION': 'tom_lt_test_cache'}})
+class TestDatabaseCache(TransactionTestCase):
+    """The breaker and the validation cache are sync-only with the database cache, as in async views."""
+
+    def setUp(self):
+        call_command('createcachetable', verbosity=0)
+        clear_clients()
+        self.addCleanup(clear_clients)
+
+    def test_async_calls(self):
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, VALIDATION_MODE='cached'):
+                validation_cache.clear()
+                for _ in range(2):
+                    self.assertEqual(asyncio.run(LTFacility().avalidate_observation(rtml(1))), [])
+                self.assertEqual(asyncio.run(LTFacility().asubmit_observation(rtml(2))), ['2'])
+        self.assertEqual([etree.fromstring(document.encode()).get('mode') for document in node_agent.documents],
+                         ['inquiry', 'request'])
+        self.assertEqual(validation_cache.stats(), {'hits': 1, 'misses': 1})
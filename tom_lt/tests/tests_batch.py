@@ -0,0 +1,76 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import SimpleTestCase
+from lxml import etree
+
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.standin import NodeAgentStandIn, default_respond
+from tom_lt.tests.utils import rtml
+
+
+class TestSubmitObservations(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+
+    def _submit(self, respond, payloads, **kwargs):
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                return LTFacility().submit_observations(payloads, **kwargs)
+
+    def test_results_are_in_input_order(self):
+        def respond(document):
+            # answer the early payloads last
+            time.sleep(0.05 / int(etree.fromstring(document.encode()).get('uid')))
+            return default_respond(document)
+
+        results = self._submit(respond, [rtml(uid) for uid in range(1, 9)], max_workers=4)
+        self.assertEqual([result['observation_id'] for result in results], [str(uid) for uid in range(1, 9)])
+        self.assertTrue(all(result['mode'] == 'confirmation' for result in results))
+        self.assertTrue(all(result['error'] is None for result in results))
+
+    def test_partial_failures_do_not_abort_the_batch(self):
+        def respond(document):
+            uid = etree.fromstring(document.encode()).get('uid')
+            if uid == '2':
+                raise RuntimeError('node agent exploded')
+            if uid == '3':
+                return document.replace('mode="request"', 'mode="reject"')
+            return default_respond(document)
+
+        with self.assertLogs(level='WARNING'):
+            results = self._submit(respond, [rtml(1), rtml(2), rtml(3), rtml(4)])
+        self.assertEqual([result['mode'] for result in results], ['confirmation', None, 'reject', 'confirmation'])
+        self.assertIsNone(results[0]['error'])
+        self.assertIn('node agent exploded', results[1]['error'])
+        self.assertEqual(results[2]['observation_id'], '3')
+        self.assertIsNotNone(results[2]['error'])
+        self.assertEqual(results[3]['observation_id'], '4')
+
+    def test_concurrency_is_bounded(self):
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+
+        def respond(document):
+            with lock:
+                in_flight.append(document)
+                peak.append(len(in_flight))
+            time.sleep(0.02)
+            with lock:
+                in_flight.remove(document)
+            return default_respond(document)
+
+        self._submit(respond, [rtml(uid) for uid in range(12)], max_workers=3)
+        self.assertGreater(max(peak), 1)
+        self.assertLessEqual(max(peak), 3)
+
+    def test_concurrency_defaults_to_setting(self):
+        with mock.patch.dict(LT_SETTINGS, {'MAX_CONCURRENT_SUBMISSIONS': 2}):
+            with mock.patch('tom_lt.lt.ThreadPoolExecutor', wraps=ThreadPoolExecutor) as executor:
+                self._submit(default_respond, [rtml(1)])
+        executor.assert_called_once_with(max_workers=2)
@@ -0,0 +1,292 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from types import SimpleNamespace
+from unittest import mock
+
+from django import forms
+from django.test import SimpleTestCase, TestCase, tag
+from lxml import etree
+
+from tom_lt.lt import IOO_FILTERS, LT_IOO_ObservationForm, LT_SETTINGS, LTObservationForm, Target
+from tom_lt.response import parse_response
+from tom_lt.tests.legacy_rtml import legacy_payload
+from tom_lt.tests.factories import SiderealTargetFactory
+from tom_lt.tests.tests_payload import form_data, ioo_data, valid_form
+from tom_lt.tests.tests_response import large_reply
+
+PAYLOADS = 500
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+# the modules tom_lt.lt imported at load time before they were deferred to first use
+DEFERRED_MODULES = ('tom_lt.client', 'tom_lt.async_client', 'tom_lt.rtml', 'tom_lt.response')
+
+
+def rate(function, count=PAYLOADS):
+    """Call ``function`` ``count`` times and return the calls per second."""
+    start = time.perf_counter()
+    for _ in range(count):
+        function()
+    return count / (time.perf_counter() - start)
+
+
+def import_times(*modules):
+    """Import ``modules`` in order in a fresh, configured interpreter; return their cumulative import times (s)."""
+    script = ('import sys; sys.path.insert(0, {0!r}); from boot_django import boot_django; boot_django(); '
+              'import tom_observations.facility; ').format(TESTS_DIR)
+    script += '; '.join('import ' + module for module in modules)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script],
+                            capture_output=True, text=True, check=True, cwd=TESTS_DIR)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name[1:]
+        if not name.startswith(' '):  # only imports made by the script itself, not nested ones
+            times.setdefault(name.rstrip(), int(cumulative) / 1e6)
+    return [times.get(module, 0.0) for module in modules]
+
+
+@tag('benchmark')
+class BenchmarkImport(SimpleTestCase):
+    """NOTE: To run these benchmarks in your venv: python ./tom_lt/tests/run_benchmarks.py"""
+
+    def test_import_time(self):
+        # -X importtime of tom_lt.lt on its own, and with the modules it used to import eagerly
+        after = min(sum(import_times('tom_lt.lt')) for _ in range(5))
+        before = min(sum(import_times('tom_lt.lt', *DEFERRED_MODULES)) for _ in range(5))
+        print('\nimport tom_lt.lt: {0:.1f} ms with eager imports, {1:.1f} ms deferred'.format(
+            before * 1000, after * 1000))
+        loaded = subprocess.run(
+            [sys.executable, '-c', 'import sys; sys.path.insert(0, {0!r}); from boot_django import boot_django; '
+             'boot_django(); import tom_lt.lt; print(" ".join(sorted(sys.modules)))'.format(TESTS_DIR)],
+            capture_output=True, text=True, check=True, cwd=TESTS_DIR).stdout.split()
+        for module in DEFERRED_MODULES + ('suds', 'lxml.etree'):
+            self.assertNotIn(module, loaded)
+
+
+@tag('benchmark')
+class BenchmarkPayloads(SimpleTestCase):
+    """NOTE: To run these benchmarks in your venv: python ./tom_lt/tests/run_benchmarks.py"""
+
+    def test_payload_generation(self):
+        target = SimpleNamespace(name='SN2024abc', ra=83.63308, dec=22.0145, epoch=2000.0)
+        with mock.patch.object(Target.objects, 'get', return_value=target):
+            for observation_type, data in form_data().items():
+                form = valid_form(observation_type, data)
+
+                def current():
+                    form._targets.clear()
+                    form._payload = None
+                    return form.observation_payload()
+
+                before = rate(lambda: legacy_payload(form, target, int(time.time()), LT_SETTINGS['username']))
+                after = rate(current)
+                print('\n{0:>6} payloads/s: {1:8.0f} tree builders, {2:8.0f} templates ({3:.1f}x)'.format(
+                    observation_type, before, after, after / before))
+                with mock.patch('tom_lt.lt.new_uid', return_value='1700000000'):
+                    self.assertEqual(current(), legacy_payload(form, target, 1700000000, LT_SETTINGS['username']))
+
+
+class LegacyIOOForm(LTObservationForm):
+    """The IO:O form as it was when the filter fields were created by every instance."""
+    binning = LT_IOO_ObservationForm.base_fields['binning']
+    extra_layout = LT_IOO_ObservationForm.extra_layout
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.filters = tuple(filter for filter, _, _, _ in IOO_FILTERS)
+        for filter in self.filters:
+            label = filter == self.filters[0]
+            self.fields['exp_time_' + filter] = forms.FloatField(min_value=0, initial=120,
+                                                                 label='Integration Time' if label else '')
+            self.fields['exp_count_' + filter] = forms.IntegerField(min_value=0, initial=0,
+                                                                    label='No. of integrations' if label else '')
+
+
+def allocations(form_class, count=200):
+    """Return the bytes allocated, and the calls per second, instantiating ``form_class`` ``count`` times."""
+    tracemalloc.start()
+    try:
+        forms_ = [form_class() for _ in range(count)]
+        allocated = tracemalloc.get_traced_memory()[0] / count
+    finally:
+        tracemalloc.stop()
+    del forms_
+    return allocated, rate(form_class, count)
+
+
+@tag('benchmark')
+class BenchmarkForms(SimpleTestCase):
+    """NOTE: To run these benchmarks in your venv: python ./tom_lt/tests/run_benchmarks.py"""
+
+    def test_ioo_form_instantiation(self):
+        before, before_rate = allocations(LegacyIOOForm)
+        after, after_rate = allocations(LT_IOO_ObservationForm)
+        print('\nIO:O form: {0:.0f} B and {1:.0f}/s per instance with fields built in __init__, '
+              '{2:.0f} B and {3:.0f}/s with class-level fields'.format(before, before_rate, after, after_rate))
+        self.assertEqual(sorted(LegacyIOOForm().fields), sorted(LT_IOO_ObservationForm().fields))
+
+
+def legacy_response(document):
+    """Read a node agent reply as ``parse_response`` did before it fed the reply to lxml incrementally."""
+    rtml = etree.fromstring(document.replace('encoding="ISO-8859-1"', ''))
+    return rtml.get('mode'), rtml.get('uid'), [error.text for error in rtml.iter('{*}Error')]
+
+
+def peak(function):
+    """Return the peak of the memory allocated by Python while calling ``function``, in bytes."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+@tag('benchmark')
+class BenchmarkResponses(SimpleTestCase):
+    """NOTE: To run these benchmarks in your venv: python ./tom_lt/tests/run_benchmarks.py"""
+
+    def test_response_parsing(self):
+        for mode in ('offer', 'reject'):
+            document = large_reply(mode)
+
+            def current():
+                response = parse_response(document)
+                # as read by submit_observation and validate_observation
+                return response.mode, response.uid, response.errors if response.mode == 'reject' else []
+
+            def legacy():
+                return legacy_response(document)
+
+            before = max(rate(legacy, count=20) for _ in range(3))
+            after = max(rate(current, count=20) for _ in range(3))
+            print('\n{0:>6} replies of {1} kB: {2:6.0f}/s and {3:4.0f} kB peak string rewriting, '
+                  '{4:6.0f}/s and {5:4.0f} kB peak incremental ({6:.1f}x)'.format(
+                      mode, len(document) // 1000, before, peak(legacy) / 1000, after, peak(current) / 1000,
+                      after / before))
+            self.assertEqual(current(), legacy_response(document))
+
+
+BASELINE = os.path.join(TESTS_DIR, 'fixtures', 'benchmarks.json')
+# a rate may drop to this fraction of the baseline (scaled by the speed of the machine), and an allocation
+# peak grow by this fraction, before it counts as a regression
+RATE_TOLERANCE = 0.5
+ALLOCATION_TOLERANCE = 0.5
+
+
+def calibration():
+    """Return the rate of a fixed pure Python workload, by which the rates of different machines are scaled."""
+    return max(rate(lambda: sorted(str(i) for i in range(1000)), count=200) for _ in range(3))
+
+
+def measure(function, count):
+    """Return the calls per second, peak bytes allocated per call and database queries per call of ``function``.
+
+    ``function`` is called ``count`` times with the index of the call.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    with CaptureQueriesContext(connection) as queries:
+        for i in range(count):
+            function(i)
+    queries = len(queries) / count
+    allocated = max(peak(lambda: function(i)) for i in range(min(count, 5)))
+    # the best of a few passes, as the others are slowed down by whatever else the machine does
+    best = min(timeit.repeat(lambda: [function(i) for i in range(count)], number=1, repeat=3))
+    return {'rate': count / best, 'allocated': allocated, 'queries': queries}
+
+
+@tag('benchmark')
+class BenchmarkPipeline(TestCase):
+    """NOTE: To run these benchmarks in your venv: python ./tom_lt/tests/run_benchmarks.py
+
+    Run with ``--update-baseline`` to store the results as the new baseline in ``fixtures/benchmarks.json``.
+    """
+    TARGET_COUNTS = (1, 25)
+    FILTER_COUNTS = (1, 3, 6, len(IOO_FILTERS))
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.targets = [SiderealTargetFactory.create(name='target {0}'.format(i), ra=(37.5 * i) % 360,
+                                                    dec=-30 + 2.5 * i, epoch=2000.0)
+                       for i in range(max(cls.TARGET_COUNTS))]
+
+    def forms(self, observation_type, targets, filters=None):
+        if observation_type == 'IOO':
+            names = [name for name, _, _, _ in IOO_FILTERS[:filters]]
+            return [valid_form('IOO', ioo_data(target.id, names)) for target in targets]
+        return [valid_form(observation_type, form_data(target.id)[observation_type]) for target in targets]
+
+    def cases(self):
+        """Yield the name of each case, the function it times and the number of calls."""
+        for target_count in self.TARGET_COUNTS:
+            targets = self.targets[:target_count]
+            kinds = [('IOO', filters) for filters in self.FILTER_COUNTS] + [('IOI', None), ('SPRAT', None),
+                                                                            ('FRODO', None)]
+            for observation_type, filters in kinds:
+                forms_ = self.forms(observation_type, targets, filters)
+
+                def payload(i, forms_=forms_):
+                    # as the form of a new request: the target is looked up again
+                    form = forms_[i % len(forms_)]
+                    form._targets.clear()
+                    form._payload = None
+                    return form.observation_payload()
+
+                name = observation_type + ('-{0}'.format(filters) if filters else '')
+                yield '{0} x{1} observation_payload'.format(name, target_count), payload, PAYLOADS // 5
+
+        form = self.forms('IOO', self.targets[:1], len(IOO_FILTERS))[0]
+
+        def build_target(i):
+            form._targets.clear()
+            return form._build_target()
+
+        yield '_build_target', build_target, PAYLOADS
+        yield '_build_constraints', lambda i: form._build_constraints(), PAYLOADS
+        confirmation = payload(0).replace('mode="request"', 'mode="confirmation"')
+
+        def parse_confirmation(i):
+            # what submit_observation reads of the reply
+            response = parse_response(confirmation)
+            return response.mode, response.uid
+
+        yield 'submit_observation response', parse_confirmation, PAYLOADS
+
+    def test_pipeline(self):
+        results = {name: measure(function, count) for name, function, count in self.cases()}
+        speed = calibration()
+        print('\n{0:<36} {1:>10} {2:>10} {3:>8}'.format('', 'calls/s', 'peak kB', 'queries'))
+        for name, result in results.items():
+            print('{0:<36} {1:10.0f} {2:10.1f} {3:8.1f}'.format(
+                name, result['rate'], result['allocated'] / 1000, result['queries']))
+
+        if os.environ.get('TOM_LT_UPDATE_BENCHMARKS'):
+            with open(BASELINE, 'w') as f:
+                rounded = {name: {key: round(value, 1) for key, value in result.items()}
+                           for name, result in results.items()}
+                json.dump({'python': sys.version_info[:2], 'calibration': round(speed, 1), 'results': rounded}, f,
+                          indent=2, sort_keys=True)
+                f.write('\n')
+            return
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+        same_python = tuple(baseline['python']) == sys.version_info[:2]
+        scale = speed / baseline['calibration']
+        for name, result in results.items():
+            expected = baseline['results'].get(name)
+            if expected is None:
+                continue
+            with self.subTest(name):
+                self.assertLessEqual(result['queries'], expected['queries'])
+                self.assertGreaterEqual(result['rate'], expected['rate'] * scale * RATE_TOLERANCE)
+                if same_python:
+                    # allocations differ between Python versions
+                    self.assertLessEqual(result['allocated'], expected['allocated'] * (1 + ALLOCATION_TOLERANCE))
@@ -0,0 +1,146 @@
+import asyncio
+import time
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from tom_lt import client
+from tom_lt.async_client import get_async_transport
+from tom_lt.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, NodeAgentUnavailable, get_breaker, retry_delay
+from tom_lt.client import ConnectionFailed, clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility, validation_cache
+from tom_lt.standin import NodeAgentStandIn, default_respond
+from tom_lt.tests.utils import UNREACHABLE, rtml
+
+
+class TestCircuitBreaker(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.breaker = CircuitBreaker('host:1', failure_threshold=2, reset_timeout=60)
+
+    def test_opens_after_consecutive_failures(self):
+        self.breaker.failure()
+        self.breaker.success()
+        self.breaker.failure()
+        self.assertEqual(self.breaker.state(), CLOSED)
+        self.breaker.before_call()
+        with self.assertLogs('tom_lt.breaker', 'WARNING'):
+            self.breaker.failure()
+        self.assertEqual(self.breaker.state(), OPEN)
+        with self.assertRaises(NodeAgentUnavailable):
+            self.breaker.before_call()
+
+    def test_state_is_shared_through_the_cache(self):
+        with self.assertLogs('tom_lt.breaker', 'WARNING'):
+            self.breaker.failure()
+            self.breaker.failure()
+        self.assertEqual(CircuitBreaker('host:1', failure_threshold=2).state(), OPEN)
+        self.assertEqual(CircuitBreaker('host:2', failure_threshold=2).state(), CLOSED)
+
+    def test_one_probe_when_half_open(self):
+        with self.assertLogs('tom_lt.breaker', 'WARNING'):
+            self.breaker.failure()
+            self.breaker.failure()
+        with mock.patch('time.time', return_value=time.time() + 61):
+            self.assertEqual(self.breaker.state(), HALF_OPEN)
+            self.breaker.before_call()
+            with self.assertRaises(NodeAgentUnavailable):
+                CircuitBreaker('host:1', failure_threshold=2, reset_timeout=60).before_call()
+            # a failed probe opens the breaker for another reset_timeout
+            self.breaker.failure()
+            self.assertEqual(self.breaker.state(), OPEN)
+        with mock.patch('time.time', return_value=time.time() + 122):
+            self.breaker.before_call()
+            self.breaker.success()
+        self.assertEqual(self.breaker.state(), CLOSED)
+        self.breaker.before_call()
+
+    def test_retry_delay_is_jittered(self):
+        delays = [retry_delay(2, backoff=0.5) for _ in range(200)]
+        self.assertTrue(all(0 <= delay <= 2 for delay in delays))
+        self.assertGreater(len(set(delays)), 100)
+
+
+class TestFastFail(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        clear_clients()
+        validation_cache.clear()
+        self.addCleanup(cache.clear)
+        self.addCleanup(clear_clients)
+
+    def test_validation_fails_fast_while_open(self):
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, BREAKER_FAILURE_THRESHOLD=2, SUBMISSION_ATTEMPTS=1), \
+                self.assertLogs('tom_lt.breaker', 'WARNING'), \
+                mock.patch.object(client, 'get_client', wraps=client.get_client) as get_client:
+            errors = [LTFacility().validate_observation(rtml(i)) for i in range(4)]
+            self.assertEqual(get_breaker(LT_SETTINGS).state(), OPEN)
+        self.assertEqual(get_client.call_count, 2)
+        self.assertTrue(all('Error with connection' in e[0] for e in errors))
+        self.assertIn('not trying again', errors[-1][0])
+
+    def test_async_validation_fails_fast_while_open(self):
+        async def validate():
+            return [await LTFacility().avalidate_observation(rtml(i)) for i in range(3)]
+
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, BREAKER_FAILURE_THRESHOLD=2, SUBMISSION_ATTEMPTS=1), \
+                self.assertLogs('tom_lt.breaker', 'WARNING'):
+            errors = asyncio.run(validate())
+            self.assertEqual(get_breaker(LT_SETTINGS).state(), OPEN)
+        self.assertIn('not trying again', errors[-1][0])
+
+    def test_probe_restores_service(self):
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, BREAKER_FAILURE_THRESHOLD=1):
+                breaker = get_breaker(LT_SETTINGS)
+                with self.assertLogs('tom_lt.breaker', 'WARNING'):
+                    breaker.failure()
+                self.assertIn('not trying again', LTFacility().validate_observation(rtml(1))[0])
+                with mock.patch('time.time', return_value=time.time() + 61):
+                    self.assertEqual(LTFacility().validate_observation(rtml(2)), [])
+                self.assertEqual(breaker.state(), CLOSED)
+                response = asyncio.run(get_async_transport(LT_SETTINGS).handle_rtml(rtml(3)))
+                self.assertEqual(response.mode, 'confirmation')
+        self.assertEqual(len(node_agent.documents), 2)
+
+    def test_submission_is_retried_after_a_jittered_backoff(self):
+        failures = []
+
+        def send_rtml(rtml, timeout):
+            if not failures:
+                failures.append(ConnectionFailed('site rebooting'))
+                raise failures[0]
+            return default_respond(rtml)
+
+        with mock.patch.dict(LT_SETTINGS, DEBUG=False, SUBMISSION_ATTEMPTS=3, RETRY_BACKOFF=0.5), \
+                mock.patch.object(LTFacility, '_send_rtml', side_effect=send_rtml), \
+                mock.patch('time.sleep') as sleep, self.assertLogs('tom_lt.lt', 'WARNING'):
+            self.assertEqual(LTFacility().submit_observation(rtml(7)), ['7'])
+        self.assertEqual(sleep.call_count, 1)
+        self.assertTrue(0 <= sleep.call_args[0][0] <= 0.5)
+
+    def test_submission_gives_up_after_its_attempts(self):
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, SUBMISSION_ATTEMPTS=2,
+                             BREAKER_FAILURE_THRESHOLD=5), \
+                mock.patch('time.sleep') as sleep, self.assertLogs('tom_lt.lt', 'WARNING'):
+            with self.assertRaises(ConnectionFailed):
+                LTFacility().submit_observation(rtml(7))
+        self.assertEqual(sleep.call_count, 1)
+
+    def test_calls_that_time_out_are_not_retried(self):
+        # the node agent may have accepted a document it was too slow to answer for
+        def respond(document):
+            time.sleep(1)
+            return default_respond(document)
+
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, RETRY_BACKOFF=0):
+                with self.assertRaises(requests.ReadTimeout):
+                    LTFacility()._handle_rtml(rtml(7), timeout=0.5, attempts=3)
+                with self.assertRaises(asyncio.TimeoutError):
+                    asyncio.run(get_async_transport(LT_SETTINGS).handle_rtml(rtml(8), timeout=0.5, attempts=3))
+        self.assertEqual([document.count('uid="7"') + document.count('uid="8"') for document in node_agent.documents],
+                         [1, 1])
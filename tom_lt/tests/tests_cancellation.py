@@ -0,0 +1,114 @@
+from unittest import mock
+
+from django.test import TestCase
+from lxml import etree
+
+from tom_observations.models import ObservationRecord
+
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.standin import NodeAgentStandIn, default_respond
+from tom_lt.tests.factories import SiderealTargetFactory, create_records
+from tom_lt.tests.utils import UNREACHABLE
+
+
+def abort_respond(completed=(), rejected_projects=()):
+    """Return a ``respond`` confirming abort documents, except for the ``completed`` uids."""
+    def respond(document):
+        rtml = etree.fromstring(document.encode('utf-8'))
+        if rtml.get('mode') != 'abort':
+            return default_respond(document)
+        if rtml.find('{*}Project').get('ProjectID') in rejected_projects:
+            rtml.set('mode', 'reject')
+            etree.SubElement(rtml, 'Error').text = 'Not your proposal'
+        else:
+            rtml.set('mode', 'confirmation')
+        for schedule in rtml.iterfind('{*}Schedule'):
+            schedule.set('mode', 'complete' if schedule.get('uid') in completed else 'abort')
+        return etree.tostring(rtml, encoding='unicode')
+    return respond
+
+
+class TestCancelObservations(TestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+        self.target = SiderealTargetFactory.create()
+
+    def cancel(self, observation_ids, respond=abort_respond(), **settings):
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, **settings):
+                outcomes = LTFacility().cancel_observations(observation_ids)
+        return outcomes, node_agent.documents
+
+    def test_single_observation(self):
+        create_records(self.target, 1)
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                self.assertTrue(LTFacility().cancel_observation('0'))
+        document = etree.fromstring(node_agent.documents[0].encode('utf-8'))
+        self.assertEqual(document.get('mode'), 'abort')
+        self.assertEqual([schedule.get('uid') for schedule in document.iterfind('{*}Schedule')], ['0'])
+        self.assertEqual(ObservationRecord.objects.get().status, 'CANCELED')
+
+    def test_debug_mode_contacts_nothing(self):
+        # as the cancel view does
+        create_records(self.target, 1)
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, DEBUG=True):
+            facility = LTFacility()
+            self.assertTrue(facility.cancel_observation('0'))
+            facility.update_observation_status('0')
+        self.assertEqual(ObservationRecord.objects.get().status, 'PENDING')
+
+    def test_one_exchange_per_proposal_and_batch(self):
+        create_records(self.target, 5, project='proposal ID1')
+        create_records(self.target, 2, project='proposal ID2', start=100)
+        observation_ids = [str(i) for i in range(5)] + ['100', '101']
+        with self.assertNumQueries(2):  # the records, then one UPDATE
+            outcomes, documents = self.cancel(observation_ids, CANCEL_BATCH_SIZE=3)
+        self.assertEqual(outcomes, dict.fromkeys(observation_ids))
+        self.assertEqual(len(documents), 3)
+        projects = sorted(etree.fromstring(d.encode()).find('{*}Project').get('ProjectID') for d in documents)
+        self.assertEqual(projects, ['proposal ID1', 'proposal ID1', 'proposal ID2'])
+        self.assertEqual(ObservationRecord.objects.filter(status='CANCELED').count(), 7)
+
+    def test_outcome_per_uid(self):
+        create_records(self.target, 3, project='proposal ID1')
+        create_records(self.target, 1, project='proposal ID2', start=100)
+        ObservationRecord.objects.create(target=self.target, facility='LT', observation_id='200', parameters={})
+        outcomes, documents = self.cancel(['2', '0', '100', '200', '1', 'unknown'],
+                                          abort_respond(completed={'1'}, rejected_projects={'proposal ID2'}))
+        self.assertEqual(list(outcomes), ['2', '0', '100', '200', '1', 'unknown'])
+        self.assertIsNone(outcomes['0'])
+        self.assertIsNone(outcomes['2'])
+        self.assertIn('could not cancel', outcomes['1'])
+        self.assertEqual(outcomes['100'], 'Not your proposal')
+        self.assertEqual(outcomes['200'], 'No proposal recorded for this observation')
+        self.assertEqual(outcomes['unknown'], 'No observation recorded with that id')
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(sorted(ObservationRecord.objects.filter(status='CANCELED').values_list(
+            'observation_id', flat=True)), ['0', '2'])
+
+    def test_only_a_confirmation_cancels(self):
+        create_records(self.target, 2)
+
+        def fail(document):
+            # a reply that names none of the requests
+            rtml = etree.fromstring(document.encode('utf-8'))
+            rtml.set('mode', 'fail')
+            for schedule in rtml.findall('{*}Schedule'):
+                rtml.remove(schedule)
+            return etree.tostring(rtml, encoding='unicode')
+
+        outcomes, _ = self.cancel(['0', '1'], fail)
+        self.assertEqual(outcomes, dict.fromkeys(['0', '1'],
+                                                 'The Liverpool Telescope did not confirm the cancellation (fail)'))
+        self.assertFalse(ObservationRecord.objects.filter(status='CANCELED').exists())
+
+    def test_connection_errors(self):
+        create_records(self.target, 2)
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE):
+            outcomes = LTFacility().cancel_observations(['0', '1'])
+            self.assertFalse(LTFacility().cancel_observation('0'))
+        self.assertTrue(all(error.startswith('Error with connection') for error in outcomes.values()))
+        self.assertFalse(ObservationRecord.objects.filter(status='CANCELED').exists())
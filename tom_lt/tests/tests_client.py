@@ -0,0 +1,61 @@
+import tempfile
+import threading
+
+from django.test import SimpleTestCase, override_settings
+
+from tom_lt.client import clear_clients, get_client
+from tom_lt.standin import NodeAgentStandIn
+
+RTML = ('<RTML xmlns="http://www.rtml.org/v3.1a" mode="inquiry" uid="1" version="3.1a">'
+        '<Project ProjectID="proposal ID1"/></RTML>')
+
+
+class TestClientRegistry(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+        self.addCleanup(clear_clients)
+
+    def _settings(self, node_agent, **kwargs):
+        return dict(node_agent.settings, WSDL_CACHE_DIR=self.cache_dir.name, **kwargs)
+
+    def test_wsdl_is_fetched_once_per_process(self):
+        with NodeAgentStandIn() as node_agent:
+            lt_settings = self._settings(node_agent)
+            for _ in range(3):
+                get_client(lt_settings).service.handle_rtml(RTML)
+            threads = [threading.Thread(target=get_client, args=(lt_settings,)) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        # one WSDL GET plus three handle_rtml POSTs, all on a single kept-alive connection
+        self.assertEqual(len(node_agent.documents), 3)
+        self.assertEqual(node_agent.connections, 1)
+
+    def test_credentials_are_sent_as_headers(self):
+        with NodeAgentStandIn() as node_agent:
+            get_client(self._settings(node_agent)).service.handle_rtml(RTML)
+        self.assertEqual(node_agent.headers[0]['Username'], 'tom')
+        self.assertEqual(node_agent.headers[0]['Password'], 'secret')
+
+    def test_clients_are_keyed_by_credentials(self):
+        with NodeAgentStandIn() as node_agent:
+            client = get_client(self._settings(node_agent))
+            self.assertIs(get_client(self._settings(node_agent)), client)
+            self.assertIsNot(get_client(self._settings(node_agent, username='other')), client)
+
+    def test_wsdl_cache_survives_registry_reset(self):
+        with NodeAgentStandIn() as node_agent:
+            get_client(self._settings(node_agent))
+            connections = node_agent.connections
+            clear_clients()
+            get_client(self._settings(node_agent))
+            self.assertEqual(node_agent.connections, connections)
+
+    def test_changing_facilities_invalidates_clients(self):
+        with NodeAgentStandIn() as node_agent:
+            client = get_client(self._settings(node_agent))
+            with override_settings(FACILITIES={'LT': node_agent.settings}):
+                self.assertIsNot(get_client(self._settings(node_agent)), client)
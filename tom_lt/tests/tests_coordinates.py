@@ -0,0 +1,70 @@
+from types import SimpleNamespace
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import SkyCoord
+from django.test import SimpleTestCase
+from lxml import etree
+
+from tom_lt.coordinates import format_coordinates
+from tom_lt.rtml import render_targets
+
+
+def skycoord_fields(ra, dec, epoch):
+    """The fields written by the original, SkyCoord based, target builder."""
+    c = SkyCoord(ra=ra*u.degree, dec=dec*u.degree)
+    sign = '+' if c.dec.signed_dms.sign == 1.0 else '-'
+    return {
+        'Hours': str(int(c.ra.hms.h)),
+        'Minutes': str(int(c.ra.hms.m)),
+        'Seconds': str(c.ra.hms.s),
+        'Degrees': sign + str(int(c.dec.signed_dms.d)),
+        'Arcminutes': str(int(c.dec.signed_dms.m)),
+        'Arcseconds': str(c.dec.signed_dms.s),
+        'Equinox': str(epoch),
+    }
+
+
+class TestFormatCoordinates(SimpleTestCase):
+    EDGE_CASES = [
+        (0.0, 0.0), (0.0, -0.0), (-0.0, 0.5), (-15.0, -0.25), (360.0, 90.0), (725.5, -90.0),
+        (359.99999999, 89.99999999), (14.999999999999, -0.999999999999), (83.63308, 22.0145),
+        (123.456789, -45.987654), (1e-12, -1e-12), (180.0, 45.0),
+    ]
+
+    def test_matches_skycoord(self):
+        rng = np.random.default_rng(42)
+        ras = list(rng.uniform(-360, 720, 500)) + [ra for ra, _ in self.EDGE_CASES]
+        decs = list(rng.uniform(-90, 90, 500)) + [dec for _, dec in self.EDGE_CASES]
+        epochs = [2000.0] * len(ras)
+        fields = format_coordinates(ras, decs, epochs)
+        for ra, dec, epoch, result in zip(ras, decs, epochs, fields):
+            with self.subTest(ra=ra, dec=dec):
+                self.assertEqual(result, skycoord_fields(ra, dec, epoch))
+
+    def test_single_target_matches_batch(self):
+        ras, decs = zip(*self.EDGE_CASES)
+        batch = format_coordinates(ras, decs, [2000] * len(ras))
+        for ra, dec, expected in zip(ras, decs, batch):
+            self.assertEqual(format_coordinates([ra], [dec], [2000]), [expected])
+
+    def test_equinox_is_written_as_given(self):
+        fields = format_coordinates([10.0, 20.0], [1.0, 2.0], [2000, 2000.0])
+        self.assertEqual([f['Equinox'] for f in fields], ['2000', '2000.0'])
+
+    def test_rejects_declination_beyond_pole(self):
+        with self.assertRaises(ValueError):
+            format_coordinates([10.0], [90.5], [2000.0])
+
+
+class TestRenderTargets(SimpleTestCase):
+    def test_fragments_in_target_order(self):
+        targets = [SimpleNamespace(name='t{0}'.format(i), ra=i * 7.5, dec=i - 5.0, epoch=2000.0) for i in range(10)]
+        elements = [etree.fromstring(fragment) for fragment in render_targets(targets)]
+        self.assertEqual([e.get('name') for e in elements], [t.name for t in targets])
+        for target, element in zip(targets, elements):
+            expected = skycoord_fields(target.ra, target.dec, target.epoch)
+            self.assertEqual(element.findtext('Coordinates/Declination/Degrees'), expected['Degrees'])
+            self.assertEqual(element.findtext('Coordinates/RightAscension/Seconds'), expected['Seconds'])
+            self.assertEqual([child.tag for child in element.find('Coordinates')],
+                             ['RightAscension', 'Declination', 'Equinox'])
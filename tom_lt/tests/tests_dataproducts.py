@@ -0,0 +1,134 @@
+import hashlib
+import io
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+import requests
+from astropy.io import fits
+from django.test import TestCase, override_settings
+from tom_dataproducts.models import DataProduct
+from tom_observations.models import ObservationRecord
+
+from tom_lt.client import clear_clients
+from tom_lt.dataproducts import CHUNK_SIZE, ChecksumError, download, parse_products
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.response import parse_response
+from tom_lt.tests.archive import ArchiveStandIn
+from tom_lt.tests.factories import SiderealTargetFactory
+from tom_lt.standin import NodeAgentStandIn
+from tom_lt.tests.node_agent import status_respond
+
+
+def fits_file(seed, shape=(64, 64)):
+    """Return a multi-extension FITS file with CHECKSUM/DATASUM keywords."""
+    rng = np.random.default_rng(seed)
+    hdul = fits.HDUList([fits.PrimaryHDU(rng.normal(size=shape)), fits.ImageHDU(rng.normal(size=shape))])
+    buffer = io.BytesIO()
+    hdul.writeto(buffer, checksum=True)
+    return buffer.getvalue()
+
+
+class TestDataProducts(TestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        downloads = tempfile.TemporaryDirectory()
+        self.addCleanup(downloads.cleanup)
+        self.download_dir = downloads.name
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        self.files = {'h_e_20240101_{0}_1_1_1.fits'.format(i): fits_file(i) for i in range(1, 5)}
+        self.record = ObservationRecord.objects.create(
+            target=SiderealTargetFactory.create(), facility='LT', observation_id='42', status='COMPLETED',
+            parameters={'project': 'proposal ID1'})
+
+    def save(self, archive, md5=True, **settings):
+        products = {'42': [(archive.url(name), hashlib.md5(data).hexdigest() if md5 else None)
+                           for name, data in self.files.items()]}
+        with NodeAgentStandIn(status_respond({'42': 'complete'}, products)) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, DOWNLOAD_DIR=self.download_dir, **settings):
+                return LTFacility().save_data_products(self.record)
+
+    def test_products_are_streamed_and_registered(self):
+        with ArchiveStandIn(self.files) as archive:
+            saved = self.save(archive)
+        self.assertEqual(sorted(dp.product_id for dp in saved), sorted(self.files))
+        for dp in saved:
+            with dp.data.open('rb') as f:
+                self.assertEqual(f.read(), self.files[dp.product_id])
+            self.assertEqual(dp.observation_record, self.record)
+        self.assertEqual(os.listdir(self.download_dir), [])
+
+    def test_stored_products_are_not_downloaded_again(self):
+        with ArchiveStandIn(self.files) as archive:
+            self.save(archive)
+            archive.requests.clear()
+            saved = self.save(archive)
+        self.assertEqual(archive.requests, [])
+        self.assertEqual(len(saved), len(self.files))
+        self.assertEqual(DataProduct.objects.count(), len(self.files))
+
+    def test_interrupted_downloads_resume(self):
+        name = sorted(self.files)[0]
+        cut_after = CHUNK_SIZE + 1000
+        self.assertGreater(len(self.files[name]), cut_after)
+        with ArchiveStandIn(self.files, cut_after={name: cut_after}) as archive:
+            saved = self.save(archive)
+        self.assertEqual(len(saved), len(self.files))
+        # the chunks received in full are kept
+        self.assertEqual([r for r in archive.requests if r[0] == name],
+                         [(name, None), (name, 'bytes={0}-'.format(CHUNK_SIZE))])
+        with DataProduct.objects.get(product_id=name).data.open('rb') as f:
+            self.assertEqual(f.read(), self.files[name])
+
+    def test_partial_file_from_an_earlier_run_is_resumed(self):
+        name = sorted(self.files)[0]
+        with open(os.path.join(self.download_dir, name + '.part'), 'wb') as f:
+            f.write(self.files[name][:5000])
+        with ArchiveStandIn(self.files) as archive:
+            self.save(archive)
+        self.assertIn((name, 'bytes=5000-'), archive.requests)
+        with DataProduct.objects.get(product_id=name).data.open('rb') as f:
+            self.assertEqual(f.read(), self.files[name])
+
+    def test_checksum_mismatch_is_not_registered(self):
+        name = sorted(self.files)[0]
+        corrupt = bytearray(self.files[name])
+        corrupt[-100] ^= 1
+        with ArchiveStandIn(dict(self.files, **{name: bytes(corrupt)})) as archive:
+            with self.assertLogs('tom_lt.dataproducts', level='ERROR') as logs:
+                # without an MD5 in the listing, the FITS checksums catch the corruption
+                saved = self.save(archive, md5=False)
+        self.assertIn('checksum mismatch', logs.output[0])
+        self.assertNotIn(name, [dp.product_id for dp in saved])
+        self.assertFalse(DataProduct.objects.filter(product_id=name).exists())
+        self.assertEqual(os.listdir(self.download_dir), [])
+
+    def test_md5_mismatch(self):
+        name = sorted(self.files)[0]
+        product = {'id': name, 'filename': name, 'url': None, 'md5': hashlib.md5(b'other').hexdigest()}
+        with ArchiveStandIn(self.files) as archive, requests.Session() as session:
+            product['url'] = archive.url(name)
+            with self.assertRaises(ChecksumError):
+                download(session, product, self.download_dir)
+
+    def test_concurrent_downloads_are_bounded(self):
+        self.files.update({'h_e_20240102_{0}_1_1_1.fits'.format(i): fits_file(i, (8, 8)) for i in range(8)})
+        with ArchiveStandIn(self.files, delay=0.05) as archive:
+            saved = self.save(archive, MAX_CONCURRENT_DOWNLOADS=3)
+        self.assertEqual(len(saved), len(self.files))
+        self.assertEqual(archive.max_in_flight, 3)
+
+    def test_parse_products(self):
+        reply = parse_response(
+            '<RTML xmlns="http://www.rtml.org/v3.1a" mode="update"><Schedule uid="42">'
+            '<ImageData md5="abc">http://archive/data/h_e_1.fits</ImageData><ImageData/></Schedule>'
+            '<Schedule uid="43"><ImageData>http://archive/data/h_e_2.fits</ImageData></Schedule></RTML>')
+        self.assertEqual(parse_products(reply, '42'), [
+            {'id': 'h_e_1.fits', 'filename': 'h_e_1.fits', 'url': 'http://archive/data/h_e_1.fits', 'md5': 'abc'}])
@@ -0,0 +1,119 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import erfa
+import numpy as np
+from django.test import SimpleTestCase, TestCase
+
+from tom_lt import ephemeris
+from tom_lt.ephemeris import (SPEED_OF_LIGHT, clear_ephemerides, geocentric_coordinates, orbital_elements,
+                              separation)
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.tests.factories import NonSiderealTargetFactory
+from tom_lt.tests.tests_payload import ioo_data, valid_form
+
+# Mars's mean elements at J2000 (Standish, "Keplerian Elements for Approximate Positions of the Major Planets")
+MARS = dict(scheme='JPL_MAJOR_PLANET', epoch_of_elements=51544.5, mean_anomaly=19.39019754,
+            arg_of_perihelion=-73.50316850, lng_asc_node=49.55953891, inclination=1.84969142,
+            eccentricity=0.09339410, semimajor_axis=1.52371034)
+
+
+# half an hour, during which Mars moves about 30" either side of where it is in the middle
+WINDOW = {'startdate': '2000-02-02', 'starttime': '11:45', 'enddate': '2000-02-02', 'endtime': '12:15'}
+
+
+def reference_coordinates(mjd):
+    """The astrometric position of Mars from ERFA's planetary theory, which includes the perturbations."""
+    earth = erfa.epv00(2400000.5, mjd)[0]['p']
+    vector = erfa.plan94(2400000.5, mjd, 4)['p'] - earth
+    vector = erfa.plan94(2400000.5, mjd - np.linalg.norm(vector, axis=-1) / SPEED_OF_LIGHT, 4)['p'] - earth
+    return (np.degrees(np.arctan2(vector[:, 1], vector[:, 0])) % 360,
+            np.degrees(np.arcsin(vector[:, 2] / np.linalg.norm(vector, axis=-1))))
+
+
+class TestGeocentricCoordinates(SimpleTestCase):
+    def test_matches_reference_positions(self):
+        mjd = 51544.5 + np.arange(0, 120, 7.5)
+        ra, dec, _ = geocentric_coordinates(orbital_elements(SimpleNamespace(name='Mars', **MARS)), mjd)
+        self.assertLess(separation(ra, dec, *reference_coordinates(mjd)).max(), 0.02)
+
+    def test_comet_elements_give_the_same_orbit(self):
+        e, a = 0.6, 3.0
+        period = 2 * np.pi / ephemeris.GAUSSIAN_GRAVITATIONAL_CONSTANT * a ** 1.5
+        minor_planet = ('MPC_MINOR_PLANET', 60000.0, 90.0, 40.0, 120.0, 10.0, e, a)
+        # a quarter of an orbit after perihelion, its mean anomaly is 90 degrees
+        comet = ('MPC_COMET', 60000.0 - period / 4, 40.0, 120.0, 10.0, e, a * (1 - e))
+        mjd = 60000.0 + np.arange(10.0)
+        for expected, actual in zip(geocentric_coordinates(minor_planet, mjd), geocentric_coordinates(comet, mjd)):
+            self.assertTrue(np.allclose(expected, actual, atol=1e-9))
+
+    def test_near_parabolic_orbits_are_continuous(self):
+        mjd = 60000.0 + np.arange(-50.0, 50.0, 5)
+        positions = [geocentric_coordinates(('MPC_COMET', 60000.0, 10.0, 80.0, 100.0, e, 0.8), mjd)
+                     for e in (1 - 1e-5, 1.0, 1 + 1e-5)]
+        for other in (positions[0], positions[2]):
+            self.assertLess(separation(positions[1][0], positions[1][1], other[0], other[1]).max(), 1e-3)
+
+    def test_missing_elements(self):
+        with self.assertRaisesRegex(ValueError, 'semimajor_axis'):
+            orbital_elements(SimpleNamespace(name='Mars', **dict(MARS, semimajor_axis=None)))
+        with self.assertRaises(ValueError):
+            orbital_elements(SimpleNamespace(name='Mars', **dict(MARS, scheme='TLE')))
+
+
+class TestNonSiderealPayloads(TestCase):
+    def setUp(self):
+        clear_ephemerides()
+        self.addCleanup(clear_ephemerides)
+        self.target = NonSiderealTargetFactory.create(**MARS)
+
+    def test_coordinates_are_those_in_the_middle_of_the_window(self):
+        data = dict(ioo_data(self.target.id, ('R',)), **WINDOW)
+        payload = valid_form('IOO', data).observation_payload()
+        middle = datetime(2000, 2, 2, 12, tzinfo=timezone.utc).timestamp() / 86400 + ephemeris.UNIX_EPOCH_MJD
+        ra, dec = (value[0] for value in reference_coordinates(np.array([middle])))
+        self.assertIn('<Hours>{0}</Hours><Minutes>{1}</Minutes>'.format(int(ra / 15), int(ra * 4 % 60)), payload)
+        self.assertIn('<Degrees>-{0}</Degrees>'.format(int(-dec)), payload)
+        self.assertIn('<Equinox>2000.0</Equinox>', payload)
+
+    def test_ephemeris_is_computed_once_per_window(self):
+        data = dict(ioo_data(self.target.id, ('R', 'G')), **WINDOW)
+        with mock.patch.object(ephemeris, 'geocentric_coordinates', wraps=geocentric_coordinates) as computed:
+            # validation and submission build the payload in different requests, with different forms
+            payloads = [valid_form('IOO', data).observation_payload() for _ in range(3)]
+            self.assertEqual(computed.call_count, 1)
+            valid_form('IOO', dict(data, endtime='12:20')).observation_payload()
+            self.assertEqual(computed.call_count, 2)
+            self.target.semimajor_axis = 1.6
+            self.target.save()
+            valid_form('IOO', data).observation_payload()
+            self.assertEqual(computed.call_count, 3)
+        self.assertEqual(len(set(payload[payload.index('<Target'):] for payload in payloads)), 1)
+
+    def test_windows_too_long_for_the_motion_are_turned_down(self):
+        # Mars moves about 2' an hour
+        data = dict(ioo_data(self.target.id, ('R',)), startdate='2000-02-01', enddate='2000-02-03')
+        form = LTFacility.observation_forms['IOO'](data=data)
+        with mock.patch.dict(LT_SETTINGS, DEBUG=True):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(list(form.errors), ['enddate'])
+        self.assertIn('make the window shorter than about 1.0 hours', form.errors['enddate'][0])
+        with mock.patch.dict(LT_SETTINGS, MAX_TARGET_MOTION=None):
+            valid_form('IOO', data)
+        with mock.patch.dict(LT_SETTINGS, MAX_TARGET_MOTION=3600):
+            valid_form('IOO', data)
+
+    def test_unsupported_schemes_are_turned_down(self):
+        target = NonSiderealTargetFactory.create(**dict(MARS, scheme='TLE'))
+        form = LTFacility.observation_forms['IOO'](data=dict(ioo_data(target.id, ('R',)), **WINDOW))
+        with mock.patch.dict(LT_SETTINGS, DEBUG=True):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), ["Non-sidereal targets of scheme 'TLE' are not supported"])
+
+    def test_targets_with_missing_elements_are_turned_down(self):
+        target = NonSiderealTargetFactory.create(**dict(MARS, name='Mars', eccentricity=None, semimajor_axis=None))
+        form = LTFacility.observation_forms['IOO'](data=dict(ioo_data(target.id, ('R',)), **WINDOW))
+        with mock.patch.dict(LT_SETTINGS, DEBUG=True):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(form.non_field_errors(), ['Mars has no eccentricity, semimajor_axis'])
@@ -0,0 +1,28 @@
+from unittest import mock
+
+from django import forms
+from django.test import SimpleTestCase
+
+from tom_lt.lt import IOO_FILTERS, LT_IOO_ObservationForm
+
+
+class TestIOOFilterFields(SimpleTestCase):
+    def test_fields_are_declared_on_the_class(self):
+        for filter, _, _, _ in IOO_FILTERS:
+            self.assertIsInstance(LT_IOO_ObservationForm.base_fields['exp_time_' + filter], forms.FloatField)
+            self.assertIsInstance(LT_IOO_ObservationForm.base_fields['exp_count_' + filter], forms.IntegerField)
+
+    def test_instantiation_creates_no_fields(self):
+        with mock.patch.object(forms.Field, '__init__', side_effect=AssertionError('field created')):
+            form = LT_IOO_ObservationForm()
+        self.assertIsNot(form.fields['exp_time_U'], LT_IOO_ObservationForm.base_fields['exp_time_U'])
+
+    def test_only_the_first_filter_is_labelled(self):
+        labels = [LT_IOO_ObservationForm.base_fields['exp_count_' + filter].label for filter, _, _, _ in IOO_FILTERS]
+        self.assertEqual(labels, ['No. of integrations'] + [''] * (len(IOO_FILTERS) - 1))
+
+    def test_layout_shows_every_filter(self):
+        layout_fields = {pointer.name for pointer in LT_IOO_ObservationForm().helper.layout.get_field_names()}
+        for filter, _, _, _ in IOO_FILTERS:
+            self.assertIn('exp_time_' + filter, layout_fields)
+            self.assertIn('exp_count_' + filter, layout_fields)
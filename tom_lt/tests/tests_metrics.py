@@ -0,0 +1,99 @@
+import asyncio
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility, validation_cache
+from tom_lt.metrics import event_counted, span, span_finished
+from tom_lt.tests.factories import SiderealTargetFactory
+from tom_lt.standin import NodeAgentStandIn, default_respond
+from tom_lt.tests.tests_payload import form_data, valid_form
+from tom_lt.tests.utils import rtml
+
+
+def respond(document):
+    if 'rejected' in document:
+        return document.replace('mode="inquiry"', 'mode="reject"')
+    if 'broken' in document:
+        raise RuntimeError('node agent exploded')
+    return default_respond(document)
+
+
+class Recorder:
+    """Collects the spans and events sent while it is connected."""
+
+    def __init__(self, test):
+        self.spans = []
+        self.events = []
+        span_finished.connect(self.span)
+        event_counted.connect(self.event)
+        test.addCleanup(span_finished.disconnect, self.span)
+        test.addCleanup(event_counted.disconnect, self.event)
+
+    def span(self, sender, phase, duration, failed, **kwargs):
+        self.spans.append((phase, failed))
+        assert sender == 'LT' and duration >= 0
+
+    def event(self, sender, event, **kwargs):
+        self.events.append(event)
+
+    def phases(self):
+        return [phase for phase, _ in self.spans]
+
+
+class TestMetrics(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        validation_cache.clear()
+        self.addCleanup(clear_clients)
+
+    def _validate(self, *payloads, validate=None):
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, VALIDATION_MODE='remote'):
+                facility = LTFacility()
+                return [(validate or facility.validate_observation)(payload) for payload in payloads]
+
+    def test_validation_spans_and_counters(self):
+        recorder = Recorder(self)
+        self._validate(rtml(1), rtml(2, 'rejected'), rtml(3, 'broken'))
+        self.assertEqual(recorder.phases()[:6], ['schema', 'visibility', 'wsdl_load', 'handle_rtml', 'parse_response',
+                                                 'validate_observation'])
+        self.assertEqual(recorder.phases().count('validate_observation'), 3)
+        self.assertEqual(recorder.spans[-1], ('validate_observation', True))
+        self.assertEqual(recorder.events, ['offer', 'reject', 'transport_error'])
+
+    def test_async_validation(self):
+        recorder = Recorder(self)
+        facility = LTFacility()
+        self._validate(rtml(1), rtml(2, 'rejected'),
+                       validate=lambda payload: asyncio.run(facility.avalidate_observation(payload)))
+        self.assertIn('wsdl_load', recorder.phases())
+        self.assertEqual(recorder.phases()[-3:], ['handle_rtml', 'parse_response', 'validate_observation'])
+        self.assertEqual(recorder.events, ['offer', 'reject'])
+
+    def test_submission(self):
+        recorder = Recorder(self)
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                LTFacility().submit_observation(rtml(1))
+        self.assertEqual(recorder.phases()[-3:], ['handle_rtml', 'parse_response', 'submit_observation'])
+        self.assertEqual(recorder.events, ['confirmation'])
+
+    def test_nothing_is_timed_without_receivers(self):
+        with mock.patch('time.perf_counter') as perf_counter:
+            with span('observation_payload'):
+                pass
+        perf_counter.assert_not_called()
+
+
+class TestPayloadSpans(TestCase):
+    def test_observation_payload(self):
+        recorder = Recorder(self)
+        target = SiderealTargetFactory.create()
+        form = valid_form('IOO', form_data(target.id)['IOO'])
+        # validating the form built the payload once already; the target is only looked up then
+        self.assertEqual(recorder.phases(), ['target_lookup', 'coordinates', 'observation_payload', 'schema'])
+        # and submitting it reuses that payload
+        self.assertEqual(form.observation_payload(), form.observation_payload())
+        self.assertEqual(recorder.phases()[4:], [])
@@ -0,0 +1,162 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from tom_observations.models import ObservationRecord
+
+from tom_lt import outbox
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.models import OutboxSubmission
+from tom_lt.tests.factories import SiderealTargetFactory
+from tom_lt.standin import NodeAgentStandIn
+from tom_lt.tests.node_agent import status_respond
+from tom_lt.tests.utils import UNREACHABLE, rtml
+
+
+def reject_respond(document):
+    return document.replace('mode="request"', 'mode="reject"').replace(
+        '</RTML>', '<Error>Target not visible</Error></RTML>')
+
+
+class TestOutbox(TestCase):
+    def setUp(self):
+        cache.clear()
+        clear_clients()
+        self.addCleanup(cache.clear)
+        self.addCleanup(clear_clients)
+        self.target = SiderealTargetFactory.create()
+
+    def submit(self, *uids):
+        """Submit payloads as ObservationCreateView does, returning their records."""
+        records = []
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, BREAKER_FAILURE_THRESHOLD=100, SUBMISSION_MODE='outbox'):
+            for uid in uids:
+                for observation_id in LTFacility().submit_observation(rtml(uid)):
+                    records.append(ObservationRecord.objects.create(
+                        target=self.target, facility='LT', parameters={'project': 'proposal ID1'},
+                        observation_id=observation_id))
+        return records
+
+    def drain(self, respond=None, **settings):
+        with NodeAgentStandIn(respond or status_respond({})) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, **settings):
+                outbox.drain(LTFacility(), LT_SETTINGS)
+        return node_agent.documents
+
+    def test_submission_only_queues_the_payload(self):
+        records = self.submit('101', '102')
+        self.assertEqual([record.observation_id for record in records], ['101', '102'])
+        self.assertEqual(list(OutboxSubmission.objects.values_list('uid', 'project', 'state')),
+                         [('101', 'proposal ID1', 'queued'), ('102', 'proposal ID1', 'queued')])
+
+    def test_queueing_is_idempotent_by_uid(self):
+        self.submit('101', '101')
+        self.assertEqual(OutboxSubmission.objects.count(), 1)
+
+    def test_confirmed_submissions_are_pending(self):
+        self.submit('101', '102')
+        documents = self.drain()
+        self.assertEqual(len(documents), 2)
+        self.assertEqual(set(OutboxSubmission.objects.values_list('state', flat=True)), {'sent'})
+        self.assertEqual(set(ObservationRecord.objects.values_list('status', flat=True)), {'PENDING'})
+        self.assertEqual(self.drain(), [])
+
+    def test_rejections_fail_the_record(self):
+        self.submit('101')
+        with self.assertLogs('tom_lt.lt', 'ERROR'):
+            self.drain(reject_respond)
+        submission = OutboxSubmission.objects.get()
+        self.assertEqual((submission.state, submission.error), ('rejected', 'Target not visible'))
+        self.assertEqual(ObservationRecord.objects.get().status, 'FAILED')
+
+    def test_failed_attempts_are_retried_without_duplicates(self):
+        self.submit('101', '102')
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, BREAKER_FAILURE_THRESHOLD=100), \
+                self.assertLogs('tom_lt.outbox', 'WARNING'):
+            outbox.drain(LTFacility(), LT_SETTINGS)
+        self.assertEqual(list(OutboxSubmission.objects.values_list('state', 'attempts')), [('queued', 1)] * 2)
+        self.assertEqual(self.drain(), [])  # not due yet
+
+        OutboxSubmission.objects.update(next_attempt=timezone.now())
+        # the first attempt at 101 reached the node agent, but its reply was lost
+        documents = self.drain(status_respond({'101': 'confirmation'}))
+        self.assertEqual(len(documents), 3)  # an inquiry for each, and the request for 102 only
+        self.assertEqual(sum('mode="request"' in document for document in documents), 1)
+        self.assertEqual(set(OutboxSubmission.objects.values_list('state', flat=True)), {'sent'})
+        self.assertEqual(set(ObservationRecord.objects.values_list('status', flat=True)), {'PENDING'})
+
+    def test_gives_up_after_its_attempts(self):
+        self.submit('101')
+        OutboxSubmission.objects.update(attempts=2)
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, BREAKER_FAILURE_THRESHOLD=100, OUTBOX_MAX_ATTEMPTS=3), \
+                self.assertLogs('tom_lt.outbox'):
+            outbox.drain(LTFacility(), LT_SETTINGS)
+        self.assertEqual(OutboxSubmission.objects.get().state, 'failed')
+        self.assertEqual(ObservationRecord.objects.get().status, 'FAILED')
+
+    def test_a_submission_is_claimed_once(self):
+        self.submit('101', '102', '103')
+        now = timezone.now()
+        first = outbox.claim(2, 60, now)
+        second = outbox.claim(2, 60, now)
+        self.assertEqual(len(first), 2)
+        self.assertEqual([submission.uid for submission in second], ['103'])
+        self.assertEqual(outbox.claim(2, 60, now), [])
+        # the lease of a worker that died expires
+        self.assertEqual(len(outbox.claim(5, 60, now + timedelta(seconds=61))), 3)
+
+    def test_undelivered_observations_are_not_polled(self):
+        self.submit('101')
+        self.drain()
+        self.submit('102')
+        with NodeAgentStandIn(status_respond({'101': 'update'})) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, SUBMISSION_MODE='outbox'):
+                self.assertEqual(LTFacility().update_all_observation_statuses(target=self.target), [])
+        self.assertEqual(dict(ObservationRecord.objects.values_list('observation_id', 'status')),
+                         {'101': 'IN_PROGRESS', '102': ''})
+
+    def test_outcomes_wait_for_their_record(self):
+        # a worker sends the payload before the TOM has saved its record
+        with mock.patch.dict(LT_SETTINGS, DEBUG=False, SUBMISSION_MODE='outbox'):
+            LTFacility().submit_observation(rtml('101'))
+            LTFacility().submit_observation(rtml('102'))
+        with self.assertLogs('tom_lt.outbox', 'INFO'):
+            self.drain()
+        self.assertEqual(list(OutboxSubmission.objects.values_list('state', 'record_status')),
+                         [('sent', 'PENDING')] * 2)
+        for uid in ('101', '102'):
+            ObservationRecord.objects.create(target=self.target, facility='LT',
+                                             parameters={'project': 'proposal ID1'}, observation_id=uid)
+        self.assertEqual(self.drain(), [])
+        self.assertEqual(set(ObservationRecord.objects.values_list('status', flat=True)), {'PENDING'})
+        self.assertEqual(set(OutboxSubmission.objects.values_list('record_status', flat=True)), {''})
+
+    def test_status_polls_apply_waiting_outcomes(self):
+        with mock.patch.dict(LT_SETTINGS, DEBUG=False, SUBMISSION_MODE='outbox'):
+            LTFacility().submit_observation(rtml('101'))
+        with self.assertLogs('tom_lt.outbox', 'INFO'):
+            self.drain(reject_respond)
+        record = ObservationRecord.objects.create(target=self.target, facility='LT',
+                                                  parameters={'project': 'proposal ID1'}, observation_id='101')
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, SUBMISSION_MODE='outbox'):
+            self.assertEqual(LTFacility().update_all_observation_statuses(target=self.target), [])
+        record.refresh_from_db()
+        self.assertEqual(record.status, 'FAILED')
+
+    def test_management_command(self):
+        self.submit('101')
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                call_command('runltoutbox', '--once', '--workers=2')
+        self.assertEqual(OutboxSubmission.objects.get().state, 'sent')
+
+    def test_unknown_submission_mode(self):
+        with mock.patch.dict(LT_SETTINGS, DEBUG=False, SUBMISSION_MODE='carrier pigeon'):
+            with self.assertRaises(ImproperlyConfigured):
+                LTFacility().submit_observation(rtml('101'))
@@ -0,0 +1,219 @@
+import json
+import os
+import random
+import threading
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from lxml import etree
+
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility, Target, validation_cache
+from tom_lt.payload import RTMLPayload
+from tom_lt.rtml import render_targets
+from tom_lt.standin import NodeAgentStandIn
+from tom_lt.tests.factories import SiderealTargetFactory
+from tom_lt.tests.legacy_rtml import legacy_payload
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+IOO_FILTERS = ('U', 'R', 'G', 'I', 'Z', 'B', 'V',
+               'Halpha6566', 'Halpha6634', 'Halpha6705', 'Halpha6755', 'Halpha6822')
+
+# Targets of the reference payloads in fixtures/payloads.json, which were produced by the original RTML
+# builders. They include a negative declination above -1 degree and a declination of -0.0.
+FIXTURE_TARGETS = [
+    SimpleNamespace(name='SN2024abc', ra=83.63308, dec=22.0145, epoch=2000.0),
+    SimpleNamespace(name='neg0', ra=350.000001, dec=-0.25, epoch=2000.0),
+    SimpleNamespace(name='negzero', ra=0.0, dec=-0.0, epoch=2000),
+    SimpleNamespace(name='south', ra=123.456789, dec=-45.987654, epoch=2000.0),
+]
+FIXTURE_TIME = 1700000000.5
+
+
+def common_data(target_id=1):
+    return {'facility': 'LT', 'target_id': target_id, 'observation_type': '', 'project': 'proposal ID1',
+            'startdate': '2024-01-01', 'starttime': '12:00', 'enddate': '2024-01-02', 'endtime': '12:00',
+            'max_airmass': 2, 'max_seeing': 1.2, 'max_skybri': 1, 'photometric': 'light'}
+
+
+def ioo_data(target_id=1, filters=None):
+    """IO:O form data; ``filters`` lists the filters to expose (all, cycling the counts, by default)."""
+    data = dict(common_data(target_id), binning='2x2')
+    for i, name in enumerate(IOO_FILTERS):
+        data['exp_time_' + name] = 120 + i
+        if filters is None:
+            data['exp_count_' + name] = i % 3
+        else:
+            data['exp_count_' + name] = 1 if name in filters else 0
+    return data
+
+
+def form_data(target_id=1):
+    return {
+        'IOO': ioo_data(target_id),
+        'IOI': dict(common_data(target_id), exp_time=60, exp_count=5),
+        'SPRAT': dict(common_data(target_id), exp_time=300, exp_count=1, grating='blue'),
+        'FRODO': dict(common_data(target_id), exp_time_blue=100, exp_count_blue=1, res_blue='low',
+                      exp_time_red=200, exp_count_red=2, res_red='high'),
+    }
+
+
+def valid_form(observation_type, data):
+    form = LTFacility.observation_forms[observation_type](data=data)
+    with mock.patch.dict(LT_SETTINGS, DEBUG=True):
+        assert form.is_valid(), form.errors
+    return form
+
+
+class TestPayloadOutput(SimpleTestCase):
+    def test_payloads_match_fixtures(self):
+        with open(os.path.join(FIXTURES, 'payloads.json')) as f:
+            expected = json.load(f)
+        for target in FIXTURE_TARGETS:
+            for observation_type, data in form_data().items():
+                with self.subTest(target=target.name, observation_type=observation_type), \
+                        mock.patch.object(Target.objects, 'get', return_value=target), \
+                        mock.patch('tom_lt.lt.new_uid', return_value=str(int(FIXTURE_TIME))):
+                    payload = valid_form(observation_type, data).observation_payload()
+                    self.assertEqual(payload, expected[target.name + '-' + observation_type])
+
+    def test_payloads_match_legacy_builders(self):
+        rng = random.Random(7)
+        names = ['plain', 'AT 2024xyz', 'a&b <c> "d" \'e\'', 'tab\there', 'é']
+        for i in range(40):
+            target = SimpleNamespace(name=rng.choice(names), ra=rng.uniform(-10, 370), dec=rng.uniform(-90, 90),
+                                     epoch=rng.choice([2000, 2000.0, 1950.5]))
+            data = form_data()
+            data['IOO'] = dict(ioo_data(filters=rng.sample(IOO_FILTERS, rng.randint(1, 5))),
+                               binning=rng.choice(['1x1', '2x2']))
+            for observation_type in data:
+                data[observation_type].update(max_airmass=round(rng.uniform(1, 3), 2),
+                                              max_seeing=round(rng.uniform(1, 5), 1),
+                                              photometric=rng.choice(['clear', 'light']))
+            for observation_type, values in data.items():
+                with self.subTest(i=i, observation_type=observation_type), \
+                        mock.patch.object(Target.objects, 'get', return_value=target), \
+                        mock.patch('tom_lt.lt.new_uid', return_value=str(int(FIXTURE_TIME + i))):
+                    form = valid_form(observation_type, values)
+                    self.assertEqual(form.observation_payload(),
+                                     legacy_payload(form, target, int(FIXTURE_TIME + i), LT_SETTINGS['username']))
+
+
+class TestTargetResolution(TestCase):
+    def setUp(self):
+        self.target = SiderealTargetFactory.create(ra=83.63308, dec=22.0145, epoch=2000.0)
+
+    def test_query_count_is_constant_in_filter_count(self):
+        for count in (1, 6, len(IOO_FILTERS)):
+            with self.subTest(filters=count), self.assertNumQueries(1):
+                # validation and submission each build the payload, but share the one lookup
+                form = valid_form('IOO', ioo_data(self.target.id, IOO_FILTERS[:count]))
+                payload = form.observation_payload()
+            self.assertEqual(payload.count('<Target '), count)
+
+    def test_frodo_resolves_target_once(self):
+        with self.assertNumQueries(1):
+            payload = valid_form('FRODO', form_data(self.target.id)['FRODO']).observation_payload()
+        self.assertEqual(payload.count('<Target '), 2)
+
+    def test_target_is_rendered_once_per_form(self):
+        form = valid_form('IOO', ioo_data(self.target.id, ('U', 'R', 'G')))
+        with mock.patch('tom_lt.rtml.render_targets', wraps=render_targets) as render:
+            form._targets.clear()
+            form._payload = None
+            payload = form.observation_payload()
+        render.assert_called_once()
+        self.assertEqual(payload.count('<Target name="{0}">'.format(self.target.name)), 3)
+
+
+class TestGroupedPayloads(SimpleTestCase):
+    def payloads(self, project='proposal ID1'):
+        """An IO:O payload for one target and a SPRAT payload for another."""
+        payloads = []
+        for target, observation_type in ((FIXTURE_TARGETS[0], 'IOO'), (FIXTURE_TARGETS[1], 'SPRAT')):
+            data = dict(form_data()[observation_type], project=project)
+            with mock.patch.object(Target.objects, 'get', return_value=target):
+                payloads.append(valid_form(observation_type, data).observation_payload())
+        return payloads
+
+    def test_schedules_are_grouped_in_order(self):
+        payloads = self.payloads()
+        with mock.patch('tom_lt.lt.new_uid', return_value='42'):
+            group = LTFacility().group_observation_payloads(payloads)
+        rtml = etree.fromstring(group)
+        self.assertEqual(rtml.get('uid'), '42')
+        self.assertEqual(len(rtml.findall('{*}Project')), 1)
+        schedules = [etree.tostring(schedule) for schedule in rtml.iterfind('{*}Schedule')]
+        self.assertEqual(schedules, [etree.tostring(schedule) for payload in payloads
+                                     for schedule in etree.fromstring(payload).iterfind('{*}Schedule')])
+        self.assertEqual([target.get('name') for target in rtml.iterfind('{*}Schedule/{*}Target')],
+                         ['SN2024abc'] * 8 + ['neg0'])
+        self.assertEqual(group.count('xmlns='), 1)
+
+    def test_only_payloads_of_one_proposal_are_grouped(self):
+        with self.assertRaises(ValueError):
+            LTFacility().group_observation_payloads([self.payloads()[0], self.payloads('proposal ID2')[1]])
+        with self.assertRaises(ValueError):
+            LTFacility().group_observation_payloads([])
+
+    def test_group_is_validated_and_submitted_in_one_exchange_each(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+        facility = LTFacility()
+        group = facility.group_observation_payloads(self.payloads())
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, VISIBILITY_CHECK='off'):
+                self.assertEqual(facility.validate_observation(group), [])
+                self.assertEqual(facility.submit_observation(group), [etree.fromstring(group).get('uid')])
+        self.assertEqual([document.count('<Schedule>') for document in node_agent.documents], [9, 9])
+
+
+class TestRTMLPayload(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+        validation_cache.clear()
+        with open(os.path.join(FIXTURES, 'payloads.json')) as f:
+            self.payload = RTMLPayload(json.load(f)['SN2024abc-IOI'])
+
+    def test_inquiry_only_rewrites_the_mode(self):
+        fingerprint = self.payload.fingerprint
+        inquiry = LTFacility()._inquiry(self.payload)
+        self.assertEqual(inquiry, self.payload.replace('mode="request"', 'mode="inquiry"'))
+        self.assertEqual(etree.fromstring(inquiry).get('mode'), 'inquiry')
+        self.assertNotIn('tree', inquiry.__dict__)
+        self.assertEqual(inquiry.fingerprint, fingerprint)
+        self.assertIs(inquiry.with_mode('inquiry'), inquiry)
+        # a root lxml would not have written is serialized again
+        self.assertEqual(RTMLPayload("<RTML mode='request' uid='1'/>").with_mode('inquiry'),
+                         '<RTML mode="inquiry" uid="1"/>')
+
+    def test_payload_is_parsed_once_through_validation_and_submission(self):
+        original, parsed = etree.fromstring, []
+        documents = (self.payload, self.payload.encoded, self.payload.with_mode('inquiry').encoded)
+
+        def fromstring(text, *args, **kwargs):
+            # the stand-in parses what it is sent, in its own thread
+            if threading.current_thread() is threading.main_thread() and text in documents:
+                parsed.append(text)
+            return original(text, *args, **kwargs)
+
+        with NodeAgentStandIn() as node_agent, mock.patch.object(etree, 'fromstring', fromstring):
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, VALIDATION_MODE='cached'):
+                facility = LTFacility()
+                self.assertEqual(facility.validate_observation(self.payload), [])
+                self.assertEqual(facility.validate_observation(self.payload), [])
+                facility.submit_observation(self.payload)
+        self.assertEqual(len(parsed), 1)
+        self.assertEqual([RTMLPayload(document).mode for document in node_agent.documents], ['inquiry', 'request'])
+
+    def test_form_submits_the_payload_it_validated(self):
+        with mock.patch.object(Target.objects, 'get', return_value=FIXTURE_TARGETS[0]):
+            form = valid_form('IOI', form_data()['IOI'])
+        payload = form.observation_payload()
+        # as ObservationCreateView.form_valid asks for it again
+        self.assertIs(form.observation_payload(), payload)
+        # parsed when the form was validated
+        self.assertIn('tree', payload.__dict__)
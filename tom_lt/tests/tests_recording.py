@@ -0,0 +1,93 @@
+import asyncio
+import gzip
+import os
+import tempfile
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+
+from tom_lt.async_client import get_async_transport
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.recording import NotRecorded, Replayer, close_recorders, document_key, load_corpus
+from tom_lt.standin import NodeAgentStandIn, default_respond
+from tom_lt.tests.utils import UNREACHABLE, rtml
+
+
+class TestRecordReplay(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+        self.addCleanup(close_recorders)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def record(self, *documents, respond=default_respond):
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, RTML_TRANSPORT='record',
+                                 RECORDING_DIR=self.directory):
+                self.assertEqual(LTFacility().validate_observation(documents[0]), [])
+                replies = [LTFacility()._handle_rtml(document) for document in documents]
+                replies.append(asyncio.run(get_async_transport(LT_SETTINGS).handle_rtml(documents[0])))
+        close_recorders()
+        return replies
+
+    def replay(self, **settings):
+        return mock.patch.dict(LT_SETTINGS, UNREACHABLE, RTML_TRANSPORT='replay', RECORDING_DIR=self.directory,
+                               **settings)
+
+    def test_recorded_corpus(self):
+        self.record(rtml(1), rtml(2, 'proposal ID2'))
+        exchanges = list(load_corpus(self.directory))
+        self.assertEqual(len(exchanges), 4)
+        self.assertEqual([exchange['document'] for exchange in exchanges[1:]],
+                         [rtml(1), rtml(2, 'proposal ID2'), rtml(1)])
+        self.assertIn('mode="offer"', exchanges[0]['reply'])
+        self.assertTrue(all(exchange['elapsed'] > 0 for exchange in exchanges))
+        self.assertTrue(all(name.endswith('.jsonl.gz') for name in os.listdir(self.directory)))
+
+    def test_replay_without_the_node_agent(self):
+        self.record(rtml(1), rtml(2, 'proposal ID2'))
+        with self.replay():
+            self.assertEqual(LTFacility().validate_observation(rtml(5)), [])
+            self.assertEqual(LTFacility().submit_observation(rtml(6, 'proposal ID2')), ['6'])
+            response = asyncio.run(get_async_transport(LT_SETTINGS).handle_rtml(rtml(7)))
+            self.assertEqual((response.mode, response.uid), ('confirmation', '7'))
+            # no cancellation was recorded
+            with self.assertRaises(NotRecorded):
+                LTFacility()._handle_rtml(rtml(9).replace('mode="request"', 'mode="abort"'))
+
+    def test_unrecorded_documents_get_a_reply_of_their_mode(self):
+        self.record(rtml(1))
+        with self.replay():
+            self.assertEqual(LTFacility().submit_observation(rtml(8, 'proposal ID3')), ['8'])
+
+    def test_replay_latency(self):
+        self.record(rtml(1))
+        replayer = Replayer(self.directory, latency='recorded')
+        self.assertEqual(replayer.reply(rtml(2))[1], replayer.replies[document_key(rtml(1))][2])
+        self.assertTrue(0.1 <= Replayer(self.directory, latency=(0.1, 0.2)).reply(rtml(2))[1] <= 0.2)
+        with self.replay(REPLAY_LATENCY=0.25), mock.patch('time.sleep') as sleep:
+            LTFacility().submit_observation(rtml(2))
+        sleep.assert_called_once_with(0.25)
+
+    def test_stand_in_serves_the_corpus(self):
+        self.record(rtml(1))
+        with NodeAgentStandIn(Replayer(self.directory).handle_rtml, keep_documents=False) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                self.assertEqual(LTFacility().submit_observation(rtml(3)), ['3'])
+        self.assertEqual(node_agent.documents, [])
+
+    def test_truncated_recording(self):
+        self.record(rtml(1))
+        with gzip.open(os.path.join(self.directory, 'rtml-killed.jsonl.gz'), 'wt') as corpus:
+            corpus.write('{"document": "<RTML')
+        with self.assertLogs('tom_lt.recording', 'WARNING'):
+            self.assertEqual(len(list(load_corpus(self.directory))), 3)
+
+    def test_unknown_transport(self):
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, RTML_TRANSPORT='carrier pigeon'):
+            with self.assertRaises(ImproperlyConfigured):
+                LTFacility()._handle_rtml(rtml(1))
@@ -0,0 +1,86 @@
+import json
+import os
+from datetime import datetime
+
+from django.test import SimpleTestCase
+from lxml import etree
+
+from tom_lt.response import CHUNK_SIZE, Schedule, parse_response
+from tom_lt.tests.tests_payload import FIXTURES
+
+DECLARATION = '<?xml version="1.0" encoding="ISO-8859-1"?>\n'
+
+
+def large_reply(mode, copies=60):
+    """Return a node agent reply of ``mode`` repeating the schedules of a reference payload ``copies`` times.
+
+    A ``reject`` reply carries an ``Error`` element for each copy.
+    """
+    with open(os.path.join(FIXTURES, 'payloads.json')) as f:
+        rtml = etree.fromstring(json.load(f)['south-IOO'])
+    rtml.set('mode', mode)
+    rtml.set('uid', '1700000000')
+    schedules = rtml.findall('{*}Schedule')
+    for copy in range(copies):
+        for schedule in schedules:
+            rtml.append(etree.fromstring(etree.tostring(schedule)))
+        if mode == 'reject':
+            etree.SubElement(rtml, 'Error').text = 'Copy {0} is not visible'.format(copy)
+    return DECLARATION + etree.tostring(rtml, encoding='unicode')
+
+
+class TestRTMLResponse(SimpleTestCase):
+    def test_mode_and_uid(self):
+        response = parse_response(DECLARATION + '<RTML xmlns="http://www.rtml.org/v3.1a" mode="offer" uid="12"/>')
+        self.assertEqual((response.mode, response.uid), ('offer', '12'))
+        self.assertEqual(response.errors, [])
+        self.assertEqual(response.schedules, [])
+
+    def test_bytes_are_decoded_with_the_declared_encoding(self):
+        document = (DECLARATION + '<RTML mode="reject" uid="\xe9"><Error>Caf\xe9</Error></RTML>').encode('latin-1')
+        response = parse_response(document)
+        self.assertEqual((response.mode, response.uid), ('reject', '\xe9'))
+        self.assertEqual(response.errors, ['Caf\xe9'])
+        self.assertEqual(str(response), document.decode('latin-1')[len(DECLARATION):])
+
+    def test_str_is_kept_as_received(self):
+        document = DECLARATION + '<RTML mode="offer" uid="☃"/>'
+        response = parse_response(document)
+        self.assertEqual(response.uid, '☃')
+        self.assertIs(str(response), document)
+
+    def test_only_the_root_is_parsed_up_front(self):
+        document = large_reply('offer')
+        self.assertGreater(len(document), 10 * CHUNK_SIZE)
+        response = parse_response(document)
+        self.assertEqual((response.mode, response.uid), ('offer', '1700000000'))
+        self.assertNotIn('root', response.__dict__)
+        self.assertEqual(len(response.schedules),
+                         len(etree.fromstring(document.encode('latin-1')).findall('{*}Schedule')))
+
+    def test_errors_of_a_reject(self):
+        errors = parse_response(large_reply('reject', copies=3)).errors
+        self.assertEqual(errors, ['Copy {0} is not visible'.format(copy) for copy in range(3)])
+
+    def test_schedules(self):
+        response = parse_response(
+            '<RTML xmlns="http://www.rtml.org/v3.1a" mode="update"><Schedule uid="42" mode="update">'
+            '<DateTimeStart value="2024-01-02T20:00:00"/><DateTimeEnd value="2024-01-02T21:00:00"/>'
+            '<ImageData md5="abc">http://archive/data/h_e_1.fits</ImageData><ImageData/></Schedule>'
+            '<Schedule uid="43" mode="complete"/></RTML>')
+        self.assertEqual(response.schedules, [
+            Schedule('42', 'update', datetime(2024, 1, 2, 20), datetime(2024, 1, 2, 21),
+                     (('http://archive/data/h_e_1.fits', 'abc'),)),
+            Schedule('43', 'complete', None, None, ()),
+        ])
+
+    def test_malformed_reply(self):
+        for document in ('', 'Service unavailable', '<RTML mode="offer" uid="1"><Schedule></RTML>'):
+            with self.subTest(document=document), self.assertRaises(etree.XMLSyntaxError):
+                parse_response(document).root
+
+    def test_reply_without_rtml(self):
+        for document in ('<html><body>Service unavailable</body></html>', '<Reply><Error>Busy</Error></Reply>'):
+            with self.subTest(document=document), \
+                    self.assertRaisesRegex(etree.XMLSyntaxError, 'no RTML element'):
+                parse_response(document)
@@ -0,0 +1,26 @@
+from django.test import SimpleTestCase
+from lxml import etree
+
+from tom_lt.rtml import PROJECT, TARGET
+
+AWKWARD = 'a&b<c>d"e\'f\ng\rh\ti é {slot}'
+
+
+class TestSkeleton(SimpleTestCase):
+    def test_escaping_matches_lxml(self):
+        project = etree.Element('Project', ProjectID=AWKWARD)
+        contact = etree.SubElement(project, 'Contact')
+        etree.SubElement(contact, 'Username').text = AWKWARD
+        etree.SubElement(contact, 'Name').text = ''
+        self.assertEqual(PROJECT.render(project=AWKWARD, username=AWKWARD),
+                         etree.tostring(project, encoding='unicode'))
+
+    def test_values_are_converted_with_str(self):
+        rendered = TARGET.render(name='t', Hours=1, Minutes=2, Seconds=3.5, Degrees='-0', Arcminutes=0,
+                                 Arcseconds=0.0, Equinox=2000)
+        self.assertIn('<Seconds>3.5</Seconds>', rendered)
+        self.assertIn('<Equinox>2000</Equinox>', rendered)
+
+    def test_rejects_control_characters(self):
+        with self.assertRaises(ValueError):
+            PROJECT.render(project='proposal\x00', username='')
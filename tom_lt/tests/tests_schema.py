@@ -0,0 +1,99 @@
+import json
+import os
+import threading
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tom_lt.cancellation import abort_document
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility, Target
+from tom_lt.schema import get_schema, schema_errors
+from tom_lt.standin import NodeAgentStandIn
+from tom_lt.status import status_inquiry
+from tom_lt.tests.tests_payload import FIXTURE_TARGETS, FIXTURES, form_data
+from tom_lt.tests.utils import UNREACHABLE
+
+
+def fixture_payloads():
+    with open(os.path.join(FIXTURES, 'payloads.json')) as f:
+        return json.load(f)
+
+
+class TestSchema(SimpleTestCase):
+    def test_documents_written_by_the_module_are_valid(self):
+        for name, payload in fixture_payloads().items():
+            with self.subTest(name):
+                self.assertEqual(schema_errors(payload), [])
+        self.assertEqual(schema_errors(status_inquiry('proposal ID1', 'tom', ['1', '2'])), [])
+        self.assertEqual(schema_errors(abort_document('proposal ID1', 'tom', ['1'])), [])
+
+    def test_errors_locate_the_element(self):
+        payload = fixture_payloads()['SN2024abc-FRODO']
+        payload = payload.replace('<Exposure count="2">', '<Exposure count="0">')
+        payload = payload.replace('<Value units="seconds">100.0</Value>', '<Value units="seconds">-1.0</Value>')
+        errors = schema_errors(payload)
+        self.assertEqual([(error.element, error.attribute, error.schedule) for error in errors],
+                         [('Value', None, 0), ('Exposure', 'count', 1)])
+        self.assertNotIn('{', errors[0].message)
+        self.assertEqual(schema_errors('<RTML')[0].element, None)
+
+    def test_compiled_once_per_thread(self):
+        self.assertIs(get_schema(), get_schema())
+        schemas = []
+        thread = threading.Thread(target=lambda: schemas.append(get_schema()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(schemas[0], get_schema())
+
+
+class TestFormErrors(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+
+    def form(self, observation_type, data):
+        form = LTFacility.observation_forms[observation_type](data=data)
+        with mock.patch.object(Target.objects, 'get', return_value=FIXTURE_TARGETS[0]):
+            valid = form.is_valid()
+        return valid, form.errors
+
+    def test_errors_are_reported_on_their_fields_without_an_inquiry(self):
+        # both arms of FRODO are written whatever their integrations, and an Exposure needs a count
+        frodo = dict(form_data()['FRODO'], exp_count_red=0)
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, SCHEMA_CHECK='reject'):
+            valid, errors = self.form('FRODO', frodo)
+        self.assertFalse(valid)
+        self.assertEqual(sorted(errors), ['exp_count_red'])
+
+    def test_errors_are_only_logged_by_default(self):
+        frodo = dict(form_data()['FRODO'], exp_count_red=0)
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, VALIDATION_MODE='local'), \
+                self.assertLogs('tom_lt.lt', 'WARNING') as logs:
+            LT_SETTINGS.pop('SCHEMA_CHECK', None)
+            valid, errors = self.form('FRODO', frodo)
+        self.assertTrue(valid, errors)
+        self.assertIn('RTML payload breaks the schema', logs.output[0])
+
+    def test_valid_forms_are_validated_by_the_node_agent(self):
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                for observation_type, data in form_data().items():
+                    with self.subTest(observation_type):
+                        self.assertEqual(self.form(observation_type, data), (True, {}))
+        self.assertEqual(len(node_agent.documents), 4)
+
+    def test_facility_validation(self):
+        payload = fixture_payloads()['SN2024abc-IOI'].replace('maximum="1.2"', 'maximum="0"')
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE):
+            with mock.patch.dict(LT_SETTINGS, SCHEMA_CHECK='reject'):
+                errors = LTFacility().validate_observation(payload)
+            self.assertEqual(len(errors), 1)
+            self.assertIn('SeeingConstraint', errors[0])
+            # the schema is a local subset, so it only warns by default
+            with mock.patch.dict(LT_SETTINGS, VALIDATION_MODE='local'), self.assertLogs('tom_lt.lt', 'WARNING'):
+                self.assertEqual(LTFacility().validate_observation(payload), [])
+            with mock.patch.dict(LT_SETTINGS, SCHEMA_CHECK='off', VALIDATION_MODE='local'), \
+                    mock.patch('tom_lt.schema.schema_errors') as errors:
+                self.assertEqual(LTFacility().validate_observation(payload), [])
+            errors.assert_not_called()
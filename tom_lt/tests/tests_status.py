@@ -0,0 +1,126 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from lxml import etree
+
+from tom_observations.models import ObservationRecord
+
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.status import MAX_POLL_INTERVAL, due, poll_interval
+from tom_lt.tests.factories import SiderealTargetFactory, create_records
+from tom_lt.standin import NodeAgentStandIn
+from tom_lt.tests.node_agent import status_respond
+
+
+class TestPollInterval(SimpleTestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def record(self, status, age, since_update=timedelta(0)):
+        return SimpleNamespace(status=status, created=self.now - age, modified=self.now - since_update)
+
+    def test_interval_depends_on_state(self):
+        self.assertLess(poll_interval(self.record('IN_PROGRESS', timedelta(hours=1)), self.now),
+                        poll_interval(self.record('PENDING', timedelta(hours=1)), self.now))
+
+    def test_interval_grows_with_age_up_to_a_limit(self):
+        intervals = [poll_interval(self.record('PENDING', timedelta(days=days)), self.now) for days in range(8)]
+        self.assertEqual(intervals, sorted(intervals))
+        self.assertEqual(intervals[1], 2 * intervals[0])
+        self.assertEqual(intervals[-1], timedelta(seconds=MAX_POLL_INTERVAL))
+        self.assertEqual(poll_interval(self.record('PENDING', timedelta(days=10000)), self.now),
+                         timedelta(seconds=MAX_POLL_INTERVAL))
+
+    def test_due(self):
+        fresh = self.record('PENDING', timedelta(hours=1), since_update=timedelta(minutes=5))
+        stale = self.record('PENDING', timedelta(hours=1), since_update=timedelta(minutes=20))
+        old = self.record('PENDING', timedelta(days=5), since_update=timedelta(minutes=20))
+        self.assertEqual(due([fresh, stale, old], self.now), [stale])
+
+
+class TestUpdateStatuses(TestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+        self.target = SiderealTargetFactory.create()
+
+    def update(self, states, target=None, **settings):
+        with NodeAgentStandIn(status_respond(states)) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, **settings):
+                failed = LTFacility().update_all_observation_statuses(target=target)
+        return failed, node_agent.documents
+
+    def test_batches_per_proposal_and_bulk_updates(self):
+        create_records(self.target, 150, project='proposal ID1', since_update=timedelta(hours=1))
+        create_records(self.target, 30, project='proposal ID2', start=1000, since_update=timedelta(hours=1))
+        states = dict({str(i): 'complete' for i in range(150)}, **{str(1000 + i): 'update' for i in range(30)})
+
+        with self.assertNumQueries(3):  # the open records, then one UPDATE in a savepoint
+            failed, documents = self.update(states, STATUS_BATCH_SIZE=100)
+
+        self.assertEqual(failed, [])
+        self.assertEqual(len(documents), 3)
+        projects = sorted(etree.fromstring(d.encode()).find('{*}Project').get('ProjectID') for d in documents)
+        self.assertEqual(projects, ['proposal ID1', 'proposal ID1', 'proposal ID2'])
+        self.assertEqual(ObservationRecord.objects.filter(status='COMPLETED').count(), 150)
+        self.assertEqual(ObservationRecord.objects.filter(status='IN_PROGRESS').count(), 30)
+
+    def test_terminal_and_recent_records_are_not_polled(self):
+        create_records(self.target, 2, status='COMPLETED', since_update=timedelta(hours=1))
+        create_records(self.target, 2, start=10, since_update=timedelta(minutes=1))
+        create_records(self.target, 2, start=20, since_update=timedelta(hours=1))
+        failed, documents = self.update({str(i): 'update' for i in range(30)})
+        self.assertEqual(failed, [])
+        self.assertEqual(len(documents), 1)
+        uids = [s.get('uid') for s in etree.fromstring(documents[0].encode()).iter('{*}Schedule')]
+        self.assertEqual(uids, ['20', '21'])
+        self.assertEqual(ObservationRecord.objects.get(observation_id='10').status, 'PENDING')
+
+    def test_target_polls_every_open_record(self):
+        create_records(self.target, 3, since_update=timedelta(minutes=1))
+        failed, documents = self.update({'0': 'update', '1': 'abort', '2': 'confirmation'}, target=self.target)
+        self.assertEqual(failed, [])
+        self.assertEqual(dict(ObservationRecord.objects.values_list('observation_id', 'status')),
+                         {'0': 'IN_PROGRESS', '1': 'CANCELED', '2': 'PENDING'})
+
+    def test_state_changes_run_the_hook(self):
+        create_records(self.target, 3, since_update=timedelta(hours=1))
+        with mock.patch('tom_common.hooks.run_hook') as run_hook:
+            self.update({'0': 'complete', '1': 'confirmation', '2': 'fail'})
+        self.assertEqual(sorted((call.args[1].observation_id, call.args[2]) for call in run_hook.call_args_list),
+                         [('0', 'PENDING'), ('2', 'PENDING')])
+        self.assertEqual({call.args[0] for call in run_hook.call_args_list}, {'observation_change_state'})
+
+    def test_failures_are_reported_per_record(self):
+        create_records(self.target, 2, project='proposal ID1', since_update=timedelta(hours=1))
+        create_records(self.target, 2, project='proposal ID2', start=10, since_update=timedelta(hours=1))
+        respond = status_respond({'0': 'complete'})
+
+        def flaky(document):
+            if 'proposal ID2' in document:
+                raise RuntimeError('node agent exploded')
+            return respond(document)
+
+        with NodeAgentStandIn(flaky) as node_agent, mock.patch.dict(LT_SETTINGS, node_agent.settings), \
+                self.assertLogs(level='WARNING'):
+            failed = LTFacility().update_all_observation_statuses()
+        self.assertEqual(sorted(observation_id for observation_id, _ in failed), ['1', '10', '11'])
+        self.assertIn('unknown', dict(failed)['1'])
+        self.assertIn('node agent exploded', dict(failed)['10'])
+        self.assertEqual(ObservationRecord.objects.get(observation_id='0').status, 'COMPLETED')
+        # the unanswered batch is asked about again on the next run, the unknown uid is backed off
+        self.assertLess(ObservationRecord.objects.get(observation_id='10').modified,
+                        timezone.now() - timedelta(minutes=30))
+        self.assertGreater(ObservationRecord.objects.get(observation_id='1').modified,
+                           timezone.now() - timedelta(minutes=1))
+
+    def test_update_observation_status(self):
+        create_records(self.target, 1, start=42)
+        with NodeAgentStandIn(status_respond({'42': 'update'})) as node_agent, \
+                mock.patch.dict(LT_SETTINGS, node_agent.settings):
+            LTFacility().update_observation_status('42')
+        self.assertEqual(ObservationRecord.objects.get(observation_id='42').status, 'IN_PROGRESS')
@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tom_lt.uids import new_uid
+
+UIDS_PER_WORKER = 5000
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def allocate(count=UIDS_PER_WORKER):
+    return [new_uid() for _ in range(count)]
+
+
+def allocate_in_threads(threads=4):
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return [uid for uids in executor.map(allocate, [UIDS_PER_WORKER] * threads) for uid in uids]
+
+
+class TestNewUid(SimpleTestCase):
+    def test_format(self):
+        uid = new_uid()
+        self.assertRegex(uid, r'^\d{29}$')
+        self.assertEqual(uid[-7:], '{0:07d}'.format(os.getpid()))
+        self.assertEqual(uid[-13:-7], new_uid()[-13:-7])
+        self.assertAlmostEqual(int(uid[:13]) / 1000, time.time(), delta=5)
+
+    def test_increasing_within_a_thread(self):
+        uids = allocate()
+        self.assertEqual(uids, sorted(uids))
+        self.assertEqual(len(set(uids)), len(uids))
+
+    def test_clock_set_back(self):
+        first = new_uid()
+        with mock.patch('time.time_ns', return_value=0):
+            later = [new_uid() for _ in range(3)]
+        self.assertEqual([first] + later, sorted([first] + later))
+        self.assertEqual(len({first, *later}), 4)
+
+    def test_no_duplicates_across_threads_and_processes(self):
+        # each process allocates from several threads at once; thousands of uids a second in total
+        script = ('import sys; sys.path.insert(0, {0!r}); from tom_lt.tests.tests_uids import allocate_in_threads; '
+                  'print("\\n".join(allocate_in_threads()))'.format(PACKAGE_DIR))
+        processes = [subprocess.Popen([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True)
+                     for _ in range(4)]
+        uids = allocate_in_threads()
+        for process in processes:
+            uids.extend(process.communicate()[0].split())
+        self.assertEqual(len(uids), 5 * 4 * UIDS_PER_WORKER)
+        self.assertEqual(len(set(uids)), len(uids))
+        self.assertGreater(len({uid[-7:] for uid in uids}), 1)
+        self.assertEqual(len({uid[-13:-7] for uid in uids}), 5)
+
+    def test_same_process_id_on_different_hosts(self):
+        # as with the process 1 of each of several containers, in the same millisecond
+        script = ('import sys; sys.path.insert(0, {0!r}); from unittest import mock; from tom_lt.uids import new_uid; '
+                  'mock.patch("os.getpid", return_value=1).start(); '
+                  'mock.patch("time.time_ns", return_value=0).start(); print(new_uid())'.format(PACKAGE_DIR))
+        uids = [subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, text=True, check=True).stdout
+                for _ in range(3)]
+        self.assertEqual({uid.strip()[-7:] for uid in uids}, {'0000001'})
+        self.assertEqual(len(set(uids)), 3)
@@ -0,0 +1,105 @@
+from unittest import mock
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase, override_settings
+
+from tom_lt.cache import ValidationCache, fingerprint
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility, validation_cache
+from tom_lt.standin import NodeAgentStandIn, default_respond
+from tom_lt.tests.utils import rtml
+
+
+def respond(document):
+    if 'rejected' in document:
+        return document.replace('mode="inquiry"', 'mode="reject"')
+    return default_respond(document)
+
+
+class TestFingerprint(SimpleTestCase):
+    def test_uid_and_mode_are_ignored(self):
+        self.assertEqual(fingerprint(rtml(1)), fingerprint(rtml(2)))
+        self.assertEqual(fingerprint(rtml(1)), fingerprint(rtml(1).replace('request', 'inquiry')))
+        self.assertNotEqual(fingerprint(rtml(1)), fingerprint(rtml(1, 'proposal ID2')))
+
+
+class TestValidationModes(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        validation_cache.clear()
+        self.addCleanup(clear_clients)
+        self.addCleanup(validation_cache.clear)
+
+    def _validate(self, validation_mode, *payloads):
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, VALIDATION_MODE=validation_mode):
+                errors = [LTFacility().validate_observation(payload) for payload in payloads]
+        return errors, len(node_agent.documents)
+
+    def test_remote_sends_every_inquiry(self):
+        errors, inquiries = self._validate('remote', rtml(1), rtml(2))
+        self.assertEqual(errors, [[], []])
+        self.assertEqual(inquiries, 2)
+
+    def test_cached_reuses_offer_for_unchanged_payload(self):
+        errors, inquiries = self._validate('cached', rtml(1), rtml(2), rtml(3, 'proposal ID2'))
+        self.assertEqual(errors, [[], [], []])
+        self.assertEqual(inquiries, 2)
+
+    def test_cached_reuses_reject(self):
+        errors, inquiries = self._validate('cached', rtml(1, 'rejected'), rtml(2, 'rejected'))
+        self.assertEqual(errors[0][0], 'Error with RTML submission to Liverpool Telescope')
+        self.assertEqual(errors[1], errors[0])
+        self.assertEqual(inquiries, 1)
+
+    def test_cached_outcome_expires(self):
+        with mock.patch.object(validation_cache, 'ttl', -1):
+            errors, inquiries = self._validate('cached', rtml(1), rtml(2))
+        self.assertEqual(inquiries, 2)
+
+    def test_connection_errors_are_not_cached(self):
+        with mock.patch.dict(LT_SETTINGS, {'LT_HOST': '127.0.0.1', 'LT_PORT': 1, 'VALIDATION_MODE': 'cached'}):
+            self.assertIn('Error with connection', LTFacility().validate_observation(rtml(1))[0])
+        self.assertIsNone(validation_cache.get(rtml(1)))
+
+    def test_hits_and_misses_are_counted(self):
+        self._validate('cached', rtml(1), rtml(2), rtml(3), rtml(4, 'proposal ID2'))
+        self.assertEqual(validation_cache.stats(), {'hits': 2, 'misses': 2})
+
+    def test_processes_share_the_cache(self):
+        self._validate('cached', rtml(1))
+        # another process, or another instance, using the same Django cache
+        self.assertEqual(ValidationCache().get(rtml(2)), {'mode': 'offer', 'errors': []})
+
+    def test_confirmed_submission_bypasses_the_proposal(self):
+        with NodeAgentStandIn(respond) as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings, VALIDATION_MODE='cached'):
+                facility = LTFacility()
+                self.assertEqual(facility.validate_observation(rtml(1)), [])
+                self.assertEqual(facility.validate_observation(rtml(2, 'proposal ID2')), [])
+                self.assertEqual(facility.submit_observation(rtml(3)), ['3'])
+                self.assertEqual(facility.validate_observation(rtml(4)), [])
+                self.assertEqual(facility.validate_observation(rtml(5, 'proposal ID2')), [])
+        inquiries = [document for document in node_agent.documents if 'mode="inquiry"' in document]
+        self.assertEqual(len(inquiries), 3)
+        self.assertIn('uid="4"', inquiries[-1])
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                           'OPTIONS': {'MAX_ENTRIES': 3, 'CULL_FREQUENCY': 3}}})
+    def test_least_recently_used_are_evicted(self):
+        validation_cache.set(rtml(1), 'offer', [])
+        for project in ('proposal ID2', 'proposal ID3', 'proposal ID4'):
+            self.assertIsNotNone(validation_cache.get(rtml(1)))
+            validation_cache.set(rtml(1, project), 'offer', [])
+        self.assertIsNotNone(validation_cache.get(rtml(1)))
+        self.assertIsNone(validation_cache.get(rtml(1, 'proposal ID2')))
+
+    def test_local_skips_the_inquiry(self):
+        errors, inquiries = self._validate('local', rtml(1), rtml(2, 'rejected'))
+        self.assertEqual(errors, [[], []])
+        self.assertEqual(inquiries, 0)
+
+    def test_unknown_mode(self):
+        with mock.patch.dict(LT_SETTINGS, VALIDATION_MODE='sometimes'):
+            with self.assertRaises(ImproperlyConfigured):
+                LTFacility().validate_observation(rtml(1))
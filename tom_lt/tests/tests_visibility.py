@@ -0,0 +1,150 @@
+import json
+import os
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from tom_lt import visibility
+from tom_lt.client import clear_clients
+from tom_lt.lt import LT_SETTINGS, LTFacility
+from tom_lt.standin import NodeAgentStandIn
+from tom_lt.tests.tests_payload import form_data
+from tom_lt.visibility import altitude, sun_position, visibility_errors
+from tom_lt.tests.utils import UNREACHABLE
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures')
+LA_PALMA = LTFacility.SITES['La Palma']
+
+
+def seconds(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def payloads():
+    """Fixture payloads, all for 2024-01-01 12:00 to 2024-01-02 12:00 at airmass 2, keyed by visibility."""
+    with open(os.path.join(FIXTURES, 'payloads.json')) as f:
+        fixtures = json.load(f)
+    return {
+        # the Crab nebula, up all night in January
+        'visible': fixtures['SN2024abc-IOI'],
+        # Dec -46 never rises 30 degrees above La Palma
+        'too low': fixtures['south-IOI'],
+        # RA 18h34 is a few degrees from the Sun
+        'daylight': fixtures['SN2024abc-IOI'].replace('<Hours>5</Hours>', '<Hours>18</Hours>'),
+    }
+
+
+class TestPositions(SimpleTestCase):
+    def test_pole_is_at_the_latitude(self):
+        times = seconds(2024, 1, 1) + 3600 * 24 * (0.1 + 0.8 * visibility.np.arange(5))
+        self.assertTrue(visibility.np.allclose(altitude(0, 90, times, 28.762, -17.872), 28.762))
+
+    def test_transit_altitude(self):
+        # the RA of the meridian of La Palma at 2024-01-01 00:00 UT is 5h29m
+        self.assertAlmostEqual(float(altitude(82.28, 28.762, seconds(2024, 1, 1), 28.762, -17.872)), 90, delta=0.5)
+        self.assertAlmostEqual(float(altitude(82.28, -30, seconds(2024, 1, 1), 28.762, -17.872)), 31.238, delta=0.2)
+
+    def test_sun_at_equinox_and_solstice(self):
+        ra, dec = sun_position([seconds(2024, 3, 20, 3, 6), seconds(2024, 6, 20, 20, 51)])
+        self.assertAlmostEqual(ra[0] % 360 - 360 * (ra[0] % 360 > 180), 0, delta=0.05)
+        self.assertAlmostEqual(dec[0], 0, delta=0.05)
+        self.assertAlmostEqual(ra[1], 90, delta=0.05)
+        self.assertAlmostEqual(dec[1], 23.44, delta=0.05)
+
+
+class TestVisibilityErrors(SimpleTestCase):
+    def test_batch_in_one_pass(self):
+        cases = payloads()
+        with mock.patch.object(visibility, 'observable', wraps=visibility.observable) as observable:
+            errors = visibility_errors(list(cases.values()), LA_PALMA)
+        self.assertEqual(observable.call_count, 1)
+        self.assertEqual(len(observable.call_args[0][0]), 3)
+        visible, too_low, daylight = errors
+        self.assertEqual(visible, [])
+        self.assertEqual(too_low, ['south cannot be observed from the Liverpool Telescope between '
+                                   '2024-01-01T12:00:00+00:00 and 2024-01-02T12:00:00+00:00: '
+                                   'it never reaches airmass 2.0'])
+        self.assertEqual(len(daylight), 1)
+        self.assertIn('only reaches airmass 2.0 in daylight', daylight[0])
+
+    def test_window_and_airmass_are_taken_into_account(self):
+        visible = payloads()['visible']
+        # the Crab sinks below airmass 2 at around 4:40 UT
+        morning = visible.replace('2024-01-01T12:00:00', '2024-01-02T08:00:00')
+        self.assertEqual(len(visibility_errors([morning], LA_PALMA)[0]), 1)
+        # it never passes overhead at La Palma
+        self.assertIn('never reaches airmass 1.0',
+                      visibility_errors([visible.replace('maximum="2.0"', 'maximum="1.0"')], LA_PALMA)[0][0])
+
+    def test_schedules_without_coordinates_are_not_checked(self):
+        payload = ('<RTML xmlns="http://www.rtml.org/v3.1a" mode="request" uid="1" version="3.1a">'
+                   '<Project ProjectID="proposal ID1"/><Schedule/></RTML>')
+        self.assertEqual(visibility_errors([payload], LA_PALMA), [[]])
+
+    def test_unreadable_payloads_are_turned_down_on_their_own(self):
+        visible = payloads()['visible']
+        errors = visibility_errors(['not xml', visible.replace('2024-01-02T12:00:00', 'tomorrow'), visible],
+                                   LA_PALMA)
+        self.assertIn('cannot be checked for visibility', errors[0][0])
+        self.assertEqual(errors[1], ["The RTML payload cannot be checked for visibility: "
+                                     "'tomorrow+00:00' is not a date and time"])
+        self.assertEqual(errors[2], [])
+
+
+class TestFacility(SimpleTestCase):
+    def setUp(self):
+        clear_clients()
+        self.addCleanup(clear_clients)
+
+    def test_validation_rejects_without_an_inquiry(self):
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE):
+            errors = LTFacility().validate_observation(payloads()['too low'])
+        self.assertEqual(len(errors), 1)
+        self.assertIn('never reaches airmass', errors[0])
+
+    def test_warn_and_off(self):
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, VALIDATION_MODE='local', VISIBILITY_CHECK='warn'):
+            with self.assertLogs('tom_lt.lt', 'WARNING'):
+                self.assertEqual(LTFacility().validate_observation(payloads()['too low']), [])
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, VALIDATION_MODE='local', VISIBILITY_CHECK='off'), \
+                mock.patch.object(visibility, 'visibility_errors') as visibility_errors:
+            self.assertEqual(LTFacility().validate_observation(payloads()['too low']), [])
+        visibility_errors.assert_not_called()
+
+    def test_unparsable_windows_are_form_errors(self):
+        data = dict(form_data()['IOI'], startdate='tomorrow', enddate='2024-13-01', endtime='25:00')
+        form = LTFacility.observation_forms['IOI'](data=data)
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE):
+            self.assertFalse(form.is_valid())
+        self.assertEqual(sorted(form.errors), ['enddate', 'endtime', 'startdate'])
+        self.assertEqual(form.errors['startdate'], ['Enter a valid date, as YYYY-MM-DD.'])
+
+    def test_batch_submission_only_sends_observable_payloads(self):
+        cases = payloads()
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                results = LTFacility().submit_observations([cases['too low'], cases['visible'], cases['daylight']])
+        self.assertEqual(len(node_agent.documents), 1)
+        self.assertEqual([result['mode'] for result in results], [None, 'confirmation', None])
+        self.assertIn('never reaches airmass', results[0]['error'])
+        self.assertIn('daylight', results[2]['error'])
+        self.assertIsNone(results[1]['error'])
+
+    def test_an_unreadable_payload_only_fails_its_own_entry(self):
+        visible = payloads()['visible']
+        with NodeAgentStandIn() as node_agent:
+            with mock.patch.dict(LT_SETTINGS, node_agent.settings):
+                results = LTFacility().submit_observations(
+                    [visible, 'not xml', visible.replace('2024-01-02T12:00:00', 'tomorrow')])
+        self.assertEqual(len(node_agent.documents), 1)
+        self.assertEqual([result['mode'] for result in results], ['confirmation', None, None])
+        self.assertIn('cannot be checked for visibility', results[1]['error'])
+        self.assertIn('is not a date and time', results[2]['error'])
+
+    def test_validation_turns_down_an_unreadable_window(self):
+        payload = payloads()['visible'].replace('2024-01-02T12:00:00', '2024-13-01T12:00:00')
+        with mock.patch.dict(LT_SETTINGS, UNREACHABLE, VALIDATION_MODE='local', SCHEMA_CHECK='off'):
+            errors = LTFacility().validate_observation(payload)
+        self.assertEqual(len(errors), 1)
+        self.assertIn('is not a date and time', errors[0])
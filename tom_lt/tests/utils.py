@@ -0,0 +1,10 @@
+"""Payloads and settings shared by the tests."""
+
+# settings of a node agent nothing listens for, so that any call to it fails at once
+UNREACHABLE = {'LT_HOST': '127.0.0.1', 'LT_PORT': 1, 'DEBUG': False}
+
+
+def rtml(uid, project='proposal ID1', mode='request'):
+    """Return a minimal RTML document for ``project`` with the given ``uid`` and ``mode``."""
+    return ('<RTML xmlns="http://www.rtml.org/v3.1a" mode="{0}" uid="{1}" version="3.1a">'
+            '<Project ProjectID="{2}"/></RTML>').format(mode, uid, project)
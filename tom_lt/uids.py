@@ -0,0 +1,46 @@
+"""Allocation of the uids of the RTML documents sent to the node agent.
+
+The node agent answers a request with the uid of the document, which becomes the observation id, so no two
+documents may share one. A uid is a string of 29 digits: the time in milliseconds since the epoch (13
+digits), a 3 digit sequence number, a random node number drawn when the module is imported (6 digits) and
+the id of the allocating process (7 digits). Within a process, every uid is greater than the one before it,
+even when more than a thousand are allocated in a millisecond or the clock is set back; the process id
+keeps the uids of processes on the same host apart, and the node number those of processes on different
+hosts or containers, which often share a process id (1, in a container). Uids sort by the time they were
+allocated, as numbers or as strings.
+"""
+import os
+import secrets
+import threading
+import time
+
+SEQUENCE_DIGITS = 3
+NODE_DIGITS = 6
+PID_DIGITS = 7
+
+# forked processes keep their parent's node, but not its process id
+_node = secrets.randbelow(10 ** NODE_DIGITS)
+
+_lock = threading.Lock()
+_last = 0
+
+
+def _reset_after_fork():
+    # A fork may happen while another thread holds the lock. The child has a new pid, so it can carry on
+    # from the parent's sequence.
+    global _lock
+    _lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def new_uid():
+    """Return a new uid for an RTML document, unique across the threads, processes and hosts of a TOM."""
+    global _last
+    now = time.time_ns() // 1000000 * 10 ** SEQUENCE_DIGITS
+    with _lock:
+        _last = max(now, _last + 1)
+        value = _last
+    return '{0}{1:0{2}d}{3:0{4}d}'.format(value, _node, NODE_DIGITS, os.getpid() % 10 ** PID_DIGITS, PID_DIGITS)
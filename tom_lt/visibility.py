@@ -0,0 +1,159 @@
+"""Vectorized visibility of targets from the telescope, to turn down unobservable payloads without an inquiry.
+
+The window of each Schedule is sampled every ``SAMPLE_INTERVAL`` seconds, and the altitude of the target
+and of the Sun at the site is computed for every sample of every Schedule at once. A Schedule can be
+observed at a sample if the Sun is below ``sun_altitude`` and the target is below its maximum airmass.
+
+The positions are approximate: the coordinates are taken as those of the date (precession is ignored), the
+Sun's position comes from the low-precision formulae of the Astronomical Almanac and the airmass is the
+secant of the zenith distance. All of these are well within ``MARGIN`` degrees of altitude, which is given
+to the target and the Sun, so a Schedule that is found not to be observable cannot be observed; the node
+agent remains the judge of the rest.
+"""
+from datetime import datetime, timezone
+
+import numpy as np
+from lxml import etree
+
+from tom_lt.payload import RTMLPayload
+
+SAMPLE_INTERVAL = 300
+MAX_SAMPLES = 20000
+MARGIN = 1.0
+# the Sun is 12 degrees below the horizon at the end of nautical twilight
+DEFAULT_SUN_ALTITUDE = -12.0
+
+UNIX_EPOCH_JD = 2440587.5
+J2000_JD = 2451545.0
+
+
+def _julian_days_since_j2000(times):
+    return np.asarray(times, dtype=float) / 86400.0 + (UNIX_EPOCH_JD - J2000_JD)
+
+
+def sun_position(times):
+    """Return the RA and Dec (in degrees) of the Sun at ``times`` (seconds since the Unix epoch)."""
+    days = _julian_days_since_j2000(times)
+    mean_longitude = np.radians(280.460 + 0.9856474 * days)
+    anomaly = np.radians(357.528 + 0.9856003 * days)
+    longitude = mean_longitude + np.radians(1.915 * np.sin(anomaly) + 0.020 * np.sin(2 * anomaly))
+    obliquity = np.radians(23.439 - 0.0000004 * days)
+    ra = np.degrees(np.arctan2(np.cos(obliquity) * np.sin(longitude), np.cos(longitude)))
+    dec = np.degrees(np.arcsin(np.sin(obliquity) * np.sin(longitude)))
+    return ra, dec
+
+
+def altitude(ra, dec, times, latitude, longitude):
+    """Return the altitude (in degrees) at ``times`` of the objects at ``ra`` and ``dec`` (degrees).
+
+    The arguments broadcast against each other; ``longitude`` is positive to the east.
+    """
+    days = _julian_days_since_j2000(times)
+    sidereal_time = 280.46061837 + 360.98564736629 * days + longitude
+    hour_angle = np.radians(sidereal_time - ra)
+    latitude, dec = np.radians(latitude), np.radians(dec)
+    sin_altitude = np.sin(latitude) * np.sin(dec) + np.cos(latitude) * np.cos(dec) * np.cos(hour_angle)
+    return np.degrees(np.arcsin(np.clip(sin_altitude, -1, 1)))
+
+
+def airmass_altitude(airmass):
+    """Return the altitude (in degrees) at which the airmass is ``airmass``."""
+    return np.degrees(np.arcsin(1 / np.asarray(airmass, dtype=float)))
+
+
+def observable(ra, dec, start, end, max_airmass, latitude, longitude, sun_altitude=DEFAULT_SUN_ALTITUDE,
+               interval=SAMPLE_INTERVAL):
+    """Decide, in one pass, whether each of a batch of targets can be observed in its window.
+
+    ``ra``, ``dec`` (degrees), ``start``, ``end`` (seconds since the Unix epoch) and ``max_airmass`` are
+    sequences with one value per target. Returns two boolean arrays: whether the target is ever below its
+    maximum airmass during its window, and whether it is at night.
+    """
+    ra, dec, max_airmass = (np.asarray(values, dtype=float)[:, None] for values in (ra, dec, max_airmass))
+    start, end = np.asarray(start, dtype=float)[:, None], np.asarray(end, dtype=float)[:, None]
+    window = np.maximum(end - start, 0)
+    samples = int(min(np.ceil(window.max(initial=0) / interval) + 1, MAX_SAMPLES))
+    # a window too long for MAX_SAMPLES samples is sampled less often
+    step = np.maximum(interval, window / max(samples - 1, 1))
+    times = start + np.arange(samples) * step
+    in_window = times <= end
+
+    high_enough = altitude(ra, dec, times, latitude, longitude) >= airmass_altitude(max_airmass) - MARGIN
+    sun_ra, sun_dec = sun_position(times)
+    night = altitude(sun_ra, sun_dec, times, latitude, longitude) <= sun_altitude + MARGIN
+    high_enough &= in_window
+    return high_enough.any(axis=1), (high_enough & night).any(axis=1)
+
+
+def _seconds(value):
+    try:
+        moment = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError('{0!r} is not a date and time'.format(value)) from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _schedule_fields(schedule):
+    ra = schedule.find('{*}Target/{*}Coordinates/{*}RightAscension')
+    dec = schedule.find('{*}Target/{*}Coordinates/{*}Declination')
+    airmass = schedule.find('{*}AirmassConstraint')
+    start = schedule.find('{*}DateTimeConstraint/{*}DateTimeStart')
+    end = schedule.find('{*}DateTimeConstraint/{*}DateTimeEnd')
+    if ra is None or dec is None or airmass is None or start is None or end is None:
+        return None
+    degrees = dec.findtext('{*}Degrees')
+    sign = -1 if degrees.strip().startswith('-') else 1
+    return (
+        schedule.find('{*}Target').get('name'),
+        15 * (float(ra.findtext('{*}Hours')) + float(ra.findtext('{*}Minutes')) / 60
+              + float(ra.findtext('{*}Seconds')) / 3600),
+        sign * (abs(float(degrees)) + float(dec.findtext('{*}Arcminutes')) / 60
+                + float(dec.findtext('{*}Arcseconds')) / 3600),
+        _seconds(start.get('value')),
+        _seconds(end.get('value')),
+        float(airmass.get('maximum')),
+        start.get('value'),
+        end.get('value'),
+    )
+
+
+def visibility_errors(observation_payloads, site, sun_altitude=DEFAULT_SUN_ALTITUDE):
+    """Return, for each RTML payload, the reasons its Schedules cannot be observed from ``site``.
+
+    ``site`` is an entry of ``LTFacility.SITES``. The Schedules of all the payloads are checked in one
+    pass; a Schedule without sidereal coordinates, an airmass constraint or a time window is not checked.
+    A payload that cannot be read is turned down on its own, without holding up the others.
+    """
+    rows, owners = [], []
+    errors = [[] for _ in observation_payloads]
+    for index, observation_payload in enumerate(observation_payloads):
+        try:
+            rtml = RTMLPayload.of(observation_payload).tree
+            # the Schedules of a payload generally share their target and constraints
+            schedules = list(dict.fromkeys(_schedule_fields(schedule) for schedule in rtml.iterfind('{*}Schedule')))
+        except (etree.XMLSyntaxError, AttributeError, TypeError, ValueError) as e:
+            errors[index].append('The RTML payload cannot be checked for visibility: {0}'.format(e))
+            continue
+        for fields in schedules:
+            if fields is not None:
+                rows.append(fields)
+                owners.append(index)
+    if not rows:
+        return errors
+    names, ra, dec, start, end, max_airmass, start_text, end_text = zip(*rows)
+    high_enough, at_night = observable(ra, dec, start, end, max_airmass, site['latitude'], site['longitude'],
+                                       sun_altitude=sun_altitude)
+    for i, owner in enumerate(owners):
+        if at_night[i]:
+            continue
+        if high_enough[i]:
+            reason = 'only reaches airmass {0} in daylight'.format(max_airmass[i])
+        else:
+            reason = 'never reaches airmass {0}'.format(max_airmass[i])
+        message = '{0} cannot be observed from the Liverpool Telescope between {1} and {2}: it {3}'.format(
+            names[i], start_text[i], end_text[i], reason)
+        if message not in errors[owner]:
+            errors[owner].append(message)
+    return errors